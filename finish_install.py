@@ -6,6 +6,8 @@ from distutils.sysconfig import get_python_lib
 python_lib = get_python_lib()
 if len(sys.argv) > 1 and sys.argv[1] == '--invertible':
     module = 'register_invertible'
+elif len(sys.argv) > 1 and sys.argv[1] == '--static':
+    module = 'register_static'
 else:
     module = 'register'
 
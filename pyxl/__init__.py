@@ -1 +1,3 @@
 #!/usr/bin/env python
+
+__version__ = "1.4"
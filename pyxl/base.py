@@ -7,13 +7,103 @@
 # it's a difficult dependency to fulfill purely to generate random numbers.
 import random
 import sys
+import types
 
 from pyxl.utils import escape
 
 class PyxlException(Exception):
     pass
 
+# Shared placeholders for elements that have no attributes or children yet. Real containers are
+# only allocated when something is added. Neither can be modified in place, so code that forgets
+# to allocate fails loudly instead of changing every element at once.
+_NO_ATTRIBUTES = types.MappingProxyType({})
+_NO_CHILDREN = ()
+
+def _attr_validator(attr_type):
+    """Return a function (element, name, value) -> value that checks a value for an attribute
+    of the given type, and coerces it to that type if needed."""
+    if type(attr_type) == list:
+        # support for enum values in pyxl attributes
+        values_enum = attr_type
+        try:
+            values_set = frozenset(values_enum)
+        except TypeError:
+            values_set = values_enum
+
+        def validate_enum(element, name, value):
+            assert values_enum, 'Invalid attribute definition'
+            try:
+                valid = value in values_set
+            except TypeError:
+                valid = value in values_enum
+            if not valid:
+                msg = '%s: %s: incorrect value "%s" for "%s". Expecting enum value %s' % (
+                    element.__tag__, element.__class__.__name__, value, name, values_enum)
+                raise PyxlException(msg)
+            return value
+
+        return validate_enum
+
+    def validate_type(element, name, value):
+        try:
+            # Validate type of attr and cast to correct type if possible
+            return value if isinstance(value, attr_type) else attr_type(value)
+        except Exception:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            msg = '%s: %s: incorrect type for "%s". expected %s, got %s' % (
+                element.__tag__, element.__class__.__name__, name, attr_type, type(value))
+            exception = PyxlException(msg)
+            raise exception.with_traceback(exc_tb)
+
+    return validate_type
+
+# data-* and aria-* attributes are allowed on every element, as strings.
+_validate_str = _attr_validator(str)
+
+# Cache of _fix_attribute_name results for the keyword arguments passed to constructors.
+_fixed_attribute_names = {}
+
+# The methods that x_base._new stands in for, and whether each class can be constructed by it
+# (see _constructs_directly).
+_CONSTRUCTION_METHODS = ('__init__', '__call__', 'append_children', 'append', 'set_attr')
+_direct_construction = {}
+
+# The modules whose overrides of the construction methods _new knows about: x_element's __init__
+# only clears its render cache, and the append of pyxl.html's void elements only rejects children,
+# which _new does too (see x_base._allows_children).
+_CONSTRUCTION_MODULES = ('pyxl.base', 'pyxl.element', 'pyxl.html')
+
+def _constructs_directly(cls):
+    """Return true if none of the construction methods of cls are overridden, other than by
+    pyxl's own classes."""
+    for name in _CONSTRUCTION_METHODS:
+        for klass in cls.__mro__:
+            if name in klass.__dict__:
+                if klass.__module__ not in _CONSTRUCTION_MODULES:
+                    return False
+                break
+    return True
+
+def _attribute_kwarg(name):
+    """The inverse of x_base._fix_attribute_name."""
+    if name == 'class': return 'xclass'
+    if name == 'for': return 'xfor'
+    return name.replace('-', '_').replace(':', 'COLON')
+
+# The modules of pyxl that define elements (see x_base_metaclass.__new__).
+_SLOTTED_MODULES = frozenset(['pyxl.base', 'pyxl.element', 'pyxl.html', 'pyxl.rss',
+                              'pyxl.browser_hacks'])
+
 class x_base_metaclass(type):
+    def __new__(mcs, name, parents, attrs):
+        # The elements defined by pyxl itself have no per-instance state besides their
+        # attributes and children, so don't give their instances a __dict__. Classes defined
+        # elsewhere get one as usual, unless they declare __slots__ themselves.
+        if '__slots__' not in attrs and attrs.get('__module__') in _SLOTTED_MODULES:
+            attrs['__slots__'] = ()
+        return super(x_base_metaclass, mcs).__new__(mcs, name, parents, attrs)
+
     def __init__(self, name, parents, attrs):
         super(x_base_metaclass, self).__init__(name, parents, attrs)
         x_base_parents = [parent for parent in parents if hasattr(parent, '__attrs__')]
@@ -30,8 +120,18 @@ class x_base_metaclass(type):
         setattr(self, '__attrs__', combined_attrs)
         setattr(self, '__tag__', name[2:])
 
+        # Precompile a validator for each attribute, so set_attr doesn't have to inspect the
+        # attribute's type on every call.
+        setattr(self, '__validators__', {attr_name: _attr_validator(attr_type)
+                                         for attr_name, attr_type in combined_attrs.items()})
+
 class x_base(object, metaclass=x_base_metaclass):
 
+    __slots__ = ('__attributes__', '__children__')
+
+    # False for elements whose append rejects every child
+    _allows_children = True
+
     __attrs__ = {
         # HTML attributes
         'accesskey': str,
@@ -80,16 +180,83 @@ class x_base(object, metaclass=x_base_metaclass):
         }
 
     def __init__(self, **kwargs):
-        self.__attributes__ = {}
-        self.__children__ = []
+        self.__attributes__ = _NO_ATTRIBUTES
+        self.__children__ = _NO_CHILDREN
 
         for name, value in kwargs.items():
-            self.set_attr(x_base._fix_attribute_name(name), value)
+            fixed_name = _fixed_attribute_names.get(name)
+            if fixed_name is None:
+                fixed_name = x_base._fix_attribute_name(name)
+                # don't let attribute names built at runtime grow the cache forever
+                if len(_fixed_attribute_names) < 10000:
+                    _fixed_attribute_names[name] = fixed_name
+            self.set_attr(fixed_name, value)
 
     def __call__(self, *children):
         self.append_children(children)
         return self
 
+    @classmethod
+    def _new(cls, attrs, children, dynamic=None):
+        """Construct an element, for the code generated by the pyxl transform.
+
+        This is cls(**kwargs)(*children), except that attrs maps attribute names as they appear
+        in the HTML (class rather than xclass) to values, and that children may be a list of
+        children that are known to be neither None nor iterable, which is used as is. If dynamic
+        isn't None, only the attributes it names are validated: the others were validated by a
+        trusted mode transform. Classes that customize construction are constructed the regular
+        way.
+        """
+        direct = _direct_construction.get(cls)
+        if direct is None:
+            direct = _direct_construction[cls] = _constructs_directly(cls)
+        if not direct:
+            kwargs = {_attribute_kwarg(name): value for name, value in attrs.items()}
+            return cls(**kwargs)(*children)
+
+        self = object.__new__(cls)
+        if cls.__init__ is x_base.__init__:
+            self.__attributes__ = _NO_ATTRIBUTES
+            self.__children__ = _NO_CHILDREN
+        else:
+            self.__init__()
+
+        if attrs and dynamic is not None and not dynamic:
+            self.__attributes__ = attrs
+        elif attrs:
+            # the same as set_attr, for the attributes of the class
+            validators = cls.__validators__
+            attributes = self.__attributes__ = {}
+            for name, value in attrs.items():
+                if dynamic is not None and name not in dynamic:
+                    attributes[name] = value
+                    continue
+                validate = validators.get(name)
+                if validate is None:
+                    self.set_attr(name, value)
+                elif value is not None:
+                    attributes[name] = validate(self, name, value)
+
+        if children and not cls._allows_children:
+            # raises, like cls(**kwargs)(*children) would
+            self.append(children[0])
+        if type(children) is list:
+            if children:
+                self.__children__ = children
+        elif children:
+            # the same as append
+            flat = []
+            for child in children:
+                if isinstance(child, str):
+                    flat.append(child)
+                elif type(child) in (list, tuple) or hasattr(type(child), '__iter__'):
+                    flat.extend(c for c in child if c is not None and c is not False)
+                elif child is not None and child is not False:
+                    flat.append(child)
+            if flat:
+                self.__children__ = flat
+        return self
+
     def get_id(self):
         eid = self.attr('id')
         if not eid:
@@ -97,9 +264,21 @@ class x_base(object, metaclass=x_base_metaclass):
             self.set_attr('id', eid)
         return eid
 
+    def _mutable_attributes(self):
+        attributes = self.__attributes__
+        if attributes is _NO_ATTRIBUTES:
+            attributes = self.__attributes__ = {}
+        return attributes
+
+    def _mutable_children(self):
+        children = self.__children__
+        if children is _NO_CHILDREN:
+            children = self.__children__ = []
+        return children
+
     def children(self, selector=None, exclude=False):
         if not selector:
-            return self.__children__
+            return self._mutable_children()
 
         # filter by class
         if selector[0] == '.':
@@ -121,14 +300,20 @@ class x_base(object, metaclass=x_base_metaclass):
         return list(filter(func, self.__children__))
 
     def append(self, child):
-        if type(child) in (list, tuple) or hasattr(child, '__iter__'):
-            self.__children__.extend(c for c in child if c is not None and c is not False)
+        # Strings are iterable too, but must stay whole: a SafeString split into characters
+        # would be escaped.
+        # Iteration looks __iter__ up on the type, and looking it up on an element would go
+        # through __getattr__.
+        if type(child) in (list, tuple) or (
+                not isinstance(child, str) and hasattr(type(child), '__iter__')):
+            self._mutable_children().extend(
+                c for c in child if c is not None and c is not False)
         elif child is not None and child is not False:
-            self.__children__.append(child)
+            self._mutable_children().append(child)
 
     def prepend(self, child):
         if child is not None and child is not False:
-            self.__children__.insert(0, child)
+            self._mutable_children().insert(0, child)
 
     def __getattr__(self, name):
         if len(name) > 4 and name.startswith('__') and name.endswith('__'):
@@ -137,15 +322,13 @@ class x_base(object, metaclass=x_base_metaclass):
         return self.attr(name.replace('_', '-'))
 
     def attr(self, name, default=None):
-        # this check is fairly expensive (~8% of cost)
-        if not self.allows_attribute(name):
-            raise PyxlException('<%s> has no attr named "%s"' % (self.__tag__, name))
-
         value = self.__attributes__.get(name)
-
         if value is not None:
             return value
 
+        if not self.allows_attribute(name):
+            raise PyxlException('<%s> has no attr named "%s"' % (self.__tag__, name))
+
         attr_type = self.__attrs__.get(name, str)
         if type(attr_type) == list:
             if not attr_type:
@@ -164,35 +347,22 @@ class x_base(object, metaclass=x_base_metaclass):
                 element.set_attr(name, value)
 
     def set_attr(self, name, value):
-        # this check is fairly expensive (~8% of cost)
-        if not self.allows_attribute(name):
-            raise PyxlException('<%s> has no attr named "%s"' % (self.__tag__, name))
+        validate = self.__validators__.get(name)
+        if validate is None:
+            if name in self.__attrs__:
+                # __attrs__ was changed after the class was created
+                validate = self.__validators__[name] = _attr_validator(self.__attrs__[name])
+            elif name.startswith(('data-', 'aria-')):
+                validate = _validate_str
+            else:
+                raise PyxlException('<%s> has no attr named "%s"' % (self.__tag__, name))
 
         if value is not None:
-            attr_type = self.__attrs__.get(name, str)
-
-            if type(attr_type) == list:
-                # support for enum values in pyxl attributes
-                values_enum = attr_type
-                assert values_enum, 'Invalid attribute definition'
-
-                if value not in values_enum:
-                    msg = '%s: %s: incorrect value "%s" for "%s". Expecting enum value %s' % (
-                        self.__tag__, self.__class__.__name__, value, name, values_enum)
-                    raise PyxlException(msg)
-
-            else:
-                try:
-                    # Validate type of attr and cast to correct type if possible
-                    value = value if isinstance(value, attr_type) else attr_type(value)
-                except Exception:
-                    exc_type, exc_obj, exc_tb = sys.exc_info()
-                    msg = '%s: %s: incorrect type for "%s". expected %s, got %s' % (
-                        self.__tag__, self.__class__.__name__, name, attr_type, type(value))
-                    exception = PyxlException(msg)
-                    raise exception.with_traceback(exc_tb)
-
-            self.__attributes__[name] = value
+            value = validate(self, name, value)
+            attributes = self.__attributes__
+            if attributes is _NO_ATTRIBUTES:
+                attributes = self.__attributes__ = {}
+            attributes[name] = value
 
         elif name in self.__attributes__:
             del self.__attributes__[name]
@@ -212,14 +382,14 @@ class x_base(object, metaclass=x_base_metaclass):
             self.append(child)
 
     def attributes(self):
-        return self.__attributes__
+        return self._mutable_attributes()
 
     def set_attributes(self, attrs_dict):
         for name, value in attrs_dict.items():
             self.set_attr(name, value)
 
     def allows_attribute(self, name):
-        return (name in self.__attrs__ or name.startswith('data-') or name.startswith('aria-'))
+        return name in self.__attrs__ or name.startswith(('data-', 'aria-'))
 
     def to_string(self):
         l = []
@@ -229,17 +399,56 @@ class x_base(object, metaclass=x_base_metaclass):
     def _to_list(self, l):
         raise NotImplementedError()
 
+    def iter_render(self, chunk_size=8192):
+        """Render this element incrementally, as a generator of strings.
+
+        Rendered fragments are buffered until they add up to at least chunk_size characters, and
+        then joined and yielded, so the whole page never has to be in memory at once. The result
+        can be returned from a WSGI app once encoded, e.g. (s.encode('utf-8') for s in ...).
+        """
+        l = []
+        size = checked = 0
+        for _ in self._iter_to_list(l):
+            for i in range(checked, len(l)):
+                size += len(l[i])
+            checked = len(l)
+            if size >= chunk_size:
+                yield ''.join(l)
+                del l[:]
+                size = checked = 0
+        if l:
+            yield ''.join(l)
+
+    def _iter_to_list(self, l):
+        """Like _to_list, but a generator that yields whenever what's in l may be flushed.
+
+        Elements that don't override this are rendered all at once.
+        """
+        self._to_list(l)
+        yield
+
     def __str__(self):
         return self.to_string()
 
     def __unicode__(self):
         return self.to_string()
 
+    def __html__(self):
+        return self.to_string()
+
     @staticmethod
     def _render_child_to_list(child, l):
         if isinstance(child, x_base): child._to_list(l)
         elif child is not None: l.append(escape(child))
 
+    @staticmethod
+    def _iter_child_to_list(child, l):
+        if isinstance(child, x_base):
+            yield from child._iter_to_list(l)
+        elif child is not None:
+            l.append(escape(child))
+            yield
+
     @staticmethod
     def _fix_attribute_name(name):
         if name == 'xclass': return 'class'
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+Generator of synthetic pyxl sources for the benchmarks.
+
+The generated modules are made of render functions that each return a tree of html elements.
+They're valid pyxl, and only use elements and attributes that pyxl.html accepts, so they can
+be transformed, compiled and rendered.
+"""
+
+import random
+
+# tag -> tags allowed as its children
+_CHILDREN = {
+    'div': ('div', 'p', 'ul', 'span', 'a'),
+    'p': ('span', 'a', 'b'),
+    'ul': ('li',),
+    'li': ('div', 'span', 'a'),
+    'span': ('span', 'b'),
+    'a': ('span', 'b'),
+    'b': ('span',),
+}
+
+_ATTRS = ('class', 'id', 'title', 'style', 'lang', 'dir')
+
+_WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit')
+
+
+def generate(size=50, depth=4, attrs=2, curlies=0.3, ifs=0.1, seed=0):
+    """Return the source of a pyxl module.
+
+    size: number of render functions in the module.
+    depth: nesting depth of the element tree each function returns.
+    attrs: number of attributes on each element.
+    curlies: probability (0-1) that a text node or attribute value is a {python} expression.
+    ifs: probability (0-1) that an element is wrapped in an <if>/<else> pair.
+    """
+    rng = random.Random(seed)
+    lines = ['# coding: pyxl', 'from pyxl import html', '']
+    for i in range(size):
+        lines.append('def render_%d(items, flag):' % i)
+        lines.append('    return (')
+        _element(rng, lines, 'div', depth, 2, attrs, curlies, ifs)
+        lines.append('    )')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _value(rng, curlies, quote):
+    if rng.random() < curlies:
+        return '{items[%d]}' % rng.randrange(10)
+    text = ' '.join(rng.choice(_WORDS) for _ in range(rng.randrange(1, 4)))
+    return '"%s"' % text if quote else text
+
+
+def _element(rng, lines, tag, depth, indent, attrs, curlies, ifs):
+    pad = '    ' * indent
+    wrap = indent > 2 and rng.random() < ifs
+    if wrap:
+        lines.append('%s<if cond="{flag}">' % pad)
+        indent += 1
+        pad = '    ' * indent
+
+    attributes = ''.join(' %s=%s' % (_ATTRS[j] if j < len(_ATTRS) else 'data-a%d' % j,
+                                     _value(rng, curlies, True))
+                         for j in range(attrs))
+    if depth <= 1:
+        lines.append('%s<%s%s>%s</%s>' % (pad, tag, attributes, _value(rng, curlies, False), tag))
+    else:
+        lines.append('%s<%s%s>' % (pad, tag, attributes))
+        for _ in range(2):
+            _element(rng, lines, rng.choice(_CHILDREN[tag]), depth - 1, indent + 1, attrs,
+                     curlies, ifs)
+        lines.append('%s</%s>' % (pad, tag))
+
+    if wrap:
+        pad = '    ' * (indent - 1)
+        lines.append('%s</if>' % pad)
+        lines.append('%s<else><span>%s</span></else>' % (pad, _value(rng, curlies, False)))
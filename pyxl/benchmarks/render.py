@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of rendering pyxl element trees.
+
+Each workload builds a tree the way transformed pyxl code does and renders it to a string. Timings
+are taken pyperf-style: the number of loops per sample is calibrated so that a sample takes at
+least --min-time, every worker process runs a warmup sample before its timed ones, and the samples
+of several worker processes are pooled so that the spread includes process-level noise (hash
+randomization, memory layout). Memory is measured separately with tracemalloc.
+
+    python -m pyxl.benchmarks.render -o baseline.json
+    python -m pyxl.benchmarks.render --baseline baseline.json
+
+Usage:
+    python -m pyxl.benchmarks.render [-p PROCESSES] [-n SAMPLES] [--min-time SECONDS]
+                                     [-w WORKLOAD] [-o OUTPUT] [--baseline BASELINE]
+                                     [--threshold THRESHOLD]
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import gc
+import json
+import multiprocessing
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pyxl
+from pyxl import html, rss
+from pyxl.benchmarks.transform import compare
+from pyxl.codec.transform import pyxl_transform_string
+from pyxl.element import x_element
+
+
+# The workloads are written in pyxl and transformed when this module is imported, so that they
+# build their trees with the same calls as transformed code (x_tag._new for pyxl.html elements).
+_WORKLOADS_SOURCE = """
+def deep_tree(depth=200):
+    node = <span>leaf</span>
+    for i in range(depth):
+        node = <div class="level">{node}</div>
+    return node
+
+
+def wide_list(items=1000):
+    return <ul class="list">{[<li id="item-{i}">item {i}</li> for i in range(items)]}</ul>
+
+
+def table(rows=100, columns=10):
+    return (
+        <table class="grid">
+            <thead><tr>{[<th>col {c}</th> for c in range(columns)]}</tr></thead>
+            <tbody>{[<tr class="{'odd' if r % 2 else 'even'}">
+                         {[<td>{r * columns + c}</td> for c in range(columns)]}
+                     </tr>
+                     for r in range(rows)]}</tbody>
+        </table>)
+
+
+def attributes(elements=500):
+    return <div>{[<a href="/item/{i}" title="Item #{i}" id="a{i}" class="link"
+                     style="color: red" target="_blank" rel="nofollow" lang="en"
+                     data-index="{i}" aria-label="item" />
+                  for i in range(elements)]}</div>
+
+
+class x_card(x_element):
+    __attrs__ = {'title': str}
+
+    def render(self):
+        return <div class="card"><h2>{self.attr('title')}</h2>{self.children()}</div>
+
+
+class x_panel(x_element):
+    __attrs__ = {'title': str}
+
+    def render(self):
+        return <card title="{self.attr('title')}" class="panel">{self.children()}</card>
+
+
+class x_widget(x_element):
+    __attrs__ = {'title': str}
+
+    def render(self):
+        return <panel title="{self.attr('title')}" class="widget"><p>{self.children()}</p></panel>
+
+
+def components(count=200):
+    return <div>{[<widget title="Widget {i}" class="w{i % 5}">body {i}</widget>
+                  for i in range(count)]}</div>
+
+
+def rss_feed(items=100):
+    date = datetime.datetime(2020, 1, 1)
+    return (
+        <frag>
+            <rss.rss_decl_standalone />
+            <rss.rss version="2.0" uses-dublin-core="{True}">
+                <rss.channel>
+                    <rss.title>Feed</rss.title>
+                    <rss.link>http://example.com/</rss.link>
+                    <rss.description>{'A feed & its <items>'}</rss.description>
+                    <rss.lastBuildDate date="{date}" />
+                    {[<rss.item>
+                          <rss.title>Item {i}</rss.title>
+                          <rss.link>http://example.com/{i}</rss.link>
+                          <rss.guid is-perma-link="{True}">http://example.com/{i}</rss.guid>
+                          <rss.creator>Author</rss.creator>
+                          <rss.pubDate date="{date}" />
+                          <rss.description>{'Description of <b>item</b> %d & more' % i}</rss.description>
+                      </rss.item>
+                      for i in range(items)]}
+                </rss.channel>
+            </rss.rss>
+        </frag>)
+
+
+def escaping():
+    return (
+        <div title="{_TEXT[:1000]}">
+            <p>{_TEXT}</p>
+            <p>{_TEXT.replace('&', '')}</p>
+        </div>)
+"""
+
+_TEXT = 'Some "quoted" text with <tags> & ampersands, and \'apostrophes\'. ' * 2000
+
+exec(compile(pyxl_transform_string(_WORKLOADS_SOURCE), __file__, 'exec'))
+
+
+# name -> function building the tree; a workload's operation is building and rendering it
+WORKLOADS = {
+    'deep_tree': deep_tree,
+    'wide_list': wide_list,
+    'table': table,
+    'attributes': attributes,
+    'components': components,
+    'rss': rss_feed,
+    'escaping': escaping,
+}
+
+
+def _op(build):
+    return build().to_string()
+
+
+def _calibrate(build, min_time):
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            _op(build)
+        if time.perf_counter() - start >= min_time:
+            return loops
+        loops *= 2
+
+
+def _maxrss():
+    """The peak RSS of this process, in kilobytes on linux and bytes on macOS, or None where the
+    resource module doesn't exist (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _worker(name, samples, loops):
+    """Run a warmup sample, then return samples timings per loop and the peak RSS of the process.
+    Runs in a worker process."""
+    build = WORKLOADS[name]
+    timings = []
+    for i in range(samples + 1):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(loops):
+            _op(build)
+        if i:
+            timings.append((time.perf_counter() - start) / loops)
+    return timings, _maxrss()
+
+
+def _memory(build):
+    """Return the tracemalloc peak and net memory allocated by one operation, in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = _op(build)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - before, current - before
+
+
+def run_workload(name, processes=3, samples=5, min_time=0.1):
+    """Benchmark one workload; return {'render': summary} like the transform benchmark."""
+    build = WORKLOADS[name]
+    _op(build)
+    loops = _calibrate(build, min_time)
+
+    timings = []
+    maxrss = []
+    if processes:
+        context = multiprocessing.get_context('spawn')
+        for _ in range(processes):
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+                worker_timings, worker_maxrss = executor.submit(
+                    _worker, name, samples, loops).result()
+            timings.extend(worker_timings)
+            maxrss.append(worker_maxrss)
+    else:
+        timings, worker_maxrss = _worker(name, samples, loops)
+        maxrss.append(worker_maxrss)
+
+    peak, net = _memory(build)
+    median = statistics.median(timings)
+    return {'render': {
+        'min': min(timings),
+        'median': median,
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'ops_per_sec': 1 / median,
+        'loops': loops,
+        'samples': len(timings),
+        'tracemalloc_peak': peak,
+        'tracemalloc_net': net,
+        # the largest peak RSS of the processes that rendered it (see _maxrss)
+        'maxrss': None if None in maxrss else max(maxrss),
+    }}
+
+
+def run(processes=3, samples=5, min_time=0.1, workloads=None, log=None):
+    """Run the workloads (all by default), and return the results as a JSON-serializable dict."""
+    results = {}
+    for name in workloads or sorted(WORKLOADS):
+        if log:
+            print('%s...' % name, file=log)
+        results[name] = run_workload(name, processes, samples, min_time)
+    return {
+        'meta': {
+            'pyxl': pyxl.__version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processes': processes,
+            'samples': samples,
+        },
+        'results': results,
+    }
+
+
+def _print_results(results, out):
+    print('%-12s %12s %12s %8s %12s %12s' % (
+        'workload', 'ops/sec', 'mean (ms)', 'stdev', 'peak (KiB)', 'net (KiB)'), file=out)
+    for name, stages in sorted(results['results'].items()):
+        summary = stages['render']
+        print('%-12s %12.1f %12.3f %7.1f%% %12.1f %12.1f' % (
+            name, summary['ops_per_sec'], summary['mean'] * 1000,
+            100 * summary['stdev'] / summary['mean'], summary['tracemalloc_peak'] / 1024,
+            summary['tracemalloc_net'] / 1024), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark rendering pyxl element trees.')
+    parser.add_argument('-p', '--processes', type=int, default=3,
+                        help='number of worker processes per workload, 0 to run in-process '
+                             '(default: 3)')
+    parser.add_argument('-n', '--samples', type=int, default=5,
+                        help='number of timed samples per process (default: 5)')
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='minimum duration of a sample in seconds (default: 0.1)')
+    parser.add_argument('-w', '--workload', dest='workloads', action='append',
+                        choices=sorted(WORKLOADS), help='only run this workload (repeatable)')
+    parser.add_argument('-o', '--output', default=None, help='write the results to this file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare against the results in this file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown relative to the baseline that counts as a regression '
+                             '(default: 0.1, for 10%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args.processes, args.samples, args.min_time, args.workloads, log=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    _print_results(results, sys.stdout)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = [row for row in compare(results, baseline, args.threshold) if row[3]]
+        for name, _, ratio, _ in regressions:
+            print('REGRESSION %s: %.2fx slower' % (name, ratio), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
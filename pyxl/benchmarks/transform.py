@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the pyxl source transform.
+
+Times each stage of the pipeline, in each mode, over a matrix of generated sources (see
+pyxl.benchmarks.corpus) and over the pyxl files in a fixtures directory (tests/ by default).
+Results are written as JSON, and can be compared against a baseline from an earlier run:
+
+    python -m pyxl.benchmarks.transform -o baseline.json
+    ... upgrade pyxl ...
+    python -m pyxl.benchmarks.transform --baseline baseline.json
+
+The exit status is 1 if any stage got slower than the baseline by more than --threshold.
+
+Usage:
+    python -m pyxl.benchmarks.transform [-r REPEAT] [--quick] [--fixtures DIR] [-o OUTPUT]
+                                        [--baseline BASELINE] [--threshold THRESHOLD]
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import pyxl
+from pyxl.benchmarks.corpus import generate
+from pyxl.codec import pytokenize
+from pyxl.codec.tokenizer import pyxl_tokenize, pyxl_untokenize
+from pyxl.codec.transform import pyxl_invert_string, pyxl_transform_string
+
+# The generated cases vary one parameter at a time from these defaults.
+DEFAULTS = dict(size=20, depth=4, attrs=2, curlies=0.3, ifs=0.1)
+VARIATIONS = [
+    ('size', (5, 80)),
+    ('depth', (2, 6)),
+    ('attrs', (0, 8)),
+    ('curlies', (0.0, 1.0)),
+    ('ifs', (0.0, 0.5)),
+]
+QUICK_DEFAULTS = dict(size=5, depth=3, attrs=2, curlies=0.3, ifs=0.1)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'tests')
+
+
+def _python_tokenize(source, output, invertible_output):
+    # the vendored tokenizer alone, over the transformed source, as a reference point
+    return list(pytokenize.generate_tokens(io.StringIO(output).readline))
+
+
+def _pyxl_tokenize(source, output, invertible_output):
+    return list(pyxl_tokenize(io.StringIO(source).readline))
+
+
+def _transform(source, output, invertible_output):
+    return pyxl_transform_string(source)
+
+
+def _transform_invertible(source, output, invertible_output):
+    return pyxl_transform_string(source, invertible=True)
+
+
+def _transform_static(source, output, invertible_output):
+    return pyxl_transform_string(source, static_html=True)
+
+
+def _invert(source, output, invertible_output):
+    return pyxl_invert_string(invertible_output)
+
+
+def _compile(source, output, invertible_output):
+    return compile(output, '<benchmark>', 'exec')
+
+
+# (name, function); every function takes (source, output, invertible_output)
+STAGES = [
+    ('python_tokenize', _python_tokenize),
+    ('pyxl_tokenize', _pyxl_tokenize),
+    ('untokenize', None),  # timed separately, it needs the tokens as input
+    ('transform', _transform),
+    ('transform_invertible', _transform_invertible),
+    ('transform_static', _transform_static),
+    ('invert', _invert),
+    ('compile', _compile),
+]
+
+
+def cases(quick=False, fixtures=FIXTURES):
+    """Yield (name, [sources]) pairs to benchmark."""
+    defaults = QUICK_DEFAULTS if quick else DEFAULTS
+    yield 'default', [generate(**defaults)]
+    if not quick:
+        for param, values in VARIATIONS:
+            for value in values:
+                params = dict(defaults, **{param: value})
+                yield '%s=%s' % (param, value), [generate(**params)]
+
+    if fixtures and os.path.isdir(fixtures):
+        sources = []
+        for path in sorted(glob.glob(os.path.join(fixtures, '*.py'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            if source.startswith('# coding: pyxl'):
+                sources.append(source)
+        if sources:
+            yield 'fixtures', sources
+
+
+def _time(func, args_list, repeat):
+    """Return a list of repeat timings of calling func on every args tuple in args_list."""
+    for args in args_list:  # warm up
+        func(*args)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in args_list:
+            func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summarize(timings, chars):
+    median = statistics.median(timings)
+    return {
+        'min': min(timings),
+        'median': median,
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'chars_per_sec': chars / median if median else None,
+    }
+
+
+def run_case(sources, repeat=5):
+    """Time every stage over sources; return {stage: summary}."""
+    outputs = [pyxl_transform_string(source) for source in sources]
+    invertibles = [pyxl_transform_string(source, invertible=True) for source in sources]
+    args_list = list(zip(sources, outputs, invertibles))
+    chars = sum(len(source) for source in sources)
+
+    results = {}
+    for name, func in STAGES:
+        if name == 'untokenize':
+            token_lists = [(_pyxl_tokenize(*args),) for args in args_list]
+            timings = _time(pyxl_untokenize, token_lists, repeat)
+        else:
+            timings = _time(func, args_list, repeat)
+        results[name] = _summarize(timings, chars)
+    results['chars'] = chars
+    return results
+
+
+def run(repeat=5, quick=False, fixtures=FIXTURES, log=None):
+    """Run all the cases, and return the results as a JSON-serializable dict."""
+    results = {}
+    for name, sources in cases(quick, fixtures):
+        if log:
+            print('%s...' % name, file=log)
+        results[name] = run_case(sources, repeat)
+    return {
+        'meta': {
+            'pyxl': pyxl.__version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """Compare median timings against a baseline.
+
+    Returns a list of (case, stage, ratio, regressed) tuples, where ratio is new/old and regressed
+    is true if ratio is above 1 + threshold. Cases and stages missing from either side are skipped.
+    """
+    comparison = []
+    for case, stages in sorted(results['results'].items()):
+        old_stages = baseline['results'].get(case)
+        if old_stages is None:
+            continue
+        for stage, summary in sorted(stages.items()):
+            old = old_stages.get(stage)
+            if not isinstance(summary, dict) or not isinstance(old, dict) or not old['median']:
+                continue
+            ratio = summary['median'] / old['median']
+            comparison.append((case, stage, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def _print_results(results, out):
+    print('%-24s %-22s %12s %10s %14s' % ('case', 'stage', 'median (ms)', 'stdev', 'chars/s'),
+          file=out)
+    for case, stages in sorted(results['results'].items()):
+        for stage, summary in sorted(stages.items()):
+            if isinstance(summary, dict):
+                print('%-24s %-22s %12.3f %9.1f%% %14.0f' % (
+                    case, stage, summary['median'] * 1000,
+                    100 * summary['stdev'] / summary['mean'] if summary['mean'] else 0,
+                    summary['chars_per_sec'] or 0), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pyxl source transform.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of timed runs of each stage (default: 5)')
+    parser.add_argument('--quick', action='store_true',
+                        help='only run a small generated case and the fixtures')
+    parser.add_argument('--fixtures', default=FIXTURES,
+                        help='directory of pyxl files to benchmark as well (default: tests/)')
+    parser.add_argument('-o', '--output', default=None, help='write the results to this file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare against the results in this file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown relative to the baseline that counts as a regression '
+                             '(default: 0.1, for 10%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.quick, args.fixtures, log=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    _print_results(results, sys.stdout)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = [row for row in compare(results, baseline, args.threshold) if row[3]]
+        for case, stage, ratio, _ in regressions:
+            print('REGRESSION %s %s: %.2fx slower' % (case, stage, ratio), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,7 @@
 #!/usr/bin/env python
+
+# The version of the code generated by the transform. The transform cache, the bytecode cache of
+# the import hook and the manifest of the build script are keyed on it as well as on the pyxl
+# version, so it must be bumped by every change to the generated code (tests/test_codegen_version.py
+# fails until it is).
+CODEGEN_VERSION = 1
@@ -0,0 +1,139 @@
+"""
+A persistent, content-addressed cache for the output of the pyxl transform.
+
+Entries are keyed by a hash of the source and of everything else that affects the output (the
+transform options, the pyxl version and pyxl.codec.CODEGEN_VERSION), so they never need to be
+invalidated; old entries are simply evicted, least recently used first, once the cache grows past
+its size limit.
+
+The cache used by the codec is configured with environment variables:
+
+    PYXL_CACHE_DIR   directory to keep the cache in. If unset, nothing is cached.
+    PYXL_CACHE_SIZE  maximum size of the cache in bytes (default 64MB).
+"""
+
+import hashlib
+import os
+import tempfile
+
+import pyxl
+from pyxl.codec import CODEGEN_VERSION
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class TransformCache(object):
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None  # total size of the entries, computed lazily
+
+    def key(self, source, invertible=False, str_function='str', static_html=False,
+            trusted=False):
+        h = hashlib.sha256()
+        h.update(repr((pyxl.__version__, CODEGEN_VERSION, invertible, str_function, static_html,
+                       trusted)).encode('utf-8'))
+        h.update(b'\0')
+        h.update(source.encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.py')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                output = f.read()
+        except OSError:
+            return None
+        # entries are evicted by age, so mark this one as recently used. This fails on a cache
+        # shared read-only, which is still a hit.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return output
+
+    def put(self, key, output):
+        """Atomically store output under key. Failures are ignored: the cache is best effort."""
+        path = self._path(key)
+        data = output.encode('utf-8')
+        try:
+            old_size = os.stat(path).st_size
+        except OSError:
+            old_size = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            return
+
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self._entries())
+        else:
+            self.size += len(data) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every entry in the cache."""
+        try:
+            subdirs = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith('.py'):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def evict(self):
+        """Delete least recently used entries until the cache is at most 3/4 of its max size."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        target = self.max_size * 3 // 4
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            size -= entry_size
+        self.size = size
+
+    def clear(self):
+        for path, _, _ in list(self._entries()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self.size = 0
+
+
+_default_cache = None
+_default_cache_loaded = False
+
+def get_default_cache():
+    """Return the cache configured by the environment, or None if caching is disabled."""
+    global _default_cache, _default_cache_loaded
+    if not _default_cache_loaded:
+        directory = os.environ.get('PYXL_CACHE_DIR')
+        if directory:
+            max_size = int(os.environ.get('PYXL_CACHE_SIZE', DEFAULT_MAX_SIZE))
+            _default_cache = TransformCache(directory, max_size)
+        _default_cache_loaded = True
+    return _default_cache
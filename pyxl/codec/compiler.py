@@ -0,0 +1,311 @@
+"""
+Compile pyxl source to a python AST with the exact locations of the original source.
+
+    import pyxl.codec.compiler
+    tree = pyxl.codec.compiler.pyxl_parse(source, filename)
+    code = pyxl.codec.compiler.pyxl_compile(source, filename)
+
+The transformed source keeps line numbers, but shifts everything that follows a pyxl block on the
+same line, and the {} expressions inside pyxl end up wherever the code generated for the block
+puts them. The compiler parses the transformed source once, like the regular import path, while
+keeping track of where the transform put each block and each of their python fragments. The nodes
+on the lines of pyxl blocks are then moved back: python nodes to their exact line and column in
+the source, and nodes made from markup to the lines of the markup they came from.
+"""
+
+import ast
+import bisect
+import io
+
+from .pytokenize import COMMENT, NL, STRING, Untokenizer
+from .tokenizer import RewindableTokenStream, cleanup_tokens, transform_tokens
+
+
+# the nodes that code generated from markup can contain that have a location
+_LOCATED = (ast.expr, ast.keyword)
+
+
+class _Layout(object):
+    """Where the transform put the text of a list of python tokens: the whole module, or a python
+    fragment of a pyxl block.
+
+    The tokens are untokenized from start, in the source, to out, in the transformed source. Like
+    the transform, the layout keeps the line count of pyxl blocks, so lines map one to one, and
+    only the pyxl blocks of the tokens change columns: the rest of their line is shifted by the
+    difference in length between the block and its code.
+    """
+
+    def __init__(self, compiler, tokens, start, out):
+        self.compiler = compiler
+        self.row, self.col = start
+        self.out_row, self.out_col = out
+        self.blocks = []
+        # source row -> [(source column where a block ends, transformed column where it ends)]
+        self.block_ends = {}
+        for token in tokens:
+            if token[0] == STRING and token[2] in compiler.fragments:
+                self.blocks.append(_Block(self, token))
+        self.block_starts = [block.out_start for block in self.blocks]
+
+    def out_pos(self, row, col):
+        """The position in the transformed source of a position in the source."""
+        out_row = self.out_row + row - self.row
+        for end, out_end in reversed(self.block_ends.get(row, ())):
+            if end <= col:
+                return out_row, out_end + col - end
+        return out_row, col + (self.out_col - self.col if row == self.row else 0)
+
+    def block_at(self, pos, end=False):
+        """The block whose code contains a position in the transformed source, if any. If end is
+        true, pos is the end of a node rather than its start."""
+        i = (bisect.bisect_left if end else bisect.bisect_right)(self.block_starts, pos) - 1
+        if i >= 0:
+            block = self.blocks[i]
+            if pos < block.out_end or (end and pos == block.out_end):
+                return block
+        return None
+
+    def source_pos(self, pos, end=False):
+        """The position in the source of a position in the transformed source (with columns in
+        characters)."""
+        block = self.block_at(pos, end)
+        if block is not None:
+            return block.source_pos(pos, end)
+        out_row, out_col = pos
+        row = self.row + out_row - self.out_row
+        for block_end, out_end in reversed(self.block_ends.get(row, ())):
+            if out_end <= out_col:
+                return row, block_end + out_col - out_end
+        return row, out_col - (self.out_col - self.col if out_row == self.out_row else 0)
+
+    def relocate(self, node, rows=None):
+        """Move a node that starts in the python code of the layout, and its children, to their
+        place in the source. If rows is given, only the nodes that span one of these (sorted) rows
+        are moved."""
+        compiler = self.compiler
+        lineno = getattr(node, 'lineno', None)
+        if lineno is not None:
+            end_lineno = node.end_lineno
+            if rows is not None:
+                i = bisect.bisect_left(rows, lineno)
+                if i == len(rows) or rows[i] > end_lineno:
+                    return
+            pos = (lineno, compiler.out_col(lineno, node.col_offset))
+            block = self.block_at(pos)
+            if block is not None:
+                block.relocate(node)
+                return
+            node.lineno, node.col_offset = compiler.source_offset(self.source_pos(pos))
+            node.end_lineno, node.end_col_offset = compiler.source_offset(self.source_pos(
+                (end_lineno, compiler.out_col(end_lineno, node.end_col_offset)), True))
+        for child in ast.iter_child_nodes(node):
+            self.relocate(child, rows)
+
+
+class _Block(object):
+    """Where the transform put the code of a pyxl block, and its python fragments."""
+
+    def __init__(self, layout, token):
+        ttype, code, self.start, self.end, tline = token
+        self.layout = layout
+        compiler = layout.compiler
+        self.out_start = layout.out_pos(*self.start)
+        self.out_end = self.code_pos(code, len(code))
+        layout.block_ends.setdefault(self.end[0], []).append((self.end[1], self.out_end[1]))
+        # the rows of the code generated from the markup are the rows of the markup
+        self.row_offset = layout.row - layout.out_row
+        self.first_col = compiler.col_offset(self.start[0], self.start[1])
+        self.last_col = compiler.col_offset(self.end[0], self.end[1])
+        self.fragments = []
+        for tokens, start, end in compiler.fragments[self.start]:
+            if all(not token[1].strip() or token[0] in (COMMENT, NL) for token in tokens):
+                compiler.syntax_error('empty expression in pyxl', tokens[0][2])
+            out_start = self.code_pos(code, start)
+            self.fragments.append((out_start, self.code_pos(code, end),
+                                   _Layout(compiler, tokens, tokens[0][2], out_start)))
+        self.fragment_starts = [fragment[0] for fragment in self.fragments]
+
+    def code_pos(self, code, offset):
+        """The position in the transformed source of an offset in the code of the block."""
+        row, col = self.out_start
+        newlines = code.count('\n', 0, offset)
+        if newlines:
+            return row + newlines, offset - code.rfind('\n', 0, offset) - 1
+        return row, col + offset
+
+    def fragment_at(self, pos, end=False):
+        """The layout of the python fragment that contains a position, if any."""
+        i = (bisect.bisect_left if end else bisect.bisect_right)(self.fragment_starts, pos) - 1
+        if i >= 0:
+            out_start, out_end, layout = self.fragments[i]
+            if pos < out_end or (end and pos == out_end):
+                return layout
+        return None
+
+    def source_pos(self, pos, end=False):
+        layout = self.fragment_at(pos, end)
+        if layout is not None:
+            return layout.source_pos(pos, end)
+        row = pos[0] + self.row_offset
+        compiler = self.layout.compiler
+        if end:
+            return row, self.end[1] if row == self.end[0] else compiler.line_cols(row)[1]
+        return row, self.start[1] if row == self.start[0] else compiler.line_cols(row)[0]
+
+    def relocate(self, node):
+        """Move a node that starts in the code generated from the markup, and its children, to
+        their place in the source.
+
+        Nodes generated from the markup point to the lines they came from, from the start of the
+        text on the line (or the start of the block) to its end (or the end of the block).
+        """
+        compiler = self.layout.compiler
+        pos = (node.lineno, compiler.out_col(node.lineno, node.col_offset))
+        end = (node.end_lineno, compiler.out_col(node.end_lineno, node.end_col_offset))
+        i = bisect.bisect_left(self.fragment_starts, pos)
+        if i == len(self.fragments) or self.fragments[i][0] >= end:
+            # all of it is generated
+            self.relocate_generated_tree(node)
+            return
+
+        self.relocate_generated(node)
+        layout = self.fragment_at(end, True)
+        if layout is not None:
+            # a conditional ends with the python of its cond
+            node.end_lineno, node.end_col_offset = compiler.source_offset(
+                layout.source_pos(end, True))
+        self.relocate_children(node)
+
+    def relocate_children(self, node):
+        compiler = self.layout.compiler
+        for child in ast.iter_child_nodes(node):
+            if 'lineno' not in child._attributes:
+                # e.g. the comprehension of a generator
+                self.relocate_children(child)
+                continue
+            layout = self.fragment_at((child.lineno,
+                                       compiler.out_col(child.lineno, child.col_offset)))
+            if layout is None:
+                self.relocate(child)
+            else:
+                layout.relocate(child)
+
+    def relocate_generated_tree(self, node):
+        """Move every node of a tree generated from the markup, like relocate_generated. This is
+        where most of the time goes, so it's a loop rather than a walk."""
+        row_offset = self.row_offset
+        start_row, first_col = self.start[0], self.first_col
+        end_row, last_col = self.end[0], self.last_col
+        markup_cols = self.layout.compiler.markup_cols
+        stack = [node]
+        pop = stack.pop
+        while stack:
+            node = pop()
+            row = node.lineno = node.lineno + row_offset
+            node.col_offset = first_col if row == start_row else markup_cols(row)[0]
+            row = node.end_lineno = node.end_lineno + row_offset
+            node.end_col_offset = last_col if row == end_row else markup_cols(row)[1]
+            if type(node) is ast.Constant:
+                continue
+            for field in node._fields:
+                value = getattr(node, field)
+                if type(value) is list:
+                    stack.extend(item for item in value if isinstance(item, _LOCATED))
+                elif isinstance(value, _LOCATED):
+                    stack.append(value)
+
+    def relocate_generated(self, node):
+        compiler = self.layout.compiler
+        row = node.lineno = node.lineno + self.row_offset
+        node.col_offset = self.first_col if row == self.start[0] else compiler.markup_cols(row)[0]
+        row = node.end_lineno = node.end_lineno + self.row_offset
+        node.end_col_offset = self.last_col if row == self.end[0] else compiler.markup_cols(row)[1]
+
+
+class _Compiler(object):
+    def __init__(self, source, filename, str_function, static_html, trusted):
+        self.source = source
+        self.filename = filename
+        self.str_function = str_function
+        self.static_html = static_html
+        self.trusted = trusted
+        self.lines = io.StringIO(source).readlines()
+        self.fragments = {}  # start of each pyxl block -> its python fragments
+        self.ascii = source.isascii()
+        self.out_lines = None
+        self.markup_cols_cache = {}
+
+    def parse(self):
+        stream = RewindableTokenStream(io.StringIO(self.source).readline,
+                                       fragments=self.fragments)
+        tokens = list(cleanup_tokens(transform_tokens(stream, False, self.str_function,
+                                                      self.static_html, self.trusted,
+                                                      toplevel=True)))
+        text = Untokenizer(1, 0).untokenize(tokens)
+        module = _Layout(self, tokens, (1, 0), (1, 0))
+        if not self.ascii:
+            self.out_lines = text.split('\n')
+        try:
+            tree = ast.parse(text, self.filename)
+        except SyntaxError as e:
+            if e.lineno is None or e.offset is None:
+                raise
+            self.syntax_error(e.msg, module.source_pos((e.lineno, e.offset - 1)))
+        if module.blocks:
+            # only the lines of pyxl blocks differ between the source and the transformed source
+            rows = set()
+            for block in module.blocks:
+                rows.update(range(block.start[0], block.end[0] + 1))
+            module.relocate(tree, sorted(rows))
+        return tree
+
+    def syntax_error(self, msg, pos):
+        row, col = pos
+        raise SyntaxError(msg, (self.filename, row, col + 1, self.line(row)))
+
+    def line(self, row):
+        return self.lines[row - 1] if row <= len(self.lines) else ''
+
+    def col_offset(self, row, col):
+        """Convert a column in characters to the utf-8 offset that ast uses."""
+        line = self.line(row)
+        return col if line.isascii() else len(line[:col].encode('utf-8'))
+
+    def out_col(self, row, offset):
+        """Convert a utf-8 offset in the transformed source to a column in characters."""
+        if self.ascii:
+            return offset
+        line = self.out_lines[row - 1]
+        return offset if line.isascii() else len(line.encode('utf-8')[:offset].decode('utf-8'))
+
+    def source_offset(self, pos):
+        """Convert a position in the source with a column in characters to the utf-8 offset that
+        ast uses."""
+        row, col = pos
+        return row, self.col_offset(row, col)
+
+    def markup_cols(self, row):
+        """Return the utf-8 offsets where the text on a line starts and ends."""
+        cols = self.markup_cols_cache.get(row)
+        if cols is None:
+            line_cols = self.line_cols(row)
+            cols = self.markup_cols_cache[row] = (self.col_offset(row, line_cols[0]),
+                                                  self.col_offset(row, line_cols[1]))
+        return cols
+
+    def line_cols(self, row):
+        """Return the columns where the text on a line starts and ends."""
+        line = self.line(row)
+        return len(line) - len(line.lstrip()), len(line.rstrip())
+
+
+def pyxl_parse(source, filename='<unknown>', str_function='str', static_html=False,
+               trusted=False):
+    """Parse pyxl source to an ast.Module."""
+    return _Compiler(source, filename, str_function, static_html, trusted).parse()
+
+
+def pyxl_compile(source, filename='<unknown>', static_html=False, optimize=-1, trusted=False):
+    """Compile pyxl source to a module code object."""
+    tree = pyxl_parse(source, filename, static_html=static_html, trusted=trusted)
+    return compile(tree, filename, 'exec', dont_inherit=True, optimize=optimize)
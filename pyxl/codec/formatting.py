@@ -0,0 +1,116 @@
+"""
+Formatting pyxl sources with black.
+
+black can't parse pyxl, but it can format the invertible output of the transform, which inverts
+back to pyxl with the formatting applied. This does that in memory, over a process pool for many
+files, and remembers the results in the transform cache: a file that is already formatted (or
+whose formatted output is cached) isn't formatted again.
+
+black is imported when it's first needed, so it's only required to actually format something.
+"""
+
+import concurrent.futures
+import hashlib
+from collections import namedtuple
+
+import pyxl
+from pyxl.codec import CODEGEN_VERSION
+# black reads the coding cookie of what it formats, which is still pyxl
+import pyxl.codec.register
+from pyxl.codec.cache import get_default_cache
+from pyxl.codec.transform import _invert_string_quietly, _transform_string_quietly
+
+
+FormatResult = namedtuple('FormatResult', ['path', 'changed', 'error'])
+FormatResult.__doc__ = """The result of formatting one file with format_many.
+
+changed tells if the formatted file differs from the original. If formatting failed, it's None and
+error is the exception that was raised.
+"""
+
+
+def format_string(source, mode=None):
+    """Format pyxl source with black, in the given black.Mode (the default mode if None)."""
+    import black
+    if mode is None:
+        mode = black.Mode()
+    invertible = _transform_string_quietly(source, True, 'str', False, None, False)
+    return _invert_string_quietly(black.format_str(invertible, mode=mode))
+
+
+def format_key(source, mode):
+    """The key of the formatted source in a TransformCache."""
+    import black
+    h = hashlib.sha256()
+    h.update(repr(('format', pyxl.__version__, CODEGEN_VERSION, black.__version__,
+                   mode)).encode('utf-8'))
+    h.update(b'\0')
+    h.update(source.encode('utf-8'))
+    return h.hexdigest()
+
+
+def format_string_cached(source, mode=None, cache=None):
+    """Like format_string, but goes through the transform cache.
+
+    If no cache is passed, the one configured by the environment is used (see pyxl.codec.cache).
+    """
+    import black
+    if mode is None:
+        mode = black.Mode()
+    if cache is None:
+        cache = get_default_cache()
+        if cache is None:
+            return format_string(source, mode)
+
+    key = format_key(source, mode)
+    output = cache.get(key)
+    if output is None:
+        output = format_string(source, mode)
+        cache.put(key, output)
+        if output != source:
+            # formatting is idempotent, so the output is already formatted
+            cache.put(format_key(output, mode), output)
+    return output
+
+
+def _format_file(path, mode, write, cache):
+    """Format one file of format_many, and write it back if asked to and it changed. Runs in a
+    worker process."""
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            source = f.read()
+        output = format_string_cached(source, mode, cache)
+        changed = output != source
+        if changed and write:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write(output)
+    except Exception as e:
+        return FormatResult(path, None, e)
+    return FormatResult(path, changed, None)
+
+
+def format_many(paths, workers=None, mode=None, write=True, cache=None):
+    """Format many pyxl files with black, using up to workers processes (by default, one per
+    core).
+
+    Files that changed are written back, unless write is false. Returns a list of FormatResult, in
+    the order of paths; a file that fails to be formatted doesn't stop the others. If no cache is
+    passed, the one configured by the environment is used.
+    """
+    import black
+    if mode is None:
+        mode = black.Mode()
+
+    if workers == 1 or len(paths) <= 1:
+        return [_format_file(path, mode, write, cache) for path in paths]
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(path, executor.submit(_format_file, path, mode, write, cache))
+                   for path in paths]
+        for path, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(FormatResult(path, None, e))
+    return results
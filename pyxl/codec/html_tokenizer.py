@@ -5,6 +5,7 @@ http://www.w3.org/TR/2011/WD-html5-20110525/tokenization.html
 In the ATTRIBUTE_VALUE and BEFORE_ATTRIBUTE_VALUE states, python tokens are accepted.
 """
 
+import re
 import sys
 from collections import OrderedDict
 
@@ -63,6 +64,23 @@ class BadCharError(Exception):
 class Unimplemented(Exception):
     pass
 
+# For the states where they are common, runs of characters that leave the state unchanged. These
+# are consumed in one step by HTMLTokenizer.feed_string.
+_WHITESPACE_RUN = re.compile(r'[\t\n\f ]+')
+_RUNS = {
+    State.DATA: re.compile(r'[^<]+'),
+    State.TAG_NAME: re.compile(r'[^\t\n\f />]+'),
+    State.BEFORE_ATTRIBUTE_NAME: _WHITESPACE_RUN,
+    State.ATTRIBUTE_NAME: re.compile(r'[^\t\n\f /=>"\'<]+'),
+    State.AFTER_ATTRIBUTE_NAME: _WHITESPACE_RUN,
+    State.BEFORE_ATTRIBUTE_VALUE: _WHITESPACE_RUN,
+    State.ATTRIBUTE_VALUE_DOUBLE_QUOTED: re.compile(r'[^"]+'),
+    State.ATTRIBUTE_VALUE_SINGLE_QUOTED: re.compile(r"[^']+"),
+    State.ATTRIBUTE_VALUE_UNQUOTED: re.compile(r'[^\t\n\f >"\'<=`]+'),
+    State.COMMENT: re.compile(r'[^-]+'),
+    State.DOCTYPE_CONTENTS: re.compile(r'[^>]+'),
+}
+
 class HTMLTokenizer(object):
 
     def __init__(self):
@@ -139,6 +157,53 @@ class HTMLTokenizer(object):
         else:
             build.append(c)
 
+    def feed_string(self, s, stop=None):
+        """Feed every character of s, as if by calling feed() on each of them.
+
+        Runs of characters that don't change the state are consumed in one step. Before each
+        character that may change the state is fed, seek() is called with the index just past it.
+        If stop is given, it is called after each such character, and scanning stops as soon as it
+        returns true.
+
+        Returns the number of characters consumed.
+        """
+        pos = 0
+        end = len(s)
+        while pos < end:
+            run = _RUNS.get(self.state)
+            if run is not None:
+                m = run.match(s, pos)
+                if m:
+                    self._feed_run(m.group())
+                    pos = m.end()
+                    continue
+
+            self.seek(s, pos + 1)
+            # not self.feed: subclasses (e.g. PyxlParser) override it to take tokens
+            HTMLTokenizer.feed(self, s[pos])
+            pos += 1
+            if stop is not None and stop():
+                break
+        return pos
+
+    def seek(self, s, pos):
+        """Hook for subclasses that track the position in the input of feed_string."""
+        pass
+
+    def _feed_run(self, run):
+        """Handle a run of characters matched by the regex in _RUNS for the current state."""
+        if self.state in (State.DATA, State.COMMENT, State.DOCTYPE_CONTENTS):
+            self.data += run
+        elif self.state == State.TAG_NAME:
+            self.tag.tag_name += run
+        elif self.state == State.ATTRIBUTE_NAME:
+            self.attribute_name += run.lower()
+        elif self.state in (State.ATTRIBUTE_VALUE_DOUBLE_QUOTED,
+                            State.ATTRIBUTE_VALUE_SINGLE_QUOTED,
+                            State.ATTRIBUTE_VALUE_UNQUOTED):
+            self.add_data_char(self.attribute_value, run)
+        # otherwise it's whitespace between attributes, which is ignored
+
     def feed(self, c):
         if self.state == State.DATA:
             if c == '<':
@@ -409,8 +474,7 @@ def main(filename):
     dumper = HTMLTokenDumper()
     with open(filename) as f:
         for line in f:
-            for c in line:
-                dumper.feed(c)
+            dumper.feed_string(line)
 
 if __name__ == "__main__":
     main(*sys.argv[1:])
@@ -0,0 +1,186 @@
+"""
+An import hook for pyxl modules, as an alternative to registering the pyxl codec.
+
+    import pyxl.codec.importer
+    pyxl.codec.importer.install()
+
+After this, modules whose source starts with a `# coding: pyxl` cookie are transformed by the
+pyxl loader instead of by the codec, and compiled straight from the transformed AST. Packages can
+also be opted in by path, in which case their modules don't need the cookie at all:
+
+    pyxl.codec.importer.install(prefixes=['/srv/app/templates'])
+
+The bytecode of these modules is cached next to the regular .pyc files, under a cache tag that
+includes the pyxl version, the version of the generated code (pyxl.codec.CODEGEN_VERSION) and the
+transform options, so it's invalidated when any of them changes.
+
+With exact_locations=True, modules are compiled by pyxl.codec.compiler instead, so that python
+code following a pyxl block on the same line keeps its columns in tracebacks. This is somewhat
+slower, and doesn't use PYXL_CACHE_DIR.
+
+With trusted=True, the literal attribute values of pyxl.html elements are validated once, when a
+module is transformed, rather than every time the element is constructed (see the README).
+"""
+
+import ast
+import importlib.machinery
+import importlib.util
+import io
+import marshal
+import os
+import re
+import struct
+import sys
+
+import pyxl
+from pyxl.codec import CODEGEN_VERSION
+from pyxl.codec.compiler import pyxl_compile
+from pyxl.codec.transform import pyxl_transform_string_cached
+
+# PEP 263
+_COOKIE_RE = re.compile(br'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+
+
+def has_pyxl_cookie(path):
+    """Return true if the file at path declares the pyxl encoding."""
+    try:
+        with open(path, 'rb') as f:
+            for _ in range(2):
+                match = _COOKIE_RE.match(f.readline())
+                if match:
+                    return match.group(1) == b'pyxl'
+    except OSError:
+        pass
+    return False
+
+
+# path -> (mtime, size, has_pyxl_cookie(path)), so that a module imported again (say, in every
+# test of a suite) isn't read again as long as it's unchanged.
+_cookie_cache = {}
+
+def _has_pyxl_cookie_cached(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    cached = _cookie_cache.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    result = has_pyxl_cookie(path)
+    _cookie_cache[path] = (st.st_mtime_ns, st.st_size, result)
+    return result
+
+
+class PyxlLoader(importlib.machinery.SourceFileLoader):
+    def __init__(self, fullname, path, static_html=False, exact_locations=False, trusted=False):
+        super(PyxlLoader, self).__init__(fullname, path)
+        self.static_html = static_html
+        self.exact_locations = exact_locations
+        self.trusted = trusted
+
+    @property
+    def cache_tag(self):
+        tag = '%s.pyxl-%s-%d' % (sys.implementation.cache_tag, pyxl.__version__,
+                                  CODEGEN_VERSION)
+        if self.static_html:
+            tag += '-static'
+        if self.exact_locations:
+            tag += '-exact'
+        if self.trusted:
+            tag += '-trusted'
+        return tag
+
+    def cache_path(self, source_path):
+        """Like importlib.util.cache_from_source, but with our own cache tag."""
+        path = importlib.util.cache_from_source(source_path)
+        head, tail = os.path.split(path)
+        name = tail.split('.', 1)[0]
+        rest = tail[len(name) + 1 + len(sys.implementation.cache_tag):]
+        return os.path.join(head, '%s.%s%s' % (name, self.cache_tag, rest))
+
+    def get_source(self, fullname):
+        """Return the original pyxl source, so that tracebacks show what was actually written."""
+        data = self.get_data(self.get_filename(fullname))
+        newline_decoder = io.IncrementalNewlineDecoder(None, True)
+        return newline_decoder.decode(data.decode('utf-8'))
+
+    def source_to_code(self, data, path, *, _optimize=-1):
+        if self.exact_locations:
+            return pyxl_compile(data.decode('utf-8'), path, static_html=self.static_html,
+                                optimize=_optimize, trusted=self.trusted)
+        source = pyxl_transform_string_cached(data.decode('utf-8'), static_html=self.static_html,
+                                              filename=path, trusted=self.trusted)
+        tree = ast.parse(source, path)
+        return compile(tree, path, 'exec', dont_inherit=True, optimize=_optimize)
+
+    def get_code(self, fullname):
+        source_path = self.get_filename(fullname)
+        st = self.path_stats(source_path)
+        header = importlib.util.MAGIC_NUMBER + struct.pack(
+            '<III', 0, int(st['mtime']) & 0xFFFFFFFF, st['size'] & 0xFFFFFFFF)
+
+        bytecode_path = self.cache_path(source_path)
+        try:
+            data = self.get_data(bytecode_path)
+        except OSError:
+            pass
+        else:
+            if data[:16] == header:
+                return marshal.loads(data[16:])
+
+        code = self.source_to_code(self.get_data(source_path), source_path)
+        if not sys.dont_write_bytecode:
+            try:
+                self.set_data(bytecode_path, header + marshal.dumps(code))
+            except OSError:
+                pass
+        return code
+
+
+class PyxlFinder(object):
+    """A meta path finder that hands pyxl modules to PyxlLoader.
+
+    It's installed right before the regular path finder, and finds modules the same way: those
+    that aren't pyxl are returned unchanged, so that the path isn't searched a second time.
+    """
+
+    def __init__(self, prefixes=(), static_html=False, exact_locations=False, trusted=False):
+        self.prefixes = [os.path.join(os.path.abspath(prefix), '') for prefix in prefixes]
+        self.static_html = static_html
+        self.exact_locations = exact_locations
+        self.trusted = trusted
+
+    def is_pyxl(self, path):
+        path = os.path.abspath(path)
+        if any(path.startswith(prefix) for prefix in self.prefixes):
+            return True
+        return _has_pyxl_cookie_cached(path)
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if (spec is not None and isinstance(spec.loader, importlib.machinery.SourceFileLoader)
+                and self.is_pyxl(spec.origin)):
+            spec.loader = PyxlLoader(fullname, spec.origin, self.static_html,
+                                     self.exact_locations, self.trusted)
+        return spec
+
+    def invalidate_caches(self):
+        _cookie_cache.clear()
+
+
+def install(prefixes=(), static_html=False, exact_locations=False, trusted=False):
+    """Install a PyxlFinder in sys.meta_path, right before the regular path finder (or at the end
+    if there is none), and return it."""
+    finder = PyxlFinder(prefixes, static_html, exact_locations, trusted)
+    for i, other in enumerate(sys.meta_path):
+        if other is importlib.machinery.PathFinder:
+            sys.meta_path.insert(i, finder)
+            break
+    else:
+        sys.meta_path.append(finder)
+    return finder
+
+
+def uninstall():
+    """Remove all PyxlFinders from sys.meta_path."""
+    sys.meta_path[:] = [finder for finder in sys.meta_path if not isinstance(finder, PyxlFinder)]
@@ -1,14 +1,20 @@
 #!/usr/bin/env python
 
+import re
 import tokenize
 from pyxl.utils import escape
 from pyxl import html
+from pyxl.base import PyxlException, x_base
 from .html_tokenizer import (
         HTMLTokenizer,
         ParseError as TokenizerParseError,
         State,
 )
-from .pytokenize import Untokenizer
+from .pytokenize import untokenize
+
+# Marks the start (with the fragment's index) and the end of each python fragment in the output,
+# while fragments are being collected.
+_FRAGMENT_MARK = re.compile('\x00(\\d+)\x01|\x02')
 
 class ParseError(Exception):
     def __init__(self, message, pos=None):
@@ -18,25 +24,36 @@ class ParseError(Exception):
             super(ParseError, self).__init__(message)
 
 class PyxlParser(HTMLTokenizer):
-    def __init__(self, row, col, str_function):
+    def __init__(self, row, col, str_function, static_html=False, trusted=False):
         super(PyxlParser, self).__init__()
         self.start = self.end = (row, col)
         self.output = []
+        # index in self.output of the comma after the last child, if it's still there
+        self.last_comma = None
         self.open_tags = []
         self.remainder = None
         self.next_thing_is_python = False
         self.last_thing_was_python = False
         self.last_thing_was_close_if_tag = False
+        # the open tag of the last </if>, until its conditional is finished
+        self.last_if = None
         self.str_function = str_function
+        self.static_html = static_html
+        self.trusted = trusted
+        self.seek_offset = 0
+        # if a list, python fragments are collected in it, as (tokens, start, end) with the span of
+        # the fragment's code in the output (see pyxl.codec.compiler)
+        self.fragments = None
+
+    def emit_comma(self, comma=', '):
+        """Emit the comma that ends a child, remembering where it is so it can be deleted."""
+        self.last_comma = len(self.output)
+        self.output.append(comma)
 
     def delete_last_comma(self):
-        for i in reversed(range(len(self.output))):
-            stripped = self.output[i].rstrip()
-            if stripped and not stripped[0] == '#':
-                assert stripped[-1] == ',', (self.output, stripped, i)
-                self.output[i] = self.output[i][:len(stripped)-1] + self.output[i][len(stripped):]
-                return
-        assert False, "couldn't find a comma"
+        assert self.last_comma is not None, "couldn't find a comma"
+        self.output[self.last_comma] = self.output[self.last_comma][1:]
+        self.last_comma = None
 
     def handle_close_if(self):
         """Clean up after an unpaired if statement.
@@ -45,9 +62,67 @@ class PyxlParser(HTMLTokenizer):
         """
         if self.last_thing_was_close_if_tag:
             self.delete_last_comma()
-            self.output.append(' else None, ')
+            if self.finish_conditional(self.last_if):
+                self.output.append(' else ())')
+            else:
+                self.output.append(' else None')
+            self.emit_comma()
             self.last_thing_was_close_if_tag = False
 
+    def finish_conditional(self, *branches):
+        """Finish the code for an <if> and its <else>, if any, once both have been parsed.
+
+        If each branch has a single child, that child is the branch's value. Otherwise each branch
+        is a tuple of its children, and the conditional is star-unpacked into the children of the
+        enclosing tag instead of being wrapped in an x_frag. Returns whether it was unpacked, in
+        which case the caller closes the parentheses if there is no else.
+        """
+        unpack = any(branch['children'] != 1 or branch.get('bare_child') for branch in branches)
+        for branch in branches:
+            self.finish_branch(branch, unpack)
+        if unpack:
+            self.output[branches[0]['open']] = '*(('
+            if len(branches) == 2:
+                self.output[branches[1]['close']] = '))'
+        return unpack
+
+    def finish_branch(self, branch, unpack):
+        if unpack:
+            self.output[branch['open']] = '('
+        elif branch['children'] == 1:
+            # the only child is the value: remove the x_frag that opened the branch, and the
+            # comma after the child
+            self.output[branch['open']] = ''
+            self.output[branch['close']] = ''
+            comma = branch['comma']
+            self.output[comma] = self.output[comma][1:]
+            if self.last_comma == comma:
+                self.last_comma = None
+
+    def mark_not_static(self):
+        """Mark every open tag as containing something that can't be rendered at transform time."""
+        for open_tag in self.open_tags:
+            open_tag['static'] = False
+
+    def collapse_static(self, open_tag):
+        """Replace the code emitted for a static subtree with a single pre-rendered constant.
+
+        The subtree is rendered now, by running exactly the code that would have run at import
+        time. If that fails (e.g. an invalid attribute), the code is left alone so that the error
+        is raised at runtime like it always was.
+        """
+        start = open_tag['start']
+        code = ''.join(self.output[start:])
+        try:
+            rendered = eval(code, {'html': html}).to_string()
+        except Exception:
+            return False
+        # keep the line count of the original code so that line numbers don't shift
+        if self.last_comma is not None and self.last_comma >= start:
+            self.last_comma = None
+        self.output[start:] = ['html.static_rawhtml(%r%s)' % (rendered, '\n' * code.count('\n'))]
+        return True
+
     def start_element(self):
         """Mark the start of an element.
 
@@ -77,21 +152,35 @@ class PyxlParser(HTMLTokenizer):
 
         self.end = tstart
 
-        if ttype != tokenize.INDENT:
-            while tvalue and not self.done():
-                c, tvalue = tvalue[0], tvalue[1:]
-                if c == "\n":
-                    self.end = (self.end[0]+1, 0)
-                else:
-                    self.end = (self.end[0], self.end[1]+1)
-                try:
-                    super(PyxlParser, self).feed(c)
-                except TokenizerParseError:
-                    raise ParseError("HTML Parsing error", self.end)
+        if ttype != tokenize.INDENT and tvalue and not self.done():
+            self.seek_offset = 0
+            try:
+                consumed = self.feed_string(tvalue, self.done)
+            except TokenizerParseError:
+                raise ParseError("HTML Parsing error", self.end)
+            self.seek(tvalue, consumed)
+            tvalue = tvalue[consumed:]
         if self.done():
             self.remainder = (ttype, tvalue, self.end, tend, tline)
         else:
             self.end = tend
+        # keep the line count when a single token spans several lines
+        if self.end[0] > tstart[0]:
+            self.output.append("\n" * (self.end[0] - tstart[0]))
+
+    def seek(self, s, pos):
+        """Keep self.end up to date while feed_string scans s.
+
+        self.end is the position just past the character being handled, as the callbacks use it
+        for error messages.
+        """
+        row, col = self.end
+        newlines = s.count('\n', self.seek_offset, pos)
+        if newlines:
+            self.end = (row + newlines, pos - s.rfind('\n', self.seek_offset, pos) - 1)
+        else:
+            self.end = (row, col + pos - self.seek_offset)
+        self.seek_offset = pos
 
     def feed_python(self, tokens):
         self.handle_close_if()
@@ -102,16 +191,22 @@ class PyxlParser(HTMLTokenizer):
             self.output.append("\n" * (tstart[0] - self.end[0]))
         ttype, tvalue, tstart, tend, tline = tokens[-1]
         self.end = tend
+        self.mark_not_static()
 
         if self.state in [State.DATA, State.CDATA_SECTION]:
             self.next_thing_is_python = True
             self.emit_data()
-            output = Untokenizer().untokenize(tokens)
+            output = self.python_code(tokens)
+            self.open_tags[-1]['dynamic'] = True
+            if has_bare_tuple(tokens):
+                # not a single child, so it can't be the value of an <if> as is
+                self.open_tags[-1]['bare_child'] = True
             # If we have a generator comprehension, parenthesize it
             if has_bare_generator(tokens):
-                self.output.append("(%s), " % output)
+                self.output.append("(%s)" % output)
             else:
-                self.output.append("%s, " % output)
+                self.output.append(output)
+            self.emit_comma()
             self.next_thing_is_python = False
             self.last_thing_was_python = True
             self.start_element()
@@ -165,7 +260,48 @@ class PyxlParser(HTMLTokenizer):
         return len(self.open_tags) == 0 and self.state == State.DATA and self.output
 
     def get_token(self):
-        return (tokenize.STRING, ''.join(self.output), self.start, self.end, '')
+        output = ''.join(self.output)
+        if self.fragments is not None:
+            output = self.locate_fragments(output)
+        return (tokenize.STRING, output, self.start, self.end, '')
+
+    def python_code(self, tokens):
+        """Return the code for a python fragment, marked if fragments are being collected."""
+        code = untokenize(tokens)
+        if self.fragments is None:
+            return code
+        self.fragments.append(tokens)
+        return '\x00%d\x01%s\x02' % (len(self.fragments) - 1, code)
+
+    def locate_fragments(self, output):
+        """Remove the marks around the python fragments from output, and store the span of each
+        fragment's code in self.fragments."""
+        parts = []
+        length = 0
+        pos = 0
+        start = index = None
+        for match in _FRAGMENT_MARK.finditer(output):
+            parts.append(output[pos:match.start()])
+            length += match.start() - pos
+            pos = match.end()
+            if match.group(1) is not None:
+                start, index = length, int(match.group(1))
+            else:
+                self.fragments[index] = (self.fragments[index], start, length)
+        parts.append(output[pos:])
+        return ''.join(parts)
+
+    def validate_attr(self, cls, name, value):
+        """Validate a literal attribute value of a pyxl.html element, and return it as it will be
+        stored, or None if it can't be written as a literal.
+
+        This is done at transform time in trusted mode, so that _new doesn't have to at runtime.
+        """
+        try:
+            value = cls._new({name: value}, ()).attr(name)
+        except PyxlException as e:
+            raise ParseError(str(e), self.end)
+        return value if type(value) in (str, int, float, bool) else None
 
     @staticmethod
     def safe_attr_name(name):
@@ -175,7 +311,9 @@ class PyxlParser(HTMLTokenizer):
             return "xfor"
         return name.replace('-', '_').replace(':', 'COLON')
 
-    def _handle_attr_value(self, attr_value):
+    def _attr_value_parts(self, attr_value):
+        """Return the parts of an attribute value, a list of strings and python token lists, with
+        the whitespace of the strings normalized."""
         def format_parts():
             prev_was_python = False
             for i, part in enumerate(attr_value):
@@ -189,24 +327,24 @@ class PyxlParser(HTMLTokenizer):
                         yield part
                     prev_was_python = False
 
-        attr_value = list(format_parts())
+        return list(format_parts())
+
+    def _attr_value_code(self, attr_value):
+        """Return the code for an attribute value, a list of strings and python token lists."""
+        attr_value = self._attr_value_parts(attr_value)
         if len(attr_value) == 1:
             part = attr_value[0]
             if type(part) == list:
-                self.output.append(Untokenizer().untokenize(part))
+                return self.python_code(part)
+            return repr(part)
+
+        code = []
+        for part in attr_value:
+            if type(part) == list:
+                code.append('%s(%s), ' % (self.str_function, self.python_code(part)))
             else:
-                self.output.append(repr(part))
-        else:
-            self.output.append('u"".join((')
-            for part in attr_value:
-                if type(part) == list:
-                    self.output.append('{}('.format(self.str_function))
-                    self.output.append(Untokenizer().untokenize(part))
-                    self.output.append(')')
-                else:
-                    self.output.append(repr(part))
-                self.output.append(', ')
-            self.output.append('))')
+                code.append('%r, ' % part)
+        return 'u"".join((%s))' % ''.join(code)
 
     @staticmethod
     def _normalize_data_whitespace(data, prev_was_py, next_is_py):
@@ -228,7 +366,10 @@ class PyxlParser(HTMLTokenizer):
 
     def handle_starttag(self, tag, attrs, call=True):
         self.start_element()
-        self.open_tags.append({'tag':tag, 'row': self.end[0], 'attrs': attrs, 'children': 0})
+        static = self.static_html and not any(
+            type(part) == list for attr_value in attrs.values() for part in attr_value)
+        self.open_tags.append({'tag':tag, 'row': self.end[0], 'attrs': attrs, 'children': 0,
+                               'static': static})
         if tag == 'if':
             self.handle_close_if()
 
@@ -249,6 +390,7 @@ class PyxlParser(HTMLTokenizer):
                 raise ParseError("<else> tag must come right after </if>", self.end)
 
             self.delete_last_comma()
+            self.open_tags[-1]['if'] = self.last_if
             self.output.append('else ')
             self.open_tags[-1]['open'] = len(self.output)  # track x_frag pos so it can be deleted
             self.output.append('html.x_frag()(')
@@ -257,13 +399,46 @@ class PyxlParser(HTMLTokenizer):
             return
 
         self.handle_close_if()
+        self.open_tags[-1]['start'] = len(self.output)  # track code pos so it can be pre-rendered
 
         module, dot, identifier = tag.rpartition('.')
         identifier = 'x_%s' % identifier
         x_tag = module + dot + identifier
 
         if hasattr(html, x_tag):
-            self.output.append('html.')
+            # Elements from pyxl.html are built by x_base._new, with their attribute names
+            # normalized here rather than at runtime.
+            self.output.append('html.%s._new({' % x_tag)
+            items = []
+            dynamic = []
+            for attr_name, attr_value in attrs.items():
+                name = x_base._fix_attribute_name(self.safe_attr_name(attr_name))
+                value = None
+                if self.trusted and all(type(part) != list for part in attr_value):
+                    value = self.validate_attr(getattr(html, x_tag), name,
+                                               ''.join(self._attr_value_parts(attr_value)))
+                if value is None:
+                    items.append('%r: %s' % (name, self._attr_value_code(attr_value)))
+                    dynamic.append(name)
+                else:
+                    items.append('%r: %r' % (name, value))
+            self.output.append(', '.join(items))
+            if self.trusted:
+                # the names of the attributes that _new still has to validate
+                self.open_tags[-1]['end'] = '), %r)' % (tuple(dynamic),)
+            else:
+                self.open_tags[-1]['end'] = '))'
+            if call:
+                self.open_tags[-1]['children_open'] = len(self.output)
+                self.output.append('}, (')
+            else:
+                self.output.append('}, (' + self.open_tags[-1]['end'])
+            self.open_tags[-1]['element'] = True
+            self.last_thing_was_python = False
+            self.last_thing_was_close_if_tag = False
+            return
+
+        self.mark_not_static()
         self.output.append('%s(' % x_tag)
 
         first_attr = True
@@ -273,7 +448,7 @@ class PyxlParser(HTMLTokenizer):
 
             self.output.append(self.safe_attr_name(attr_name))
             self.output.append('=')
-            self._handle_attr_value(attr_value)
+            self.output.append(self._attr_value_code(attr_value))
 
         self.output.append(')')
         if call:
@@ -285,41 +460,72 @@ class PyxlParser(HTMLTokenizer):
     def handle_endtag(self, tag_name, call=True):
         self.handle_close_if()
 
-        if call:
-            # finish call to __call__
-            self.output.append(")")
-
         assert self.open_tags, "got </%s> but tag stack empty; parsing should be over!" % tag_name
 
+        if call:
+            # finish the children
+            self.output.append(self.open_tags[-1].get('end', ')'))
+
         open_tag = self.open_tags.pop()
         if open_tag['tag'] != tag_name:
             raise ParseError("<%s> on line %d closed by </%s> on line %d" %
                              (open_tag['tag'], open_tag['row'], tag_name, self.end[0]))
 
-        # If we are finishing an if or an else and it only had one child, we can safely
-        # remove the x_frag that opened it.
-        if tag_name in ('if', 'else') and call and open_tag['children'] == 1:
-            self.output[-1] = ''
-            self.delete_last_comma()
-            self.output[open_tag['open']] = ''
+        # The x_frag that opened an if or an else is removed or replaced by finish_conditional,
+        # once it's known whether the conditional can be unpacked into the enclosing tag. An if
+        # that is the whole expression can't be, so it's finished right away.
+        if tag_name in ('if', 'else') and call:
+            open_tag['close'] = len(self.output) - 1
+            open_tag['comma'] = self.last_comma
+            if not self.open_tags:
+                self.finish_branch(open_tag, False)
+            elif tag_name == 'else':
+                self.finish_conditional(open_tag['if'], open_tag)
+            else:
+                self.last_if = open_tag
+            if self.open_tags:
+                # a conditional can't be the value of a branch without parentheses
+                self.open_tags[-1]['bare_child'] = True
+
+        # Static subtrees are pre-rendered, except for the outermost tag: it is what the
+        # expression evaluates to, so callers may still inspect or modify it.
+        collapsed = (open_tag['static'] and self.open_tags and tag_name not in ('if', 'else')
+                     and self.collapse_static(open_tag))
+
+        if 'children_open' in open_tag and not collapsed:
+            children_open = open_tag['children_open']
+            if tag_name == 'frag' and self.open_tags and not open_tag['attrs']:
+                # A nested <frag> without attributes is unpacked into the children of the
+                # enclosing tag.
+                self.output[open_tag['start']] = '*'
+                self.output[children_open] = '('
+                self.output[-1] = ')'
+                self.open_tags[-1]['bare_child'] = True
+                self.open_tags[-1]['dynamic'] = True
+            elif open_tag['children'] and not open_tag.get('dynamic'):
+                # Every child is a string or an element, so they can be passed in a list that
+                # the element takes as is.
+                self.output[children_open] = '}, ['
+                self.output[-1] = ']' + self.output[-1][1:]
+
+        if self.open_tags and not open_tag.get('element'):
+            # anything but an element from pyxl.html may evaluate to None, a list, ...
+            self.open_tags[-1]['dynamic'] = True
 
         if tag_name == 'if':
             self.output.append(' if ')
             # If another if/else appears in the condition, we need to parenthesize it.
             # Detect this in a bad but easy way that might have some false positives.
-            start = len(self.output)
-            self.output.append('(')
-            self._handle_attr_value(open_tag['attrs']['cond'])
-            if 'else' in ''.join(self.output[start:]):
-                self.output.append(')')
-            else:
-                self.output[start] = ''
+            cond = self._attr_value_code(open_tag['attrs']['cond'])
+            if 'else' in cond:
+                cond = '(%s)' % cond
+            self.output.append(cond)
             self.last_thing_was_close_if_tag = True
         else:
             self.last_thing_was_close_if_tag = False
 
         if len(self.open_tags):
-            self.output.append(",")
+            self.emit_comma(',')
         self.last_thing_was_python = False
 
     def handle_startendtag(self, tag_name, attrs):
@@ -339,9 +545,10 @@ class PyxlParser(HTMLTokenizer):
         # want %r instead of this crazy quote substitution and u"%s".
         data = data.replace('"', '\\"')
         if data != escape(data):
-            self.output.append('html.rawhtml(u"%s"), ' % data)
+            self.output.append('html.rawhtml(u"%s")' % data)
         else:
-            self.output.append('u"%s", ' % data)
+            self.output.append('u"%s"' % data)
+        self.emit_comma()
 
         self.last_thing_was_python = False
         self.last_thing_was_close_if_tag = False
@@ -373,3 +580,19 @@ def has_bare_generator(tokens):
         if tvalue == "for" and nesting == 0:
             return True
     return False
+
+
+def has_bare_tuple(tokens):
+    """Returns true if the python in tokens is several children (a, b) or unpacks some (*a)."""
+    values = [token[1] for token in tokens if token[1].strip() and token[1][0] != '#']
+    if values and values[0] in ('*', '**'):
+        return True
+    nesting = 0
+    for tvalue in values:
+        if tvalue in "({[":
+            nesting += 1
+        if tvalue in ")}]":
+            nesting -= 1
+        if tvalue == "," and nesting == 0:
+            return True
+    return False
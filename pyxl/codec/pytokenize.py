@@ -30,6 +30,11 @@ the Pyxl decoder. Changes made:
     - When it encounters an unexpected dedent, the tokenizer does not
       raise an exception.
     - The Untokenizer class was heavily modified.
+    - Tokenization can be restarted at an earlier (or later) position by
+      throwing a Restart exception into the generator.
+    - The token patterns follow python 3 (string prefixes, numbers with
+      underscores, and operators like := and ->), and are combined in a
+      single regex that scans each line with one finditer.
 
 
 PYTHON SOFTWARE FOUNDATION LICENSE VERSION 2
@@ -85,7 +90,7 @@ __author__ = 'Ka-Ping Yee <ping@lfw.org>'
 __credits__ = ('GvR, ESR, Tim Peters, Thomas Wouters, Fred Drake, '
                'Skip Montanaro, Raymond Hettinger')
 
-import string, re
+import re
 from token import *
 
 import token
@@ -99,27 +104,30 @@ NL = N_TOKENS + 1
 tok_name[NL] = 'NL'
 N_TOKENS += 2
 
-def group(*choices): return '(' + '|'.join(choices) + ')'
-def any(*choices): return group(*choices) + '*'
+def group(*choices): return '(?:' + '|'.join(choices) + ')'
 def maybe(*choices): return group(*choices) + '?'
 
 Whitespace = r'[ \f\t]*'
 Comment = r'#[^\r\n]*'
-Ignore = Whitespace + any(r'\\\r?\n' + Whitespace) + maybe(Comment)
-Name = r'[a-zA-Z_]\w*'
+Name = r'\w+'
 
-Hexnumber = r'0[xX][\da-fA-F]+[lL]?'
-Octnumber = r'(0[oO][0-7]+)|(0[0-7]*)[lL]?'
-Binnumber = r'0[bB][01]+[lL]?'
-Decnumber = r'[1-9]\d*[lL]?'
+Hexnumber = r'0[xX](?:_?[0-9a-fA-F])+'
+Binnumber = r'0[bB](?:_?[01])+'
+Octnumber = r'0[oO](?:_?[0-7])+'
+Decnumber = r'(?:0(?:_?0)*|[1-9](?:_?[0-9])*)'
 Intnumber = group(Hexnumber, Binnumber, Octnumber, Decnumber)
-Exponent = r'[eE][-+]?\d+'
-Pointfloat = group(r'\d+\.\d*', r'\.\d+') + maybe(Exponent)
-Expfloat = r'\d+' + Exponent
+Exponent = r'[eE][-+]?[0-9](?:_?[0-9])*'
+Pointfloat = group(r'[0-9](?:_?[0-9])*\.(?:[0-9](?:_?[0-9])*)?',
+                   r'\.[0-9](?:_?[0-9])*') + maybe(Exponent)
+Expfloat = r'[0-9](?:_?[0-9])*' + Exponent
 Floatnumber = group(Pointfloat, Expfloat)
-Imagnumber = group(r'\d+[jJ]', Floatnumber + r'[jJ]')
+Imagnumber = group(r'[0-9](?:_?[0-9])*[jJ]', Floatnumber + r'[jJ]')
 Number = group(Imagnumber, Floatnumber, Intnumber)
 
+# Any of the string prefixes python 3 accepts, in any case.
+StringPrefix = r'(?:[bB][rR]?|[rR][bBfF]?|[uU]|[fF][rR]?)?'
+StringPrefixChars = 'bBrRuUfF'
+
 # Tail end of ' string.
 Single = r"[^'\\]*(?:\\.[^'\\]*)*'"
 # Tail end of " string.
@@ -128,75 +136,47 @@ Double = r'[^"\\]*(?:\\.[^"\\]*)*"'
 Single3 = r"[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''"
 # Tail end of """ string.
 Double3 = r'[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""'
-Triple = group("[uUbB]?[rR]?'''", '[uUbB]?[rR]?"""')
+Triple = StringPrefix + group("'''", '"""')
 # Single-line ' or " string.
-String = group(r"[uUbB]?[rR]?'[^\n'\\]*(?:\\.[^\n'\\]*)*'",
-               r'[uUbB]?[rR]?"[^\n"\\]*(?:\\.[^\n"\\]*)*"')
+String = StringPrefix + group(r"'[^\n'\\]*(?:\\.[^\n'\\]*)*'",
+                              r'"[^\n"\\]*(?:\\.[^\n"\\]*)*"')
+# First line of a ' or " string that is continued with a backslash.
+ContStr = StringPrefix + group(r"'[^\n'\\]*(?:\\.[^\n'\\]*)*\\\r?\n",
+                               r'"[^\n"\\]*(?:\\.[^\n"\\]*)*\\\r?\n')
 
 # Because of leftmost-then-longest match semantics, be sure to put the
 # longest operators first (e.g., if = came before ==, == would get
-# recognized as two instances of =).
-Operator = group(r"\*\*=?", r">>=?", r"<<=?", r"<>", r"!=",
-                 r"//=?",
-                 r"[+\-*/%&|^=<>]=?",
-                 r"~")
-
-Bracket = '[][(){}]'
-Special = group(r'\r?\n', r'[:;.,`@]')
-Funny = group(Operator, Bracket, Special)
-
-PlainToken = group(Number, Funny, String, Name)
-Token = Ignore + PlainToken
-
-# First (or only) line of ' or " string.
-ContStr = group(r"[uUbB]?[rR]?'[^\n'\\]*(?:\\.[^\n'\\]*)*" +
-                group("'", r'\\\r?\n'),
-                r'[uUbB]?[rR]?"[^\n"\\]*(?:\\.[^\n"\\]*)*' +
-                group('"', r'\\\r?\n'))
-PseudoExtras = group(r'\\\r?\n|\Z', Comment, Triple)
-PseudoToken = Whitespace + group(PseudoExtras, Number, Funny, ContStr, Name)
-
-tokenprog, pseudoprog, single3prog, double3prog = list(map(
-    re.compile, (Token, PseudoToken, Single3, Double3)))
+# recognized as two instances of =). <> and ` are kept from python 2, and
+# a dot that starts a number is left to Number.
+Operator = group(r"\*\*=?", r">>=?", r"<<=?", r"//=?", r"<>", r"!=", r"->", r":=",
+                 r"\.\.\.", r"[+\-*/%&|^=<>@]=?", r"[~:;,`]", r"\.(?!\d)")
+
+# PYXL MODIFICATION: the token patterns are combined in a single regex, with one group per kind
+# of token, so that a line is split into tokens by a single finditer, and each token is
+# dispatched on the index of the group that matched. The most common tokens come first; names
+# that could be string prefixes are left for after the strings. Any other character (including
+# whitespace that doesn't precede a token) is an error token, which pyxl relies on.
+PseudoToken = group(Whitespace + group(*['(%s)' % pattern for pattern in (
+    r'[^\W\d]\w*\b(?![\'"])',                               # 1
+    Operator,                                               # 2
+    r'[([{]',                                               # 3
+    r'[)\]}]',                                              # 4
+    r'\r?\n',                                               # 5
+    Number,                                                 # 6
+    StringPrefix + group("'''" + Single3, '"""' + Double3), # 7
+    Triple,                                                 # 8
+    String,                                                 # 9
+    ContStr,                                                # 10
+    Name,                                                   # 11
+    Comment,                                                # 12
+    r'\\\r?\n|\Z',                                          # 13
+)]), '(.)')                                                 # 14
+(_NAME, _OP, _OPEN, _CLOSE, _NEWLINE, _NUMBER, _TRIPLE, _TRIPLE_START, _STRING, _CONTSTR,
+ _PREFIX_NAME, _COMMENT, _CONTINUATION, _ERROR) = range(1, 15)
+
+pseudoprog = re.compile(PseudoToken)
 endprogs = {"'": re.compile(Single), '"': re.compile(Double),
-            "'''": single3prog, '"""': double3prog,
-            "r'''": single3prog, 'r"""': double3prog,
-            "u'''": single3prog, 'u"""': double3prog,
-            "ur'''": single3prog, 'ur"""': double3prog,
-            "R'''": single3prog, 'R"""': double3prog,
-            "U'''": single3prog, 'U"""': double3prog,
-            "uR'''": single3prog, 'uR"""': double3prog,
-            "Ur'''": single3prog, 'Ur"""': double3prog,
-            "UR'''": single3prog, 'UR"""': double3prog,
-            "b'''": single3prog, 'b"""': double3prog,
-            "br'''": single3prog, 'br"""': double3prog,
-            "B'''": single3prog, 'B"""': double3prog,
-            "bR'''": single3prog, 'bR"""': double3prog,
-            "Br'''": single3prog, 'Br"""': double3prog,
-            "BR'''": single3prog, 'BR"""': double3prog,
-            'r': None, 'R': None, 'u': None, 'U': None,
-            'b': None, 'B': None}
-
-triple_quoted = {}
-for t in ("'''", '"""',
-          "r'''", 'r"""', "R'''", 'R"""',
-          "u'''", 'u"""', "U'''", 'U"""',
-          "ur'''", 'ur"""', "Ur'''", 'Ur"""',
-          "uR'''", 'uR"""', "UR'''", 'UR"""',
-          "b'''", 'b"""', "B'''", 'B"""',
-          "br'''", 'br"""', "Br'''", 'Br"""',
-          "bR'''", 'bR"""', "BR'''", 'BR"""'):
-    triple_quoted[t] = t
-single_quoted = {}
-for t in ("'", '"',
-          "r'", 'r"', "R'", 'R"',
-          "u'", 'u"', "U'", 'U"',
-          "ur'", 'ur"', "Ur'", 'Ur"',
-          "uR'", 'uR"', "UR'", 'UR"',
-          "b'", 'b"', "B'", 'B"',
-          "br'", 'br"', "Br'", 'Br"',
-          "bR'", 'bR"', "BR'", 'BR"' ):
-    single_quoted[t] = t
+            "'''": re.compile(Single3), '"""': re.compile(Double3)}
 
 tabsize = 8
 
@@ -204,6 +184,17 @@ class TokenError(Exception): pass
 
 class StopTokenizing(Exception): pass
 
+# PYXL MODIFICATION
+class Restart(Exception):
+    """Throw into generate_tokens() to restart tokenization at (row, col). The row may be after
+    the lines read so far, in which case the lines in between are read without being tokenized.
+    The tokenizer starts over as if the text from there on was a new file, except that positions
+    still count from the start of the real one. The throw() call returns the first token after
+    the restart."""
+    def __init__(self, row, col):
+        super(Restart, self).__init__(row, col)
+        self.row, self.col = row, col
+
 def printtoken(type, token, srow_scol, erow_ecol, line): # for testing
     srow, scol = srow_scol
     erow, ecol = erow_ecol
@@ -314,155 +305,159 @@ def generate_tokens(readline):
     logical line; continuation lines are included.
     """
     lnum = parenlev = continued = 0
-    namechars, numchars = string.ascii_letters + '_', '0123456789'
     contstr, needcont = '', 0
     contline = None
     indents = [0]
 
-    while 1:                                   # loop over lines in stream
+    # PYXL MODIFICATION: keep the lines read so far, and the column to start the next one
+    # at, so that tokenization can be restarted
+    lines = []
+    start_col = 0
+
+    while 1:
         try:
-            line = readline()
-        except StopIteration:
-            line = ''
-        lnum += 1
-        pos, max = 0, len(line)
-
-        if contstr:                            # continued string
-            if not line:
-                # PYXL MODIFICATION: instead of raising an error here, we
-                # return the remainder of the file as an errortoken.
-                yield (ERRORTOKEN, contstr,
-                       strstart, (lnum, 0), contline + line)
-                contstr, needcont = '', 0
-                contline = None
-                return
-            endmatch = endprog.match(line)
-            if endmatch:
-                pos = end = endmatch.end(0)
-                yield (STRING, contstr + line[:end],
-                       strstart, (lnum, end), contline + line)
-                contstr, needcont = '', 0
-                contline = None
-            elif needcont and line[-2:] != '\\\n' and line[-3:] != '\\\r\n':
-                yield (ERRORTOKEN, contstr + line,
-                           strstart, (lnum, len(line)), contline)
-                contstr = ''
-                contline = None
-                continue
-            else:
-                contstr = contstr + line
-                contline = contline + line
-                continue
-
-        elif parenlev == 0 and not continued:  # new statement
-            if not line: break
-            column = 0
-            while pos < max:                   # measure leading whitespace
-                if line[pos] == ' ':
-                    column += 1
-                elif line[pos] == '\t':
-                    column = (column//tabsize + 1)*tabsize
-                elif line[pos] == '\f':
-                    column = 0
-                else:
-                    break
-                pos += 1
-            if pos == max:
-                break
-
-            if line[pos] in '#\r\n':           # skip comments or blank lines
-                if line[pos] == '#':
-                    comment_token = line[pos:].rstrip('\r\n')
-                    nl_pos = pos + len(comment_token)
-                    yield (COMMENT, comment_token,
-                           (lnum, pos), (lnum, pos + len(comment_token)), line)
-                    yield (NL, line[nl_pos:],
-                           (lnum, nl_pos), (lnum, len(line)), line)
-                else:
-                    yield ((NL, COMMENT)[line[pos] == '#'], line[pos:],
-                           (lnum, pos), (lnum, len(line)), line)
-                continue
-
-            if column > indents[-1]:           # count indents or dedents
-                indents.append(column)
-                yield (INDENT, line[:pos], (lnum, 0), (lnum, pos), line)
-            while column < indents[-1]:
-                if column not in indents:
-                    # PYXL MODIFICATION: instead of raising an error here, we
-                    # emit an empty dedent token, which has no effect on
-                    # the decoded file.
-                    pass
-                indents = indents[:-1]
-                yield (DEDENT, '', (lnum, pos), (lnum, pos), line)
-
-        else:                                  # continued statement
-            if not line:
-                # PYXL MODIFICATION: instead of raising an error here, we
-                # return as if successful.
-                return
-            continued = 0
-
-        while pos < max:
-            pseudomatch = pseudoprog.match(line, pos)
-            if pseudomatch:                                # scan for tokens
-                start, end = pseudomatch.span(1)
-                spos, epos, pos = (lnum, start), (lnum, end), end
-                if start == end:
-                    continue
-                token, initial = line[start:end], line[start]
-
-                if initial in numchars or \
-                   (initial == '.' and token != '.'):      # ordinary number
-                    yield (NUMBER, token, spos, epos, line)
-                elif initial in '\r\n':
-                    yield (NL if parenlev > 0 else NEWLINE,
-                           token, spos, epos, line)
-                elif initial == '#':
-                    assert not token.endswith("\n")
-                    yield (COMMENT, token, spos, epos, line)
-                elif token in triple_quoted:
-                    endprog = endprogs[token]
-                    endmatch = endprog.match(line, pos)
-                    if endmatch:                           # all on one line
-                        pos = endmatch.end(0)
-                        token = line[start:pos]
-                        yield (STRING, token, spos, (lnum, pos), line)
+            while 1:                                   # loop over lines in stream
+                # PYXL MODIFICATION: a restart can skip lines that weren't read yet
+                while lnum >= len(lines):
+                    try:
+                        line = readline()
+                    except StopIteration:
+                        line = ''
+                    lines.append(line)
+                line = lines[lnum]
+                lnum += 1
+                pos, max = start_col, len(line)
+                start_col = 0
+
+                if contstr:                            # continued string
+                    if not line:
+                        # PYXL MODIFICATION: instead of raising an error here, we
+                        # return the remainder of the file as an errortoken.
+                        yield (ERRORTOKEN, contstr,
+                               strstart, (lnum, 0), contline + line)
+                        contstr, needcont = '', 0
+                        contline = None
+                        return
+                    endmatch = endprog.match(line)
+                    if endmatch:
+                        pos = end = endmatch.end(0)
+                        yield (STRING, contstr + line[:end],
+                               strstart, (lnum, end), contline + line)
+                        contstr, needcont = '', 0
+                        contline = None
+                    elif needcont and line[-2:] != '\\\n' and line[-3:] != '\\\r\n':
+                        yield (ERRORTOKEN, contstr + line,
+                                   strstart, (lnum, len(line)), contline)
+                        contstr = ''
+                        contline = None
+                        continue
                     else:
-                        strstart = (lnum, start)           # multiple lines
-                        contstr = line[start:]
-                        contline = line
-                        break
-                elif initial in single_quoted or \
-                    token[:2] in single_quoted or \
-                    token[:3] in single_quoted:
-                    if token[-1] == '\n':                  # continued string
-                        strstart = (lnum, start)
-                        endprog = (endprogs[initial] or endprogs[token[1]] or
-                                   endprogs[token[2]])
-                        contstr, needcont = line[start:], 1
-                        contline = line
+                        contstr = contstr + line
+                        contline = contline + line
+                        continue
+
+                elif parenlev == 0 and not continued:  # new statement
+                    if not line: break
+                    line_start = pos
+                    pos = max - len(line[pos:].lstrip(' \t\f'))
+                    column = pos - line_start
+                    if '\t' in line[line_start:pos] or '\f' in line[line_start:pos]:
+                        column = 0                     # measure leading whitespace
+                        for char in line[line_start:pos]:
+                            if char == ' ':
+                                column += 1
+                            elif char == '\t':
+                                column = (column//tabsize + 1)*tabsize
+                            else:
+                                column = 0
+                    if pos == max:
                         break
-                    else:                                  # ordinary string
-                        yield (STRING, token, spos, epos, line)
-                elif initial in namechars:                 # ordinary name
-                    yield (NAME, token, spos, epos, line)
-                elif initial == '\\':                      # continued stmt
-                    yield (OP, initial, spos, epos, line)
-                    continued = 1
-                else:
-                    if initial in '([{':
+
+                    if line[pos] in '#\r\n':           # skip comments or blank lines
+                        if line[pos] == '#':
+                            comment_token = line[pos:].rstrip('\r\n')
+                            nl_pos = pos + len(comment_token)
+                            yield (COMMENT, comment_token,
+                                   (lnum, pos), (lnum, pos + len(comment_token)), line)
+                            yield (NL, line[nl_pos:],
+                                   (lnum, nl_pos), (lnum, len(line)), line)
+                        else:
+                            yield ((NL, COMMENT)[line[pos] == '#'], line[pos:],
+                                   (lnum, pos), (lnum, len(line)), line)
+                        continue
+
+                    if column > indents[-1]:           # count indents or dedents
+                        indents.append(column)
+                        yield (INDENT, line[line_start:pos],
+                               (lnum, line_start), (lnum, pos), line)
+                    while column < indents[-1]:
+                        if column not in indents:
+                            # PYXL MODIFICATION: instead of raising an error here, we
+                            # emit an empty dedent token, which has no effect on
+                            # the decoded file.
+                            pass
+                        indents = indents[:-1]
+                        yield (DEDENT, '', (lnum, pos), (lnum, pos), line)
+
+                else:                                  # continued statement
+                    if not line:
+                        # PYXL MODIFICATION: instead of raising an error here, we
+                        # return as if successful.
+                        return
+                    continued = 0
+
+                for pseudomatch in pseudoprog.finditer(line, pos):  # scan for tokens
+                    kind = pseudomatch.lastindex
+                    start, end = pseudomatch.span(kind)
+                    if start == end:
+                        continue
+                    spos, epos = (lnum, start), (lnum, end)
+
+                    if kind == _NAME or kind == _PREFIX_NAME:      # ordinary name
+                        yield (NAME, line[start:end], spos, epos, line)
+                    elif kind == _OP:
+                        yield (OP, line[start:end], spos, epos, line)
+                    elif kind == _OPEN:
                         parenlev += 1
-                    elif initial in ')]}':
+                        yield (OP, line[start], spos, epos, line)
+                    elif kind == _CLOSE:
                         parenlev -= 1
-                    yield (OP, token, spos, epos, line)
-            else:
-                yield (ERRORTOKEN, line[pos],
-                           (lnum, pos), (lnum, pos+1), line)
-                pos += 1
-
-    for indent in indents[1:]:                 # pop remaining indent levels
-        yield (DEDENT, '', (lnum, 0), (lnum, 0), '')
-    yield (ENDMARKER, '', (lnum, 0), (lnum, 0), '')
+                        yield (OP, line[start], spos, epos, line)
+                    elif kind == _NEWLINE:
+                        yield (NL if parenlev > 0 else NEWLINE,
+                               line[start:end], spos, epos, line)
+                    elif kind == _STRING or kind == _TRIPLE:       # ordinary string
+                        yield (STRING, line[start:end], spos, epos, line)
+                    elif kind == _NUMBER:                          # ordinary number
+                        yield (NUMBER, line[start:end], spos, epos, line)
+                    elif kind == _COMMENT:
+                        yield (COMMENT, line[start:end], spos, epos, line)
+                    elif kind == _ERROR:
+                        yield (ERRORTOKEN, line[start], spos, epos, line)
+                    elif kind == _CONTINUATION:                    # continued stmt
+                        yield (OP, line[start], spos, epos, line)
+                        continued = 1
+                    else:                                          # multiple lines
+                        strstart = spos
+                        contstr = line[start:]
+                        contline = line
+                        if kind == _TRIPLE_START:
+                            endprog = endprogs[line[end-3:end]]
+                        else:                                      # continued string
+                            endprog = endprogs[contstr.lstrip(StringPrefixChars)[0]]
+                            needcont = 1
+                        break
+
+            for indent in indents[1:]:                 # pop remaining indent levels
+                yield (DEDENT, '', (lnum, 0), (lnum, 0), '')
+            yield (ENDMARKER, '', (lnum, 0), (lnum, 0), '')
+            return
+        except Restart as restart:
+            lnum, start_col = restart.row - 1, restart.col
+            parenlev = continued = 0
+            contstr, needcont = '', 0
+            contline = None
+            indents = [0]
 
 if __name__ == '__main__':                     # testing
     import sys
@@ -0,0 +1,24 @@
+import codecs
+
+
+def search_function(encoding):
+    if encoding != 'pyxl': return None
+
+    import encodings
+    from pyxl.codec.transform import (
+        pyxl_decode, PyxlIncrementalDecoderStatic, PyxlStreamReaderStatic,
+    )
+
+    # Assume utf8 encoding
+    utf8=encodings.search_function('utf8')
+    return codecs.CodecInfo(
+        name = 'pyxl',
+        encode = utf8.encode,
+        decode = lambda b: pyxl_decode(b, static_html=True),
+        incrementalencoder = utf8.incrementalencoder,
+        incrementaldecoder = PyxlIncrementalDecoderStatic,
+        streamreader = PyxlStreamReaderStatic,
+        streamwriter = utf8.streamwriter)
+
+
+codecs.register(search_function)
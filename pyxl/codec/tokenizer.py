@@ -1,6 +1,7 @@
 from . import pytokenize as tokenize
+import bisect
+import inspect
 import re
-from io import StringIO
 from pyxl.codec.parser import PyxlParser
 from .pytokenize import Untokenizer
 import ast
@@ -21,6 +22,81 @@ class PyxlUnfinished(Exception): pass
 class PyxlParseError(Exception): pass
 
 
+# The tokens after which a '<' starts pyxl
+PYXL_PREFIXES = frozenset([(tokenize.OP, value) for value in ('=', '(', '[', '{', ',', ':', ':=')] +
+                          [(tokenize.NAME, value) for value in ('print', 'else', 'yield', 'return')])
+
+
+def may_start_pyxl(last_nw_token):
+    """Whether a '<' after last_nw_token (None at the start of the input) starts pyxl."""
+    return last_nw_token is None or (last_nw_token[0], last_nw_token[1]) in PYXL_PREFIXES
+
+
+# What scan_python looks at: strings, comments, brackets, backslash continuations, line ends and
+# '<'. A quote that doesn't start a string closed on the same line (or a triple-quoted one closed
+# at all) is an unclosed_string.
+_PYTHON_SCAN = re.compile(r"""
+    (?P<string>'''(?:[^'\\]|\\.|'(?!''))*''' | \"\"\"(?:[^"\\]|\\.|"(?!""))*\"\"\"
+             | '(?:[^'\\\n]|\\.)*' | "(?:[^"\\\n]|\\.)*")
+    | (?P<unclosed_string>['"])
+    | (?P<comment>\#[^\n]*)
+    | (?P<open>[(\[{]) | (?P<close>[)\]}])
+    | (?P<continuation>\\\r?\n)
+    | (?P<newline>\n)
+    | (?P<tag><)
+""", re.VERBOSE | re.DOTALL)
+
+_PREFIX_WORD = re.compile(r'\b(?:print|else|yield|return)\Z')
+
+
+def _ends_with_prefix(code):
+    code = code.rstrip()
+    return code[-1] in '=,:' or _PREFIX_WORD.search(code) is not None
+
+
+def scan_python(text, pos, after_prefix):
+    """Find how much of the python code in text from pos (the start of a line, outside of any
+    brackets or strings) can't contain pyxl.
+
+    This only looks for strings, comments, brackets and line ends, which is much cheaper than
+    tokenizing. A '<' that might follow one of PYXL_PREFIXES (after_prefix tells if the code
+    before pos ended with one) ends the scan, and so does a string that isn't closed.
+
+    Returns the offset in text of the last line start found before that, outside of brackets and
+    strings, and not after one of PYXL_PREFIXES; so that tokenizing can restart there with any
+    other token as the previous one. That's the end of text if it contains no pyxl at all, or
+    pos if nothing could be skipped.
+    """
+    end = pos
+    depth = 0
+    for match in _PYTHON_SCAN.finditer(text, pos):
+        start = match.start()
+        if start > pos and not text[pos:start].isspace():
+            after_prefix = _ends_with_prefix(text[pos:start])
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'newline':
+            if depth == 0 and not after_prefix:
+                end = pos
+        elif kind == 'open':
+            depth += 1
+            after_prefix = True
+        elif kind == 'close':
+            depth -= 1
+            after_prefix = False
+        elif kind == 'string':
+            after_prefix = False
+        elif kind == 'tag':
+            if after_prefix:
+                return end
+            after_prefix = False
+        elif kind == 'unclosed_string':
+            return end
+    if depth == 0 and (pos == len(text) or not text[pos:].rstrip().endswith('\\')):
+        return len(text)
+    return end
+
+
 def get_end_pos(start_pos, tvalue):
     row, col = start_pos
     for c in tvalue:
@@ -37,70 +113,105 @@ class RewindableTokenStream(object):
     A token stream, with the ability to rewind and restart tokenization while maintaining correct
     token position information.
 
+    Rewinding restarts the underlying tokenizer in place, at the position of the rewound token, so
+    only the text from there on is tokenized again.
+
     Invariants:
-        - zero_row and zero_col are the correct values to adjust the line and possibly column of the
-        tokens being produced by _tokens.
         - Tokens in unshift_buffer have locations with absolute position (relative to the beginning
-          of the file, not relative to where we last restarted tokenization).
+          of the file).
+
+    If a profile (see pyxl.codec.transform.TransformProfile) is given, tokenization and rewinds
+    are timed and counted in it.
+
+    If a fragments dict is given, the python fragments of each pyxl block are stored in it, keyed
+    by the start of the block, along with where their code is in the block's code (see
+    pyxl.codec.compiler).
+
+    The whole input is read up front, so that skip_python can look ahead of the tokenizer.
     """
 
-    def __init__(self, readline):
-        self.orig_readline = readline
+    def __init__(self, readline, profile=None, fragments=None):
+        self.profile = profile
+        self.fragments = fragments
         self.unshift_buffer = []
-        self.rewound_buffer = None
-        self._tokens = tokenize.generate_tokens(self._readline)
-        self.zero_row, self.zero_col = (0, 0)
-        self.stop_readline = False
+        self.lines = []
+        while True:
+            try:
+                line = readline()
+            except StopIteration:
+                break
+            if not line:
+                break
+            self.lines.append(line)
+        self._text = self._line_offsets = None
+        self._tokens = tokenize.generate_tokens(iter(self.lines).__next__)
+        self._next_token = self._tokens.__next__
+        if profile is not None:
+            self._next_token = profile.wrap(self._next_token, 'tokenize', 'tokens')
 
     def _dumpstate(self):
         print("tokenizer state:")
-        print("  zero:", (self.zero_row, self.zero_col))
-        print("  rewound_buffer:", self.rewound_buffer)
         print("  unshift_buffer:", self.unshift_buffer)
 
-    def _readline(self):
-        if self.stop_readline:
-            return ""
-        if self.rewound_buffer:
-            line = self.rewound_buffer.readline()
-            if line:
-                return line
-            else:
-                self.rewound_buffer = None  # fallthrough to orig_readline
-        return self.orig_readline()
-
-    def _flush(self):
-        self.stop_readline = True
-        tokens = list(tok for tok in self)
-        self.stop_readline = False
-        return tokens
-
-    def _adjust_position(self, pos):
-        row, col = pos
-        if row == 1:  # rows are 1-indexed
-            col += self.zero_col
-        row += self.zero_row
-        return Pos(row, col)
+    def _restart(self, row, col):
+        try:
+            self.unshift_buffer = [fix_token(self._tokens.throw(tokenize.Restart(row, col)))]
+        except StopIteration:
+            self.unshift_buffer = []
 
     def rewind_and_retokenize(self, rewind_token):
         """Rewind the given token (which is expected to be the last token read from this stream, or
         the end of such token); then restart tokenization."""
-        ttype, tvalue, (row, col), tend, tline = rewind_token
-        tokens = [rewind_token] + self._flush()
-        self.zero_row, self.zero_col = (row - 1, col)  # rows are 1-indexed, cols are 0-indexed
-        self.rewound_buffer = StringIO(Untokenizer().untokenize(tokens))
-        self.unshift_buffer = []
-        self._tokens = tokenize.generate_tokens(self._readline)
+        if self.profile is not None:
+            self.profile.count('rewinds')
+            self.profile.start('retokenize')
+        row, col = rewind_token[2]
+        self._restart(row, col)
+        if self.profile is not None:
+            self.profile.stop()
+
+    def skip_python(self, row, after_prefix):
+        """Skip over the python code from the start of the given row, as far as scan_python can
+        tell that it contains no pyxl. row must be the next one to be tokenized, and start outside
+        of any brackets or strings; after_prefix tells if the last token before it was one of
+        PYXL_PREFIXES.
+
+        Returns a single NL token with the text that was skipped, which the untokenizer copies
+        as is, or None if nothing could be skipped.
+        """
+        if self.unshift_buffer or row > len(self.lines):
+            return None
+        if self._text is None:
+            self._text = ''.join(self.lines)
+            self._line_offsets = [0]
+            for line in self.lines:
+                self._line_offsets.append(self._line_offsets[-1] + len(line))
+
+        if self.profile is not None:
+            self.profile.start('prescan')
+        start = self._line_offsets[row - 1]
+        end = scan_python(self._text, start, after_prefix)
+        if self.profile is not None:
+            self.profile.stop()
+        if end == start:
+            return None
+
+        # the scan stops at a line start, or at the end of the input
+        end_row = bisect.bisect_left(self._line_offsets, end) + 1
+        if self.profile is not None:
+            self.profile.count('skipped_lines', end_row - row)
+        if inspect.getgeneratorstate(self._tokens) == inspect.GEN_CREATED:
+            next(self._tokens)
+        self._restart(end_row, 0)
+
+        # an NL token leaves the untokenizer at the start of the row after the one it ends on
+        return Token(tokenize.NL, self._text[start:end], Pos(row, 0), Pos(end_row - 1, 0), '')
 
     def __next__(self):
         if self.unshift_buffer:
-            token = self.unshift_buffer.pop(0)
-        else:
-            ttype, tvalue, tstart, tend, tline = next(self._tokens)
-            tstart = self._adjust_position(tstart)
-            tend = self._adjust_position(tend)
-            token = Token(ttype, tvalue, tstart, tend, tline)
-        return token
+            return self.unshift_buffer.pop(0)
+        ttype, tvalue, tstart, tend, tline = self._next_token()
+        return Token(ttype, tvalue, Pos(*tstart), Pos(*tend), tline)
 
     def __iter__(self):
         return self
@@ -128,12 +239,14 @@ def pyxl_untokenize(tokens):
     return Untokenizer(1, 0).untokenize(tokens)
 
 
-def pyxl_tokenize(readline, invertible=False, str_function='str'):
-    return cleanup_tokens(transform_tokens(RewindableTokenStream(readline), invertible, str_function))
+def pyxl_tokenize(readline, invertible=False, str_function='str', static_html=False,
+                  profile=None, trusted=False):
+    return cleanup_tokens(transform_tokens(RewindableTokenStream(readline, profile), invertible,
+                                           str_function, static_html, trusted, toplevel=True))
 
 
-def pyxl_invert_tokenize(readline):
-    return cleanup_tokens(invert_tokens(RewindableTokenStream(readline)))
+def pyxl_invert_tokenize(readline, profile=None):
+    return cleanup_tokens(invert_tokens(RewindableTokenStream(readline, profile)))
 
 
 def cleanup_tokens(tokens):
@@ -149,11 +262,26 @@ def cleanup_tokens(tokens):
         yield token
 
 
-def transform_tokens(tokens, invertible, str_function):
+def transform_tokens(tokens, invertible, str_function, static_html=False, trusted=False,
+                     toplevel=False):
+    """Transform the pyxl in a token stream.
+
+    At the top level of a file (rather than in a python fragment of pyxl), the python code up to
+    the next possible pyxl is copied as is after each statement, instead of being tokenized (see
+    RewindableTokenStream.skip_python).
+    """
     last_nw_token = None
     prev_token = None
 
     curly_depth = 0
+    # brackets opened at the top level, which the tokenizer loses track of when it restarts
+    bracket_depth = 0
+
+    if toplevel:
+        skipped = tokens.skip_python(1, True)
+        if skipped is not None:
+            yield skipped
+            last_nw_token = skipped
 
     while 1:
         try:
@@ -171,19 +299,9 @@ def transform_tokens(tokens, invertible, str_function):
                 tokens.unshift(token)
                 return
 
-        if (ttype == tokenize.OP and tvalue == '<' and
-            (last_nw_token == None or # if we have *just* entered python mode e.g
-             (last_nw_token[0] == tokenize.OP and last_nw_token[1] == '=') or
-             (last_nw_token[0] == tokenize.OP and last_nw_token[1] == '(') or
-             (last_nw_token[0] == tokenize.OP and last_nw_token[1] == '[') or
-             (last_nw_token[0] == tokenize.OP and last_nw_token[1] == '{') or
-             (last_nw_token[0] == tokenize.OP and last_nw_token[1] == ',') or
-             (last_nw_token[0] == tokenize.OP and last_nw_token[1] == ':') or
-             (last_nw_token[0] == tokenize.NAME and last_nw_token[1] == 'print') or
-             (last_nw_token[0] == tokenize.NAME and last_nw_token[1] == 'else') or
-             (last_nw_token[0] == tokenize.NAME and last_nw_token[1] == 'yield') or
-             (last_nw_token[0] == tokenize.NAME and last_nw_token[1] == 'return'))):
-            token = get_pyxl_token(token, tokens, invertible, str_function)
+        if ttype == tokenize.OP and tvalue == '<' and may_start_pyxl(last_nw_token):
+            token = get_pyxl_token(token, tokens, invertible, str_function, static_html,
+                                   trusted)
 
         if ttype not in (tokenize.INDENT,
                          tokenize.DEDENT,
@@ -195,6 +313,18 @@ def transform_tokens(tokens, invertible, str_function):
         prev_token = token
         yield token
 
+        if toplevel:
+            if ttype == tokenize.OP and tvalue in '([{':
+                bracket_depth += 1
+            elif ttype == tokenize.OP and tvalue in ')]}':
+                bracket_depth -= 1
+            elif ttype in (tokenize.NEWLINE, tokenize.NL) and bracket_depth == 0:
+                skipped = tokens.skip_python(tend.row + 1, may_start_pyxl(last_nw_token))
+                if skipped is not None:
+                    yield skipped
+                    # any token that isn't one of PYXL_PREFIXES
+                    last_nw_token = prev_token = skipped
+
 
 def sanitize_token(token):
     """Escape brackets in a token that is going to be put in a format string"""
@@ -205,9 +335,17 @@ def sanitize_token(token):
         return token
 
 
-def get_pyxl_token(start_token, tokens, invertible, str_function):
+def get_pyxl_token(start_token, tokens, invertible, str_function, static_html=False,
+                   trusted=False):
     ttype, tvalue, tstart, tend, tline = start_token
-    pyxl_parser = PyxlParser(tstart.row, tstart.col, str_function)
+    pyxl_parser = PyxlParser(tstart.row, tstart.col, str_function, static_html, trusted)
+    if tokens.profile is not None:
+        tokens.profile.count('pyxl_blocks')
+        tokens.profile.instrument(pyxl_parser, 'parse', ('feed', 'feed_position_only',
+                                                         'feed_python', 'feed_comment',
+                                                         'get_token'))
+    if tokens.fragments is not None:
+        pyxl_parser.fragments = tokens.fragments[tstart] = []
     pyxl_parser.feed(start_token)
 
     if invertible:
@@ -222,13 +360,16 @@ def get_pyxl_token(start_token, tokens, invertible, str_function):
         if tvalue and tvalue[0] == '{':
             if pyxl_parser.python_mode_allowed():
                 # We've hit a python fragment
+                if tokens.profile is not None:
+                    tokens.profile.count('python_regions')
                 initial_tstart = tstart
 
                 mid, right = tvalue[0], tvalue[1:]
                 division = get_end_pos(tstart, mid)
                 pyxl_parser.feed_position_only(Token(ttype, mid, tstart, division, tline))
                 tokens.rewind_and_retokenize(Token(ttype, right, division, tend, tline))
-                python_tokens = list(transform_tokens(tokens, invertible, str_function))
+                python_tokens = list(transform_tokens(tokens, invertible, str_function,
+                                                      static_html, trusted))
 
                 close_curly = next(tokens)
                 ttype, tvalue, tstart, tend, tline = close_curly
@@ -390,6 +531,10 @@ def strip_comments(tokens):
 
 
 def invert_tokens(tokens):
+    fix_indent = try_fixing_indent
+    if tokens.profile is not None:
+        fix_indent = tokens.profile.wrap(try_fixing_indent, 'fix_indent')
+
     saved_tokens = []
 
     curly_depth = 0
@@ -419,6 +564,8 @@ def invert_tokens(tokens):
             saved_tokens.append(token)
             continue
         if ttype == tokenize.OP and tvalue == '(' and len(saved_tokens) == 3:
+            if tokens.profile is not None:
+                tokens.profile.count('pyxl_blocks')
             start_depth.append(curly_depth)
             curly_depth += 1
             in_pyxl.append(saved_tokens[0].start)
@@ -476,7 +623,7 @@ def invert_tokens(tokens):
                 # they were at in the original source. (The final pyxl literal will then
                 # be shifted from its original column to its new column.)
                 diff = new_start[1] - orig_start_col
-                args = [try_fixing_indent(untokenize(buf), orig_pos - real_pos)
+                args = [fix_indent(untokenize(buf), orig_pos - real_pos)
                         for buf, orig_pos, real_pos
                         in zip(real_arg_buffers, orig_poses, real_poses)]
 
@@ -486,8 +633,8 @@ def invert_tokens(tokens):
                 # string, since we skip aligning those with the final
                 first_lines = fmt.split('\n')[0].format(*args).count('\n') + 1
                 # and then try to repair its internal indentation if the start position shifted
-                fixed_pyxl = try_fixing_indent(raw_pyxl, new_start[1] - orig_start_col,
-                                               align_to=orig_start_col, first_lines=first_lines)
+                fixed_pyxl = fix_indent(raw_pyxl, new_start[1] - orig_start_col,
+                                        align_to=orig_start_col, first_lines=first_lines)
 
                 if reparenthesize:
                     # Insert parentheses back around the formatted pyxl
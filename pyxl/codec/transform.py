@@ -1,15 +1,174 @@
+import ast
 import codecs, io, encodings
+import concurrent.futures
+import json
+import os
+import re
 import sys
+import time
 import traceback
+from collections import namedtuple
 from encodings import utf_8
+from pyxl.codec.cache import get_default_cache
 from pyxl.codec.tokenizer import (
     pyxl_invert_tokenize, pyxl_tokenize, pyxl_untokenize,
     PyxlUnfinished,
 )
 
-def pyxl_transform(stream, invertible=False, str_function='str'):
+class TransformProfile(object):
+    """
+    Timings and counters of a single transform (or invert).
+
+    Timers are exclusive: time spent in a stage started while another one is running is only
+    counted against the inner stage, so the timers add up to the total. The stages are:
+        prescan: looking for python code that can be copied without tokenizing it
+        tokenize: the python tokenizer
+        retokenize: rewinding the token stream and restarting the tokenizer
+        parse: PyxlParser
+        transform: everything else between the tokenizer and the untokenizer
+        fix_indent: re-indenting pyxl literals (invert only)
+        untokenize: producing the output from the transformed tokens
+
+    The counters are tokens (produced by the python tokenizer), rewinds, skipped_lines (copied
+    without tokenizing them), pyxl_blocks and python_regions ({} expressions inside pyxl).
+    """
+
+    def __init__(self, filename=None, mode='transform'):
+        self.filename = filename
+        self.mode = mode
+        self.timers = {}
+        self.counters = {}
+        self.total = 0.0
+        self.error = None
+        self._stack = []  # [stage, start time, time spent in nested stages]
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def start(self, stage):
+        self._stack.append([stage, time.perf_counter(), 0.0])
+
+    def stop(self):
+        stage, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.timers[stage] = self.timers.get(stage, 0.0) + elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def wrap(self, func, stage, counter=None):
+        """Return func, timed as stage. If a counter is given, successful calls are counted in
+        it."""
+        def timed(*args, **kwargs):
+            self.start(stage)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self.stop()
+            if counter is not None:
+                self.count(counter)
+            return result
+        return timed
+
+    def instrument(self, obj, stage, methods):
+        """Time the given methods of obj as stage."""
+        for method in methods:
+            setattr(obj, method, self.wrap(getattr(obj, method), stage))
+
+    def as_dict(self):
+        return {
+            'filename': self.filename,
+            'mode': self.mode,
+            'total': self.total,
+            'timers': dict(self.timers),
+            'counters': dict(self.counters),
+            'error': self.error,
+        }
+
+    def report(self):
+        lines = ['pyxl %s of %s: %.2f ms%s' % (
+            self.mode, self.filename or '<string>', self.total * 1000,
+            ' (failed: %s)' % self.error if self.error else '')]
+        for stage, elapsed in sorted(self.timers.items(), key=lambda item: -item[1]):
+            lines.append('  %-12s %9.2f ms %5.1f%%' % (
+                stage, elapsed * 1000, 100 * elapsed / self.total if self.total else 0))
+        lines.append('  ' + ', '.join('%s: %d' % item for item in sorted(self.counters.items())))
+        return '\n'.join(lines)
+
+
+_profile_hooks = []
+
+
+def add_profile_hook(callback):
+    """Profile every transform and invert, and call callback with the TransformProfile of each
+    when it's done."""
+    _profile_hooks.append(callback)
+
+
+def remove_profile_hook(callback):
+    _profile_hooks.remove(callback)
+
+
+def _profile_destination():
+    """PYXL_PROFILE, or None if it's unset, empty or 0."""
+    destination = os.environ.get('PYXL_PROFILE')
+    if destination in (None, '', '0'):
+        return None
+    return destination
+
+
+def _report_to_environment(profile, destination):
+    """PYXL_PROFILE=1 prints a report of each transform to stderr; PYXL_PROFILE=path appends
+    them to that file as JSON lines. A report that can't be written doesn't fail the transform."""
+    if destination == '1':
+        print(profile.report(), file=sys.stderr)
+        return
+    try:
+        with open(destination, 'a') as f:
+            f.write(json.dumps(profile.as_dict()) + '\n')
+    except OSError as e:
+        print('pyxl: could not write the profile to %s: %s' % (destination, e), file=sys.stderr)
+
+
+def _run_profiled(tokenize, filename, mode):
+    """Run tokenize(profile) and untokenize the result, profiling both if anyone is listening."""
+    destination = _profile_destination()
+    if not _profile_hooks and destination is None:
+        return pyxl_untokenize(tokenize(None))
+
+    profile = TransformProfile(filename, mode)
+    start = time.perf_counter()
     try:
-        output = pyxl_untokenize(pyxl_tokenize(stream.readline, invertible, str_function))
+        profile.start(mode)
+        tokens = list(tokenize(profile))
+        profile.stop()
+        profile.start('untokenize')
+        output = pyxl_untokenize(tokens)
+        profile.stop()
+    except Exception as ex:
+        profile.error = '%s: %s' % (type(ex).__name__, ex)
+        raise
+    finally:
+        del profile._stack[:]
+        profile.total = time.perf_counter() - start
+        if destination is not None:
+            _report_to_environment(profile, destination)
+        for callback in list(_profile_hooks):
+            # a broken hook mustn't change the outcome of the transform, nor starve the others
+            try:
+                callback(profile)
+            except Exception as e:
+                print('pyxl: profile hook %r failed: %s: %s' % (callback, type(e).__name__, e),
+                      file=sys.stderr)
+    return output
+
+
+def pyxl_transform(stream, invertible=False, str_function='str', static_html=False,
+                   filename=None, trusted=False):
+    try:
+        output = _run_profiled(
+            lambda profile: pyxl_tokenize(stream.readline, invertible, str_function, static_html,
+                                          profile, trusted),
+            filename or getattr(stream, 'name', None), 'transform')
     except Exception as ex:
         print(ex)
         traceback.print_exc()
@@ -18,9 +177,11 @@ def pyxl_transform(stream, invertible=False, str_function='str'):
     return output
 
 
-def pyxl_invert(stream):
+def pyxl_invert(stream, filename=None):
     try:
-        output = pyxl_untokenize(pyxl_invert_tokenize(stream.readline))
+        output = _run_profiled(
+            lambda profile: pyxl_invert_tokenize(stream.readline, profile),
+            filename or getattr(stream, 'name', None), 'invert')
     except PyxlUnfinished:
         raise
     except Exception as ex:
@@ -31,49 +192,329 @@ def pyxl_invert(stream):
     return output
 
 
-def pyxl_transform_string(input, invertible=False, str_function='str'):
+def pyxl_transform_string(input, invertible=False, str_function='str', static_html=False,
+                          filename=None, trusted=False):
     stream = io.StringIO(input)
-    return pyxl_transform(stream, invertible, str_function)
+    return pyxl_transform(stream, invertible, str_function, static_html, filename, trusted)
+
+
+def pyxl_transform_string_cached(input, invertible=False, str_function='str', static_html=False,
+                                 cache=None, filename=None, trusted=False):
+    """Like pyxl_transform_string, but goes through the transform cache.
+
+    If no cache is passed, the one configured by the environment is used (see pyxl.codec.cache).
+    """
+    return _transform_cached(pyxl_transform_string, input, invertible, str_function, static_html,
+                             cache, filename, trusted)
+
+
+def _transform_cached(transform, input, invertible, str_function, static_html, cache, filename,
+                      trusted):
+    if cache is None:
+        cache = get_default_cache()
+        if cache is None:
+            return transform(input, invertible, str_function, static_html, filename, trusted)
+
+    key = cache.key(input, invertible, str_function, static_html, trusted)
+    output = cache.get(key)
+    if output is None:
+        output = transform(input, invertible, str_function, static_html, filename, trusted)
+        cache.put(key, output)
+    return output
+
+
+def _transform_string_quietly(input, invertible, str_function, static_html, filename, trusted):
+    """pyxl_transform_string, without printing errors (the caller reports them)."""
+    return _run_profiled(
+        lambda profile: pyxl_tokenize(io.StringIO(input).readline, invertible, str_function,
+                                      static_html, profile, trusted),
+        filename, 'transform')
+
+
+def _invert_string_quietly(input, filename=None):
+    """pyxl_invert_string, without printing errors."""
+    return _run_profiled(
+        lambda profile: pyxl_invert_tokenize(io.StringIO(input).readline, profile),
+        filename, 'invert')
+
+
+# PEP 263
+_COOKIE_RE = re.compile(r'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+
+
+def strip_cookie(source):
+    """Blank out the pyxl coding cookie, keeping line numbers unchanged."""
+    lines = source.split('\n', 2)
+    for i, line in enumerate(lines[:2]):
+        match = _COOKIE_RE.match(line)
+        if match:
+            if match.group(1) == 'pyxl':
+                lines[i] = ''
+            break
+    return '\n'.join(lines)
+
+
+TransformResult = namedtuple('TransformResult', ['path', 'output', 'error'])
+TransformResult.__doc__ = """The result of one input of transform_many.
 
+path is None for an input given as source. output is None if the transform failed, in which case
+error is the exception it raised.
+"""
 
-def pyxl_invert_string(input):
+
+def _transform_one(source, path, out_path, invertible, str_function, static_html, trusted):
+    """Transform one input of transform_many, and write it to out_path if given. Runs in a worker
+    process."""
+    try:
+        if source is None:
+            try:
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    source = f.read()
+            except FileNotFoundError as e:
+                raise FileNotFoundError(
+                    e.errno, '%s (an input is only taken as source if it contains a newline)'
+                    % e.strerror, path)
+        output = _transform_cached(_transform_string_quietly, source, invertible, str_function,
+                                   static_html, None, path, trusted)
+        if out_path is not None:
+            out_dir = os.path.dirname(out_path)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            # the output is plain python, which must not be decoded as pyxl again
+            with open(out_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(strip_cookie(output))
+    except Exception as e:
+        return TransformResult(path, None, e)
+    return TransformResult(path, output, None)
+
+
+def transform_many(paths_or_strings, workers=None, invertible=False, str_function='str',
+                   static_html=False, trusted=False, in_place=False, out_dir=None, root=None):
+    """Transform many files or sources, using up to workers processes (by default, one per core).
+
+    Each input is either the path of a file (a str without a newline, or an os.PathLike) or the
+    source itself (a str with a newline). Returns a list of TransformResult, in the order of the
+    inputs. An input that fails to transform (or to be read or written) doesn't stop the others:
+    its result has the error instead of the output.
+
+    The outputs of files are written back to them if in_place is true, or else to out_dir if it's
+    given, at their path relative to root (by default, the current directory). The written files
+    are plain python, with the pyxl coding cookie blanked out (see strip_cookie); the results have
+    the outputs as transformed. The transform cache configured by the environment is used
+    (see pyxl.codec.cache).
+    """
+    if in_place and out_dir is not None:
+        raise ValueError('in_place and out_dir are exclusive')
+    if root is None:
+        root = os.getcwd()
+
+    results = []
+    todo = []  # (index in results, arguments of _transform_one)
+    for item in paths_or_strings:
+        if isinstance(item, str) and '\n' in item:
+            todo.append((len(results), (item, None, None)))
+            results.append(None)
+            continue
+
+        path = os.fspath(item)
+        out_path = None
+        if in_place:
+            out_path = path
+        elif out_dir is not None:
+            rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+            if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+                results.append(
+                    TransformResult(path, None, ValueError('%s is not under %s' % (path, root))))
+                continue
+            out_path = os.path.join(out_dir, rel_path)
+        todo.append((len(results), (None, path, out_path)))
+        results.append(None)
+
+    options = (invertible, str_function, static_html, trusted)
+    if workers == 1 or len(todo) <= 1:
+        for i, args in todo:
+            results[i] = _transform_one(*(args + options))
+        return results
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(i, args[1], executor.submit(_transform_one, *(args + options)))
+                   for i, args in todo]
+        for i, path, future in futures:
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # the result couldn't come back from the worker (say, an exception that can't be
+                # pickled)
+                results[i] = TransformResult(path, None, e)
+    return results
+
+
+def pyxl_invert_string(input, filename=None):
     stream = io.StringIO(input)
-    return pyxl_invert(stream)
+    return pyxl_invert(stream, filename)
 
 
 def pyxl_encode(input, errors='strict'):
-    # FIXME: maybe we should actually be able to consume partial results
-    # instead of this O(n^2) retry thing?
-    try:
-        return pyxl_invert_string(input).encode('utf-8'), len(input)
-    except PyxlUnfinished:
-        return b'', 0
+    return pyxl_invert_string(input).encode('utf-8'), len(input)
+
+
+def pyxl_decode(input, errors='strict', invertible=False, static_html=False):
+    return pyxl_transform_string_cached(bytes(input).decode('utf-8'), invertible,
+                                        static_html=static_html), len(input)
+
+
+# lines that can start a new top-level statement. else, elif, except and finally continue the
+# statement before them, and a line starting with anything else (a string, a bracket, a comment)
+# is simply left to the next chunk.
+_STATEMENT_START = re.compile(r'\n(?=@|(?!(?:else|elif|except|finally)\b)[^\W\d])')
+
+
+class _StatementBuffer(object):
+    """
+    Converts text fed in arbitrary pieces one batch of complete top-level statements at a time.
+
+    convert(text, final) is called on a prefix of the pending text that ends right before a line
+    that looks like the start of a top-level statement, and raises if the prefix turns out not to
+    be complete (it ends inside a string, brackets, pyxl or a compound statement). The prefix is
+    then kept, and tried again once the pending text has doubled, so that the total work stays
+    linear in the input even if no prefix ever converts. At the end, convert is called on the
+    rest with final=True.
+    """
+
+    def __init__(self, convert):
+        self.convert = convert
+        self.reset()
+
+    def reset(self):
+        self.pending = ''
+        self.scanned = 0  # offset in pending up to which statement starts have been looked for
+        self.retry_at = 0  # don't try a prefix shorter than this
+        self.lines = 0  # lines converted so far
 
+    def feed(self, text, final=False):
+        self.pending += text
+        output = []
+        end = self.pending.rfind('\n')
+        split = None
+        for match in _STATEMENT_START.finditer(self.pending, max(self.scanned - 1, 0)):
+            if match.start() >= end:
+                break  # the line isn't complete yet
+            split = match.end()
+        self.scanned = end + 1
 
-def pyxl_decode(input, errors='strict', invertible=False):
-    return pyxl_transform_string(bytes(input).decode('utf-8'), invertible), len(input)
+        if split is not None and split >= self.retry_at and not final:
+            chunk = self.pending[:split]
+            try:
+                output.append(self.convert(chunk, False))
+            except Exception:
+                self.retry_at = 2 * split
+            else:
+                self.pending = self.pending[split:]
+                self.scanned -= split
+                self.retry_at = 0
+                self.lines += chunk.count('\n')
 
+        if final and self.pending:
+            output.append(self.convert(self.pending, True))
+            self.reset()
+        return ''.join(output)
 
-class PyxlIncrementalDecoder(codecs.BufferedIncrementalDecoder):
+
+class PyxlIncrementalDecoder(codecs.IncrementalDecoder):
+    """Transforms complete top-level statements as soon as they have been decoded, instead of
+    waiting for the whole file."""
     invertible = False
+    static_html = False
 
-    def decode(self, input, final=False):
-        self.buffer += input
+    def __init__(self, errors='strict'):
+        super(PyxlIncrementalDecoder, self).__init__(errors)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')(errors)
+        self.statements = _StatementBuffer(self._transform)
+
+    def _transform(self, text, final):
         if final:
-            buff = self.buffer
-            self.buffer = b''
-            return pyxl_transform_string(buff.decode('utf-8'), self.invertible)
-        else:
-            return ''
+            try:
+                return pyxl_untokenize(pyxl_tokenize(
+                    io.StringIO(text).readline, self.invertible, static_html=self.static_html))
+            except Exception:
+                # transform the rest again where it is in the file, so that the error reports the
+                # right line
+                pyxl_transform_string('\n' * self.statements.lines + text, self.invertible,
+                                      static_html=self.static_html)
+                raise
+
+        # Chunks aren't kept in the transform cache: a file streamed through here would fill it
+        # with entries for its pieces, which evict those of whole files.
+        output = pyxl_untokenize(pyxl_tokenize(
+            io.StringIO(text).readline, self.invertible, static_html=self.static_html))
+        compile(output, '<pyxl>', 'exec', ast.PyCF_ONLY_AST)
+        return output
+
+    def decode(self, input, final=False):
+        return self.statements.feed(self.utf8.decode(input, final), final)
+
+    def reset(self):
+        self.utf8.reset()
+        self.statements.reset()
+
+    def getstate(self):
+        # the pending text hasn't produced any output yet, so it's still buffered input
+        buffer, flag = self.utf8.getstate()
+        return self.statements.pending.encode('utf-8') + buffer, self.statements.lines
+
+    def setstate(self, state):
+        self.reset()
+        self.utf8.setstate((state[0], 0))
+        self.statements.lines = state[1]
 
 
 class PyxlIncrementalDecoderInvertible(PyxlIncrementalDecoder):
     invertible = True
 
 
-class PyxlIncrementalEncoder(codecs.BufferedIncrementalEncoder):
-    def _buffer_encode(self, input, errors, final):
-        return pyxl_encode(input, errors)
+class PyxlIncrementalDecoderStatic(PyxlIncrementalDecoder):
+    static_html = True
+
+
+class PyxlIncrementalEncoder(codecs.IncrementalEncoder):
+    """Inverts complete top-level statements as soon as they are encoded."""
+
+    def __init__(self, errors='strict'):
+        super(PyxlIncrementalEncoder, self).__init__(errors)
+        self.statements = _StatementBuffer(self._invert)
+
+    def _invert(self, text, final):
+        if final:
+            try:
+                return pyxl_untokenize(pyxl_invert_tokenize(io.StringIO(text).readline))
+            except Exception:
+                pyxl_invert_string('\n' * self.statements.lines + text)
+                raise
+
+        # the input is python: if it parses, it's made of complete statements
+        compile(text, '<pyxl>', 'exec', ast.PyCF_ONLY_AST)
+        return pyxl_untokenize(pyxl_invert_tokenize(io.StringIO(text).readline))
+
+    def encode(self, input, final=False):
+        return self.statements.feed(input, final).encode('utf-8')
+
+    def reset(self):
+        self.statements.reset()
+
+    def getstate(self):
+        # The state has to be an int: the pending text, utf-8 encoded, behind a 1 byte so that
+        # leading zero bytes survive, and the lines converted so far in the low 32 bits.
+        if not self.statements.pending:
+            return 0
+        pending = int.from_bytes(b'\x01' + self.statements.pending.encode('utf-8'), 'big')
+        return pending << 32 | self.statements.lines
+
+    def setstate(self, state):
+        self.reset()
+        if state:
+            pending = (state >> 32).to_bytes(((state >> 32).bit_length() + 7) // 8, 'big')
+            self.statements.pending = pending[1:].decode('utf-8')
+            self.statements.lines = state & 0xffffffff
 
 
 class PyxlStreamReader(utf_8.StreamReader):
@@ -84,5 +525,19 @@ class PyxlStreamReaderInvertible(utf_8.StreamReader):
     decode = lambda input, errors='strict': pyxl_decode(input, errors, invertible=True)
 
 
+class PyxlStreamReaderStatic(utf_8.StreamReader):
+    decode = staticmethod(
+        lambda input, errors='strict': pyxl_decode(input, errors, static_html=True))
+
+
 class PyxlStreamWriter(codecs.StreamWriter):
-    encode = pyxl_encode
+    def __init__(self, stream, errors='strict'):
+        super(PyxlStreamWriter, self).__init__(stream, errors)
+        self.encoder = PyxlIncrementalEncoder(errors)
+
+    def encode(self, input, errors='strict'):
+        return self.encoder.encode(input), len(input)
+
+    def reset(self):
+        self.stream.write(self.encoder.encode('', True))
+        self.encoder.reset()
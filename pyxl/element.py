@@ -4,7 +4,15 @@ from pyxl.base import x_base
 
 class x_element(x_base):
 
-    _element = None  # render() output cached by _rendered_element()
+    __slots__ = ('_element',)
+
+    # A store for the rendered HTML of elements of this class (see pyxl.fragment_cache). It's
+    # only used for elements whose cache_key() isn't None.
+    fragment_cache = None
+
+    def __init__(self, **kwargs):
+        self._element = None  # render() output cached by _rendered_element()
+        super(x_element, self).__init__(**kwargs)
 
     def _get_base_element(self):
         # Adding classes costs ~10%
@@ -27,14 +35,68 @@ class x_element(x_base):
         return out
 
     def _to_list(self, l):
-        self._render_child_to_list(self._get_base_element(), l)
+        if not self._cached_html_to_list(l):
+            self._render_child_to_list(self._get_base_element(), l)
+
+    def _iter_to_list(self, l):
+        if type(self)._to_list is not x_element._to_list:
+            # a subclass renders itself differently
+            yield from x_base._iter_to_list(self, l)
+            return
+
+        # the same as _to_list, except that the base element is rendered incrementally
+        if not self._cached_html_to_list(l):
+            yield from self._iter_child_to_list(self._get_base_element(), l)
+        yield
+
+    def cache_key(self):
+        """
+        Hook to make the rendered HTML of this element cacheable in fragment_cache. Return a
+        hashable value that identifies everything the output depends on, or None to not cache.
+        The element's class and its class attribute are always part of the key. Default
+        behavior is to not cache.
+        """
+        return None
+
+    def _cached_html_to_list(self, l):
+        """Append this element's HTML from the fragment cache to l and return True, or return
+        False if it isn't cacheable."""
+        html = self._cached_html()
+        if html is None:
+            return False
+        l.append(html)
+        return True
+
+    def _cached_html(self):
+        """Return this element's HTML from the fragment cache, rendering and storing it on a
+        miss, or None if it isn't cacheable."""
+        cache = self.fragment_cache
+        if cache is None:
+            return None
+        key = self.cache_key()
+        if key is None:
+            return None
+
+        key = (self.__class__, self.get_class(), key)
+        html = cache.get(key)
+        if html is None:
+            l = []
+            self._render_child_to_list(self._get_base_element(), l)
+            html = ''.join(l)
+            cache.set(key, html)
+        return html
 
     def _rendered_element(self):
-        if self._element is None:
+        try:
+            element = _get_element(self)
+        except AttributeError:
+            # a subclass whose __init__ doesn't call x_element.__init__
+            element = None
+        if element is None:
             self.prerender()
-            self._element = self.render()
-            self.postrender(self._element)
-        return self._element
+            element = self._element = self.render()
+            self.postrender(element)
+        return element
 
     def render(self):
         raise NotImplementedError()
@@ -52,3 +114,7 @@ class x_element(x_base):
         is to do nothing
         """
         pass
+
+# Reads the _element slot without falling back to x_base.__getattr__, which would look it up as an
+# attribute when it was never set.
+_get_element = x_element._element.__get__
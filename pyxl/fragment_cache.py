@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Stores for caching the rendered HTML of x_element components.
+
+To cache an element class, give it a cache_key() and a store:
+
+    class x_footer(x_element):
+        fragment_cache = LRUFragmentCache(max_entries=100, ttl=60)
+
+        def cache_key(self):
+            return self.attr('lang')
+
+Any object with get(key) and set(key, html) methods can be used as a store, as long as get
+returns None on a miss.
+"""
+
+import collections
+import threading
+import time
+
+class LRUFragmentCache(object):
+    """An in-process cache that evicts least recently used entries once it holds more than
+    max_entries entries or max_size characters of HTML, and expires entries after ttl seconds.
+    A limit of None means no limit. Thread-safe."""
+
+    def __init__(self, max_entries=1000, max_size=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # key -> (html, expiry time)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                html, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return html
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, html):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (html, expires)
+            self.size += len(html)
+            while self._entries and (
+                    (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                    (self.max_size is not None and self.size > self.max_size)):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        html, _ = self._entries.pop(key)
+        self.size -= len(html)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                'size': self.size}
@@ -7,18 +7,34 @@ from pyxl.base import x_base
 from pyxl.browser_hacks import x_cond_comment
 
 class x_html_element(x_base):
-    def _to_list(self, l):
+    def _start_tag_to_list(self, l):
         l.extend(('<', self.__tag__))
         for name, value in self.__attributes__.items():
             l.extend((' ', name, '="', escape(value), '"'))
         l.append('>')
 
+    def _to_list(self, l):
+        self._start_tag_to_list(l)
         for child in self.__children__:
             x_base._render_child_to_list(child, l)
+        l.extend(('</', self.__tag__, '>'))
 
+    def _iter_to_list(self, l):
+        if type(self)._to_list is not x_html_element._to_list:
+            # a subclass renders itself differently
+            yield from x_base._iter_to_list(self, l)
+            return
+
+        # the same as _to_list, except that children are rendered incrementally
+        self._start_tag_to_list(l)
+        for child in self.__children__:
+            yield from x_base._iter_child_to_list(child, l)
         l.extend(('</', self.__tag__, '>'))
+        yield
 
 class x_html_element_nochild(x_base):
+    _allows_children = False
+
     def append(self, child):
         raise Exception('<%s> does not allow children.', self.__tag__)
 
@@ -74,11 +90,30 @@ class x_rawhtml(x_html_element_nochild):
 def rawhtml(text):
     return x_rawhtml(text=text)
 
+# Subtrees pre-rendered by the static_html transform mode. The same text always maps to the same
+# element, so evaluating a static subtree doesn't allocate anything.
+_static_rawhtml = {}
+
+def static_rawhtml(text):
+    element = _static_rawhtml.get(text)
+    if element is None:
+        element = _static_rawhtml.setdefault(text, x_rawhtml(text=text))
+    return element
+
 class x_frag(x_base):
     def _to_list(self, l):
         for child in self.__children__:
             self._render_child_to_list(child, l)
 
+    def _iter_to_list(self, l):
+        if type(self)._to_list is not x_frag._to_list:
+            # a subclass renders itself differently
+            yield from x_base._iter_to_list(self, l)
+            return
+
+        for child in self.__children__:
+            yield from self._iter_child_to_list(child, l)
+
 class x_a(x_html_element):
     __attrs__ = {
         'href': str,
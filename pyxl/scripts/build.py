@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+"""
+Ahead-of-time build of a source tree that uses pyxl.
+
+Every file under the source directory is copied to the output directory, except that files with
+a `# coding: pyxl` cookie are transformed to plain python first (with the cookie blanked out), and
+every python file gets a .pyc compiled next to it. The result runs without pyxl registered.
+
+Builds are incremental: a manifest in the output directory records a hash of each input, and
+unchanged inputs are skipped.
+
+Usage:
+    python -m pyxl.scripts.build [-j JOBS] [-O] [--static] [--trusted] [--zip ZIP] SRC_DIR OUT_DIR
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
+import os
+import py_compile
+import shutil
+import sys
+import zipfile
+
+import pyxl
+from pyxl.codec import CODEGEN_VERSION
+from pyxl.codec.importer import has_pyxl_cookie
+from pyxl.codec.transform import _transform_cached, _transform_string_quietly, strip_cookie
+
+MANIFEST = '.pyxl-build.json'
+
+def _cache_path(path, optimize):
+    return importlib.util.cache_from_source(path, optimization=optimize if optimize else '')
+
+
+def _build_file(src_path, out_path, static_html, optimize, trusted=False):
+    """Build a single file. Runs in a worker process."""
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    if not src_path.endswith('.py'):
+        shutil.copyfile(src_path, out_path)
+        return
+
+    if has_pyxl_cookie(src_path):
+        with open(src_path, 'r', encoding='utf-8', newline='') as f:
+            # errors are reported once, by build's caller
+            output = _transform_cached(_transform_string_quietly, f.read(), False, 'str',
+                                       static_html, None, src_path, trusted)
+        with open(out_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(strip_cookie(output))
+    else:
+        shutil.copyfile(src_path, out_path)
+
+    py_compile.compile(out_path, cfile=_cache_path(out_path, optimize), doraise=True,
+                       optimize=optimize,
+                       invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+
+
+def _input_hash(src_path, static_html, optimize, trusted=False):
+    h = hashlib.sha256()
+    h.update(repr((pyxl.__version__, CODEGEN_VERSION, static_html, optimize,
+                   trusted)).encode('utf-8'))
+    with open(src_path, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def _walk(src_dir):
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+        for filename in sorted(filenames):
+            if not filename.endswith(('.pyc', '.pyo')):
+                yield os.path.relpath(os.path.join(dirpath, filename), src_dir)
+
+
+def _remove(out_dir, rel_path, optimize):
+    out_path = os.path.join(out_dir, rel_path)
+    paths = [out_path]
+    if out_path.endswith('.py'):
+        paths.append(_cache_path(out_path, optimize))
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def build(src_dir, out_dir, jobs=None, static_html=False, optimize=0, trusted=False):
+    """Build src_dir into out_dir, using up to jobs processes.
+
+    Returns a (built, skipped, errors) tuple, where errors is a list of (path, exception) pairs.
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    try:
+        with open(manifest_path, 'r') as f:
+            old_manifest = json.load(f)
+    except (OSError, ValueError):
+        old_manifest = {}
+
+    manifest = {}
+    todo = []
+    for rel_path in _walk(src_dir):
+        digest = _input_hash(os.path.join(src_dir, rel_path), static_html, optimize, trusted)
+        if (old_manifest.get(rel_path) == digest and
+                os.path.exists(os.path.join(out_dir, rel_path))):
+            manifest[rel_path] = digest
+        else:
+            todo.append((rel_path, digest))
+
+    skipped = len(manifest)
+    todo_paths = set(rel_path for rel_path, _ in todo)
+    for rel_path in old_manifest:
+        if rel_path not in manifest and rel_path not in todo_paths:
+            _remove(out_dir, rel_path, optimize)
+
+    errors = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(_build_file, os.path.join(src_dir, rel_path),
+                            os.path.join(out_dir, rel_path), static_html, optimize, trusted):
+                (rel_path, digest)
+            for rel_path, digest in todo
+        }
+        for future in concurrent.futures.as_completed(futures):
+            rel_path, digest = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors.append((rel_path, e))
+            else:
+                manifest[rel_path] = digest
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return len(todo) - len(errors), skipped, errors
+
+
+def write_zip(out_dir, zip_path, optimize=0):
+    """Package a built tree in a zip archive that can go on sys.path (or be run, if it has a
+    __main__.py). zipimport only looks for .pyc files next to their source, so that's where they
+    go in the archive."""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for rel_path in _walk(out_dir):
+            if rel_path == MANIFEST:
+                continue
+            path = os.path.join(out_dir, rel_path)
+            zf.write(path, rel_path)
+            if rel_path.endswith('.py'):
+                cache_path = _cache_path(path, optimize)
+                if os.path.exists(cache_path):
+                    zf.write(cache_path, rel_path + 'c')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Transform a source tree that uses pyxl to plain python and bytecode.')
+    parser.add_argument('src_dir')
+    parser.add_argument('out_dir')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('-O', dest='optimize', action='count', default=0,
+                        help='optimization level of the compiled bytecode, as for python -O')
+    parser.add_argument('--static', dest='static_html', action='store_true',
+                        help='pre-render static HTML subtrees (see pyxl.codec.register_static)')
+    parser.add_argument('--trusted', action='store_true',
+                        help='validate literal attribute values at build time, not at runtime')
+    parser.add_argument('--zip', dest='zip_path', default=None,
+                        help='also package the output in this zip archive')
+    args = parser.parse_args(argv)
+
+    built, skipped, errors = build(args.src_dir, args.out_dir, args.jobs, args.static_html,
+                                   args.optimize, args.trusted)
+    for rel_path, error in sorted(errors):
+        print('%s: %s' % (rel_path, error), file=sys.stderr)
+    print('%d built, %d unchanged, %d failed' % (built, skipped, len(errors)), file=sys.stderr)
+    if errors:
+        return 1
+
+    if args.zip_path:
+        write_zip(args.out_dir, args.zip_path, args.optimize)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""
+Format pyxl files with black, over a process pool.
+
+Each argument is a file, or a directory in which every .py file with a `# coding: pyxl` cookie is
+formatted. Files that are already formatted are found in the cache (--cache-dir, or
+PYXL_CACHE_DIR) without running black on them.
+
+Usage:
+    python -m pyxl.scripts.format [-j JOBS] [--check] [-l LINE_LENGTH] [-S] [--cache-dir DIR]
+                                  PATH...
+"""
+
+import argparse
+import sys
+
+from pyxl.codec.cache import TransformCache
+from pyxl.scripts.transform import find_files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Format pyxl files with black.')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--check', action='store_true',
+                        help="don't write the files back, and fail if any would change")
+    parser.add_argument('-l', '--line-length', type=int, default=None,
+                        help="black's line length")
+    parser.add_argument('-S', '--skip-string-normalization', action='store_true',
+                        help="don't normalize string quotes or prefixes")
+    parser.add_argument('--cache-dir', default=None,
+                        help='cache the formatted files in this directory '
+                             '(default: $PYXL_CACHE_DIR)')
+    args = parser.parse_args(argv)
+
+    try:
+        import black
+    except ImportError:
+        print('pyxl.scripts.format needs black to be installed', file=sys.stderr)
+        return 2
+    from pyxl.codec.formatting import format_many
+
+    options = {'string_normalization': not args.skip_string_normalization}
+    if args.line_length is not None:
+        options['line_length'] = args.line_length
+    mode = black.Mode(**options)
+    cache = TransformCache(args.cache_dir) if args.cache_dir else None
+
+    results = format_many(list(find_files(args.paths)), args.jobs, mode, not args.check, cache)
+    changed = errors = 0
+    for result in results:
+        if result.error is not None:
+            errors += 1
+            print('error: cannot format %s: %s' % (result.path, result.error), file=sys.stderr)
+        elif result.changed:
+            changed += 1
+            print('%s %s' % ('would reformat' if args.check else 'reformatted', result.path),
+                  file=sys.stderr)
+    print('%d %s, %d unchanged, %d failed' % (
+        changed, 'would be reformatted' if args.check else 'reformatted',
+        len(results) - changed - errors, errors), file=sys.stderr)
+    return 1 if errors or (args.check and changed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
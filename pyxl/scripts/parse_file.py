@@ -5,10 +5,13 @@ from pyxl.codec.transform import pyxl_invert_string, pyxl_transform_string
 
 
 if __name__ == '__main__':
-    invert = invertible = False
+    invert = invertible = static_html = False
     if sys.argv[1] == '-i':
         invertible = True
         fname = sys.argv[2]
+    elif sys.argv[1] == '-s':
+        static_html = True
+        fname = sys.argv[2]
     elif sys.argv[1] == '-r':
         invert = True
         fname = sys.argv[2]
@@ -17,6 +20,7 @@ if __name__ == '__main__':
     with open(fname, 'r') as f:
         contents = f.read()
         if invert:
-            print(pyxl_invert_string(contents), end='')
+            print(pyxl_invert_string(contents, fname), end='')
         else:
-            print(pyxl_transform_string(contents, invertible), end='')
+            print(pyxl_transform_string(contents, invertible, static_html=static_html,
+                                        filename=fname), end='')
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+"""
+A long-lived transform server, for editor integrations.
+
+Starting python and importing pyxl for every transform is slow compared to the transform itself,
+so an editor can instead keep this process running and send it requests. The protocol is
+line-delimited JSON: each request is one JSON object on a line, and gets one response line, in
+order. It's spoken over stdin/stdout, or over a Unix socket (--socket), where each connection is a
+separate stream of requests sharing the same cache.
+
+A request looks like:
+
+    {"id": 1, "method": "transform", "buffer": "/src/a.py", "version": 3, "text": "...",
+     "invertible": false, "static_html": false, "trusted": false}
+
+The methods are:
+    transform    the transform of text, as {"output": ...}
+    invert       the inverse of the invertible transform text, as {"output": ...}
+    diagnostics  the errors in text, as {"diagnostics": [{"message": ..., "line": ...,
+                 "column": ...}]}; this is the transform, followed by a compile of its output
+    close        forgets what's cached for the buffer
+
+The response is {"id": ..., "result": ...}, or {"id": ..., "error": {"message": ..., "line": ...,
+"column": ...}} if the request failed (line and column are null when unknown, and column is
+0-based). The result of a request with a buffer and a version is cached until a request for
+another version of the buffer with the same method and options: asking for the same version
+again, with or without the text, returns the cached result.
+
+Usage:
+    python -m pyxl.scripts.serve [--socket PATH]
+"""
+
+import argparse
+import json
+import os
+import re
+import socketserver
+import stat
+import sys
+import threading
+
+from pyxl.codec.transform import _invert_string_quietly, _transform_string_quietly
+
+
+# The position in the message of a transform error, in any of the forms the parser and tokenizer
+# put it in.
+_ERROR_POSITION = re.compile(r'\bline:?\s*(\d+)(?:\s+char\s+(\d+))?')
+
+_OPTIONS = ('invertible', 'static_html', 'trusted')
+
+
+class RequestError(Exception):
+    """A malformed request."""
+
+
+def error_info(error, text=None, output=None):
+    """The message and position of an error raised by the transform, or a SyntaxError raised by
+    compiling its output.
+
+    The transform keeps line numbers, so the line of a SyntaxError in the output is its line in
+    text, but its column is only kept when the output line is the same as the text line.
+    """
+    if isinstance(error, SyntaxError):
+        line, column = error.lineno, None
+        if line is not None and error.offset is not None and output is not None:
+            text_lines, output_lines = text.splitlines(), output.splitlines()
+            if (line <= len(text_lines) and line <= len(output_lines) and
+                    text_lines[line - 1] == output_lines[line - 1]):
+                column = error.offset - 1
+        return {'message': error.msg, 'line': line, 'column': column}
+
+    message = str(error) or type(error).__name__
+    line = column = None
+    match = _ERROR_POSITION.search(message)
+    if match:
+        line = int(match.group(1))
+        if match.group(2) is not None:
+            column = int(match.group(2))
+    return {'message': message, 'line': line, 'column': column}
+
+
+class TransformServer(object):
+    """Answers the requests of the protocol, and caches their results per buffer version.
+
+    This is independent of the transport: handle() takes a decoded request and returns the
+    response. It's safe to use from several threads.
+    """
+
+    def __init__(self):
+        # (buffer, method, options) -> (version, response without the id)
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def handle(self, request):
+        """The response to a request (a dict)."""
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            response = self._handle(request)
+        except RequestError as e:
+            response = {'error': {'message': str(e), 'line': None, 'column': None}}
+        except Exception as e:
+            # a bug shouldn't take the server down with it
+            response = {'error': {'message': 'internal error: %r' % e, 'line': None,
+                                  'column': None}}
+        return dict(response, id=request_id)
+
+    def handle_line(self, line):
+        """The response line to a request line."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'id': None,
+                        'error': {'message': 'invalid JSON: %s' % e, 'line': None, 'column': None}}
+        else:
+            response = self.handle(request)
+        return json.dumps(response) + '\n'
+
+    def _handle(self, request):
+        if not isinstance(request, dict):
+            raise RequestError('a request must be a JSON object')
+        method = request.get('method')
+        if method not in ('transform', 'invert', 'diagnostics', 'close'):
+            raise RequestError('unknown method %r' % (method,))
+
+        buffer = request.get('buffer')
+        if buffer is not None and not isinstance(buffer, str):
+            raise RequestError('buffer must be a string')
+        if method == 'close':
+            if buffer is None:
+                raise RequestError('close needs a buffer')
+            with self._lock:
+                for key in [key for key in self._results if key[0] == buffer]:
+                    del self._results[key]
+            return {'result': None}
+
+        options = tuple(bool(request.get(option, False)) for option in _OPTIONS)
+        version = request.get('version')
+        if version is not None and (not isinstance(version, (str, int)) or
+                                    isinstance(version, bool)):
+            raise RequestError('version must be a string or an integer')
+        text = request.get('text')
+        key = (buffer, method, options)
+        if buffer is not None and version is not None:
+            with self._lock:
+                cached = self._results.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        if not isinstance(text, str):
+            raise RequestError('%s needs the text of the buffer' % method)
+
+        response = getattr(self, '_' + method)(text, buffer, *options)
+        if buffer is not None and version is not None:
+            with self._lock:
+                self._results[key] = (version, response)
+        return response
+
+    def _transform(self, text, buffer, invertible, static_html, trusted):
+        try:
+            output = _transform_string_quietly(text, invertible, 'str', static_html, buffer,
+                                               trusted)
+        except Exception as e:
+            return {'error': error_info(e)}
+        return {'result': {'output': output}}
+
+    def _invert(self, text, buffer, invertible, static_html, trusted):
+        try:
+            output = _invert_string_quietly(text, buffer)
+        except Exception as e:
+            return {'error': error_info(e)}
+        return {'result': {'output': output}}
+
+    def _diagnostics(self, text, buffer, invertible, static_html, trusted):
+        output = None
+        try:
+            output = _transform_string_quietly(text, invertible, 'str', static_html, buffer,
+                                               trusted)
+            compile(output, buffer or '<buffer>', 'exec', dont_inherit=True)
+        except Exception as e:
+            diagnostics = [error_info(e, text, output)]
+        else:
+            diagnostics = []
+        return {'result': {'diagnostics': diagnostics}}
+
+
+def serve_stream(server, infile, outfile):
+    """Answer the requests read from infile on outfile, until the end of infile."""
+    for line in infile:
+        if not line.strip():
+            continue
+        outfile.write(server.handle_line(line))
+        outfile.flush()
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(self.server.transform_server.handle_line(line).encode('utf-8'))
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_socket(server, path):
+    """Answer the requests of the connections to a Unix socket at path, until interrupted."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        pass
+    else:
+        # a socket left over from a previous server can go, but nothing else
+        if not stat.S_ISSOCK(mode):
+            raise ValueError('%s exists and is not a socket' % path)
+        os.unlink(path)
+    unix_server = _UnixServer(path, _ConnectionHandler)
+    unix_server.transform_server = server
+    try:
+        unix_server.serve_forever()
+    finally:
+        unix_server.server_close()
+        os.unlink(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve pyxl transforms over line-delimited JSON.')
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help='listen on a Unix socket at PATH instead of stdin/stdout')
+    args = parser.parse_args(argv)
+
+    # the trusted and static modes import it anyway, so pay for it before the first request
+    import pyxl.html
+
+    server = TransformServer()
+    if args.socket is None:
+        serve_stream(server, sys.stdin, sys.stdout)
+    else:
+        try:
+            serve_socket(server, args.socket)
+        except KeyboardInterrupt:
+            pass
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+Transform many pyxl files at once, over a process pool.
+
+Each argument is a file, or a directory in which every .py file with a `# coding: pyxl` cookie is
+transformed. The outputs are printed in the order of the inputs, unless they're written back to
+the inputs (--in-place) or to a directory (-o), at their path relative to --root. Files that fail
+to transform are reported without stopping the others. The pyxl coding cookie is blanked out of
+the outputs, which are plain python.
+
+Usage:
+    python -m pyxl.scripts.transform [-j JOBS] [-i] [--static] [--trusted]
+                                     [--in-place | -o OUT_DIR [--root ROOT]] PATH...
+"""
+
+import argparse
+import os
+import sys
+
+from pyxl.codec.importer import has_pyxl_cookie
+from pyxl.codec.transform import strip_cookie, transform_many
+
+
+def find_files(paths):
+    """Expand the directories among paths into the pyxl files under them."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+            for filename in sorted(filenames):
+                file_path = os.path.join(dirpath, filename)
+                if filename.endswith('.py') and has_pyxl_cookie(file_path):
+                    yield file_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Transform pyxl files to plain python.')
+    parser.add_argument('paths', nargs='+', metavar='PATH')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('-i', '--invertible', action='store_true',
+                        help='produce output that can be inverted back to pyxl')
+    parser.add_argument('--static', dest='static_html', action='store_true',
+                        help='pre-render static HTML subtrees (see pyxl.codec.register_static)')
+    parser.add_argument('--trusted', action='store_true',
+                        help='validate literal attribute values now, not at runtime')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--in-place', action='store_true',
+                        help='write each output back to its input')
+    output.add_argument('-o', '--out-dir', default=None,
+                        help='write the outputs under this directory')
+    parser.add_argument('--root', default=None,
+                        help='the directory that -o mirrors (default: the current directory)')
+    args = parser.parse_args(argv)
+
+    results = transform_many(list(find_files(args.paths)), args.jobs, args.invertible,
+                             static_html=args.static_html, trusted=args.trusted,
+                             in_place=args.in_place, out_dir=args.out_dir, root=args.root)
+    errors = 0
+    for result in results:
+        if result.error is not None:
+            errors += 1
+            print('%s: %s' % (result.path, result.error), file=sys.stderr)
+        elif not args.in_place and args.out_dir is None:
+            sys.stdout.write(strip_cookie(result.output))
+    if args.in_place or args.out_dir is not None:
+        print('%d transformed, %d failed' % (len(results) - errors, errors), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,8 +11,27 @@ unescape_other = {
     '&quot;': '"',
     }
 
+class SafeString(str):
+    """A string that is already valid HTML, and so is never escaped again."""
+
+    def __html__(self):
+        return str(self)
+
 def escape(obj):
-    return xml_escape(str(obj), escape_other)
+    # Objects that know how to render themselves as HTML (SafeString, pyxl elements, and anything
+    # else following the __html__ convention, e.g. markupsafe.Markup) aren't escaped again.
+    if type(obj) is not str:
+        html = getattr(obj, '__html__', None)
+        if html is not None:
+            return html()
+        obj = str(obj)
+
+    # Most strings have nothing to escape, and each 'in' test is a fast C scan, so it's much
+    # cheaper to check first than to always run the replacements.
+    if '&' in obj or '<' in obj or '>' in obj or '"' in obj:
+        return (obj.replace('&', '&amp;').replace('<', '&lt;')
+                .replace('>', '&gt;').replace('"', '&quot;'))
+    return obj
 
 def unescape(obj):
     return xml_unescape(str(obj), unescape_other)
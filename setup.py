@@ -8,7 +8,7 @@ version = "1.4"
 distutils.core.setup(
     name="pyxl3",
     version=version,
-    packages = ["pyxl", "pyxl.codec", "pyxl.scripts"],
+    packages = ["pyxl", "pyxl.benchmarks", "pyxl.codec", "pyxl.scripts"],
     url="http://github.com/gvanrossum/pyxl3",
     license="http://www.apache.org/licenses/LICENSE-2.0",
     description="""
@@ -0,0 +1,9 @@
+import pytest
+
+@pytest.fixture
+def write_file():
+    """A function that writes contents to the file at path."""
+    def write(path, contents):
+        with open(str(path), 'w') as f:
+            f.write(contents)
+    return write
@@ -2,6 +2,7 @@
 import unittest
 from pyxl import html
 from pyxl.base import PyxlException, x_base
+from pyxl.utils import SafeString, escape
 
 class PyxlTests(unittest.TestCase):
 
@@ -15,6 +16,12 @@ class PyxlTests(unittest.TestCase):
     def test_escaping(self):
         self.assertEqual(<div class="&">&{'&'}</div>.to_string(), '<div class="&amp;">&&amp;</div>')
         self.assertEqual(<div>{html.rawhtml('&')}</div>.to_string(), '<div>&</div>')
+        self.assertEqual(<div title="{SafeString('&amp;')}">{SafeString('<br>')}</div>.to_string(),
+                         '<div title="&amp;"><br></div>')
+        self.assertEqual(escape('<a href="x">&</a>'), '&lt;a href=&quot;x&quot;&gt;&amp;&lt;/a&gt;')
+        self.assertEqual(escape("it's"), "it's")
+        self.assertEqual(escape(3), '3')
+        self.assertEqual(escape(<b>&amp;</b>), '<b>&amp;</b>')
 
     def test_comments(self):
         pyxl = (
@@ -164,5 +171,27 @@ class PyxlTests(unittest.TestCase):
 
         self.assertEqual(<baz />.value, None)
 
+    def test_attr_validation(self):
+        class x_qux(x_base):
+            __attrs__ = {
+                'size': int,
+                'kind': ['a', 'b'],
+            }
+
+            def _to_list(self, l):
+                pass
+
+        self.assertEqual(<qux size="3" />.size, 3)
+        self.assertEqual(<qux data-foo="{1}" aria-label="x" />.attr('data-foo'), '1')
+        with self.assertRaisesRegex(PyxlException, 'incorrect type for "size"'):
+            <qux size="x" />
+        with self.assertRaisesRegex(PyxlException, r"Expecting enum value \['a', 'b'\]"):
+            <qux kind="{['a']}" />
+        with self.assertRaisesRegex(PyxlException, 'has no attr named "foo"'):
+            <qux foo="x" />
+
+        x_qux.__attrs__['late'] = int
+        self.assertEqual(<qux late="4" />.late, 4)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,34 @@
+from pyxl.benchmarks import corpus, transform
+from pyxl.codec.transform import pyxl_transform_string
+
+def test_generate():
+    source = corpus.generate(size=3, depth=3, attrs=8, curlies=0.5, ifs=0.5)
+    assert source.startswith('# coding: pyxl\n')
+    assert source == corpus.generate(size=3, depth=3, attrs=8, curlies=0.5, ifs=0.5)
+
+    namespace = {}
+    exec(compile(pyxl_transform_string(source), '<generated>', 'exec'), namespace)
+    assert str(namespace['render_2'](list(range(10)), True)).startswith('<div ')
+
+def test_run_and_compare():
+    results = transform.run(repeat=2, quick=True, fixtures=None)
+    assert set(results['results']) == {'default'}
+    assert set(name for name, _ in transform.STAGES) < set(results['results']['default'])
+
+    assert not any(regressed for _, _, _, regressed in transform.compare(results, results))
+    slower = {'results': {'default': {'transform': {'median': 0.0}}}}
+    slower['results']['default']['transform']['median'] = \
+        results['results']['default']['transform']['median'] / 2
+    assert transform.compare(results, slower) == [('default', 'transform', 2.0, True)]
+
+def test_render_workloads():
+    from pyxl.benchmarks import render
+    widget = render.components(1).__children__[0]
+    assert set(widget._get_base_element().get_class().split()) == {
+        'card', 'panel', 'widget', 'w0'}
+
+    results = render.run(processes=0, samples=2, min_time=0, workloads=['deep_tree', 'rss'])
+    summary = results['results']['rss']['render']
+    assert summary['samples'] == 2 and summary['ops_per_sec'] > 0
+    assert summary['tracemalloc_peak'] >= summary['tracemalloc_net'] > 0
+    assert summary['maxrss'] > 0
@@ -0,0 +1,41 @@
+import os
+
+from pyxl.scripts.build import build, main, strip_cookie
+
+def test_strip_cookie():
+    assert strip_cookie('# coding: pyxl\nx = 1\n') == '\nx = 1\n'
+    assert strip_cookie('#!/usr/bin/env python\n# coding: pyxl\n') == '#!/usr/bin/env python\n\n'
+    assert strip_cookie('# coding: utf-8\n') == '# coding: utf-8\n'
+
+def test_build(tmp_path, write_file):
+    src = tmp_path / 'src'
+    out = tmp_path / 'out'
+    (src / 'pkg').mkdir(parents=True)
+    write_file(str(src / 'pkg' / '__init__.py'), '')
+    write_file(str(src / 'pkg' / 'page.py'), '# coding: pyxl\nx = <div>{y}</div>\n')
+    write_file(str(src / 'pkg' / 'data.txt'), 'data')
+
+    assert build(str(src), str(out), jobs=2) == (3, 0, [])
+    with open(str(out / 'pkg' / 'page.py')) as f:
+        assert f.read() == '\nx = html.x_div._new({}, (y , ))\n'
+    assert os.path.exists(str(out / 'pkg' / 'data.txt'))
+    assert os.listdir(str(out / 'pkg' / '__pycache__'))
+
+    write_file(str(src / 'pkg' / 'page.py'), '# coding: pyxl\nx = <div>{z}</div>\n')
+    os.unlink(str(src / 'pkg' / 'data.txt'))
+    assert build(str(src), str(out), jobs=2) == (1, 1, [])
+    assert not os.path.exists(str(out / 'pkg' / 'data.txt'))
+
+    write_file(str(src / 'pkg' / 'bad.py'), '# coding: pyxl\nx = <div>\n')
+    built, skipped, errors = build(str(src), str(out), jobs=2)
+    assert (built, skipped) == (0, 2)
+    assert [path for path, _ in errors] == [os.path.join('pkg', 'bad.py')]
+
+def test_errors_reported_once(tmp_path, capfd, write_file):
+    src = tmp_path / 'src'
+    src.mkdir()
+    write_file(str(src / 'bad.py'), '# coding: pyxl\nx = <div>\n')
+    assert main([str(src), str(tmp_path / 'out')]) == 1
+    out, err = capfd.readouterr()
+    assert out == ''
+    assert err.count('Unclosed Tags') == 1 and 'Traceback' not in err
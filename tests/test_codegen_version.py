@@ -0,0 +1,30 @@
+import hashlib
+
+from pyxl.codec import CODEGEN_VERSION
+from pyxl.codec.transform import pyxl_transform_string
+
+SOURCE = '''# coding: pyxl
+from pyxl import html
+def f(x, items):
+    a = <a href="/x" class="{x}" tabindex="3" data-n="{1}">x &amp; {x}</a>
+    b = <div><if cond="{x}"><b>yes</b></if><else>no</else>{[<br /> for _ in items]}</div>
+    c = <frag>{a}<!-- comment --><img src="/i.png" /></frag>
+    return <span>{a}{b}{c}</span>
+'''
+
+# The digest of the generated code (see _digest) at each CODEGEN_VERSION, oldest first.
+DIGESTS = [
+    '90c3dfb0a1342c8d4afc4ad3bbfc15fb216691ec603c761239078932b340b7f7',
+]
+
+def _digest():
+    h = hashlib.sha256()
+    for options in ({}, {'invertible': True}, {'static_html': True}, {'trusted': True}):
+        h.update(pyxl_transform_string(SOURCE, **options).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def test_codegen_version():
+    # If this fails, the generated code changed: bump CODEGEN_VERSION in pyxl/codec/__init__.py,
+    # so that caches of the old code aren't used, and append the new digest to DIGESTS.
+    assert DIGESTS[CODEGEN_VERSION - 1:] == [_digest()]
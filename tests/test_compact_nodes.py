@@ -0,0 +1,62 @@
+# coding: pyxl
+import pytest
+
+from pyxl import html
+from pyxl.base import x_base
+from pyxl.element import x_element
+
+class x_widget(x_element):
+    def render(self):
+        self.rendered = True
+        return <div class="widget" />
+
+def test_no_dict():
+    assert not hasattr(<div />, '__dict__')
+    with pytest.raises(AttributeError):
+        <div />.foo = 1
+
+def test_lazy_storage():
+    a = <br />
+    b = <br />
+    assert a.__attributes__ is b.__attributes__
+    assert a.__children__ is b.__children__
+
+    a.set_attr('id', 'x')
+    assert a.attr('id') == 'x'
+    assert b.attr('id') is None
+    assert a.attributes() == {'id': 'x'}
+    assert b.attributes() == {}
+
+def test_children():
+    a = <div />
+    a.children().append('x')
+    a.prepend('y')
+    a.append(['z', None])
+    assert a.children() == ['y', 'x', 'z']
+    assert (<div />).children() == []
+    assert str(a) == '<div>yxz</div>'
+
+def test_slot_layout():
+    assert html.x_div.__slots__ == ()
+    assert x_element.__slots__ == ('_element',)
+    assert '__dict__' not in dir(<div />)
+    assert x_widget.__dictoffset__ != 0 and '__slots__' not in x_widget.__dict__
+
+def test_subclasses_keep_dict():
+    widget = <widget class="extra" />
+    assert sorted(str(widget)[len('<div class="'):-len('"></div>')].split()) == ['extra', 'widget']
+    assert widget.rendered
+    assert widget.__dict__ == {'rendered': True}
+
+def test_subclass_without_element_init():
+    class x_card(x_element):
+        def __init__(self, title=None):
+            x_base.__init__(self)
+            self.title = title
+
+        def render(self):
+            return <div>{self.title}</div>
+
+    card = x_card(title='t')
+    assert str(card) == '<div>t</div>'
+    assert str(card) == '<div>t</div>'
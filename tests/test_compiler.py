@@ -0,0 +1,84 @@
+import ast
+import sys
+
+import pytest
+
+from pyxl.codec import importer
+from pyxl.codec.compiler import pyxl_compile, pyxl_parse
+from pyxl.codec.transform import pyxl_transform_string
+
+SOURCE = '''# coding: pyxl
+from pyxl import html
+def f(a, items):
+    x = <div class="{a}">{a, items[0]}{*items}
+            <if cond="{a}"><b>{len(items)}</b></if>
+        </div>; y = str(a)
+    return str(x) + y
+'''
+
+def _names(tree):
+    return [(node.id, node.lineno, node.col_offset) for node in ast.walk(tree)
+            if isinstance(node, ast.Name)]
+
+def _utf8_col(source, row, text):
+    line = source.splitlines()[row - 1]
+    return len(line[:line.index(text)].encode('utf-8'))
+
+def test_compile():
+    namespace = {}
+    exec(pyxl_compile(SOURCE, 'f.py'), namespace)
+    expected = {}
+    exec(pyxl_transform_string(SOURCE), expected)
+    assert namespace['f'](1, [2, 3]) == expected['f'](1, [2, 3])
+    assert namespace['f'](0, [2]) == '<div class="0">022</div>0'
+
+def test_python_locations():
+    names = _names(pyxl_parse(SOURCE))
+    assert ('y', 6, SOURCE.splitlines()[5].index('y')) in names
+    assert ('a', 6, SOURCE.splitlines()[5].index('a')) in names
+    assert ('items', 4, SOURCE.splitlines()[3].index('items[0]')) in names
+    assert ('len', 5, SOURCE.splitlines()[4].index('len')) in names
+    assert ('a', 5, SOURCE.splitlines()[4].index('a}')) in names
+
+def test_non_ascii_locations():
+    source = 'from pyxl import html\nx = <b title="éé">{a + 1}é</b>; y = b\n'
+    names = _names(pyxl_parse(source))
+    assert ('a', 2, _utf8_col(source, 2, 'a')) in names
+    assert ('b', 2, _utf8_col(source, 2, '= b') + 2) in names
+
+def test_same_tree_as_transform():
+    # the transformed source is parsed once, and only the locations change
+    for static_html in (False, True):
+        tree = pyxl_parse(SOURCE, static_html=static_html)
+        expected = ast.parse(pyxl_transform_string(SOURCE, static_html=static_html))
+        assert ast.dump(tree) == ast.dump(expected)
+
+def test_syntax_error_location():
+    for line, error in [('x = <b>{a}</b>; y = <i>{c d}</i>', 'd'),
+                        ('x = <b>{a}</b>; y = <i>{c}</i>; z = )', ')')]:
+        with pytest.raises(SyntaxError) as excinfo:
+            pyxl_compile('from pyxl import html\n%s\n' % line)
+        assert (excinfo.value.lineno, excinfo.value.offset) == (2, line.index(error) + 1)
+
+def test_empty_expression():
+    with pytest.raises(SyntaxError) as excinfo:
+        pyxl_compile('from pyxl import html\nx = <b>{ }</b>\n')
+    assert excinfo.value.lineno == 2
+
+def test_import_hook_exact_locations(tmp_path):
+    (tmp_path / 'pyxl_exact_locations_mod.py').write_text(
+        '# coding: pyxl\nfrom pyxl import html\nvalue = str(<b>{1}</b>); error = 1 / 0\n')
+    sys.path.insert(0, str(tmp_path))
+    importer.install(exact_locations=True)
+    try:
+        with pytest.raises(ZeroDivisionError) as excinfo:
+            __import__('pyxl_exact_locations_mod')
+        frame = excinfo.traceback[-1]
+        assert frame.lineno + 1 == 3
+        if sys.version_info >= (3, 11):
+            positions = list(frame.frame.code.raw.co_positions())
+            assert (3, 3, 33, 38) in positions
+    finally:
+        importer.uninstall()
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop('pyxl_exact_locations_mod', None)
@@ -0,0 +1,60 @@
+# coding: pyxl
+import pytest
+
+from pyxl import html
+from pyxl.base import PyxlException, _constructs_directly, x_base
+from pyxl.codec.transform import pyxl_transform_string
+
+def test_transform():
+    output = pyxl_transform_string('<div class="a" data-x="{1}"><b>x</b></div>')
+    assert output == ('html.x_div._new({\'class\': \'a\', \'data-x\': 1 }, '
+                      '[html.x_b._new({}, [u"x", ]),])')
+
+def test_children():
+    items = ['b', None, False, 'c']
+    div = <div>{items}{None}{iter(['d', None])}{0}<i>e</i>{(x for x in 'fg')}</div>
+    assert div.children()[:5] == ['b', 'c', 'd', 0, div.children()[4]]
+    assert str(div) == '<div>bcd0<i>e</i>fg</div>'
+
+    div = <div>a<br /></div>
+    div.children().append('b')
+    assert str(div) == '<div>a<br />b</div>'
+    assert (<div>{None}</div>).__children__ is (<br />).__children__
+
+def test_attributes():
+    a = <a href="{None}" class="{'x'}" tabindex="{'3'}" data-y="{1}">x</a>
+    assert a.attributes() == {'class': 'x', 'tabindex': 3, 'data-y': '1'}
+    with pytest.raises(PyxlException):
+        <div foo="1" />
+    with pytest.raises(PyxlException):
+        <div tabindex="x" />
+
+def test_custom_construction():
+    calls = []
+    class x_logged(html.x_span):
+        def __init__(self, **kwargs):
+            calls.append(sorted(kwargs))
+            super(x_logged, self).__init__(**kwargs)
+
+    element = x_logged._new({'class': 'a', 'data-b': 'c'}, ('x', ['y']))
+    assert calls == [['data_b', 'xclass']]
+    assert str(element) == '<logged class="a" data-b="c">xy</logged>'
+
+    with pytest.raises(Exception):
+        <br>x</br>
+
+def test_void_elements(monkeypatch):
+    for cls in (html.x_img, html.x_br, html.x_input, html.x_meta, html.x_rawhtml):
+        assert _constructs_directly(cls), cls
+    html.x_img._new({}, ())
+
+    def fail(self, *args, **kwargs):
+        raise AssertionError('called')
+    monkeypatch.setattr(x_base, '__init__', fail)
+    monkeypatch.setattr(x_base, '__call__', fail)
+    img = html.x_img._new({'src': '/a.png', 'alt': '', 'data-x': 1}, ())
+    assert str(img) == '<img src="/a.png" alt="" data-x="1" />'
+    assert str(html.x_rawhtml._new({'text': '<b>'}, ())) == '<b>'
+
+    with pytest.raises(Exception):
+        html.x_img._new({}, ['x'])
@@ -0,0 +1,91 @@
+import re
+import sys
+import types
+
+import pytest
+
+from pyxl.codec.cache import TransformCache
+from pyxl.codec.transform import pyxl_invert_string, pyxl_transform_string
+from pyxl.scripts.format import main
+
+SOURCE = '''# coding: pyxl
+from pyxl import html
+def f(items):
+  return <ul class="list">{[<li>{x}</li> for x in items]}</ul>
+'''
+
+class FakeMode(object):
+    def __init__(self, **options):
+        self.options = options
+
+    def __repr__(self):
+        return 'FakeMode(%r)' % sorted(self.options.items())
+
+def _reindent(text, mode):
+    """A stand-in for black.format_str, that turns 2-space indents into 4-space ones."""
+    return re.sub(r'^  (?=\S)', '    ', text, flags=re.MULTILINE)
+
+@pytest.fixture
+def fake_black(monkeypatch):
+    """Replace black with a module that formats with _reindent, so that formatting can be tested
+    without black (or with black of any version)."""
+    black = types.ModuleType('black')
+    black.__version__ = 'fake'
+    black.Mode = FakeMode
+    black.format_str = _reindent
+    monkeypatch.setitem(sys.modules, 'black', black)
+    return black
+
+def test_format_string_with_black():
+    black = pytest.importorskip('black')
+    from pyxl.codec.formatting import format_string
+    expected = pyxl_invert_string(
+        black.format_str(pyxl_transform_string(SOURCE, invertible=True), mode=black.Mode()))
+    assert format_string(SOURCE) == expected
+    assert format_string(expected) == expected
+
+def test_format_string(fake_black):
+    from pyxl.codec.formatting import format_string
+    assert format_string(SOURCE) == SOURCE.replace('\n  return', '\n    return')
+
+def test_format_many(tmp_path, fake_black, write_file):
+    from pyxl.codec.formatting import format_many
+    paths = [str(tmp_path / name) for name in ('a.py', 'bad.py', 'b.py', 'c.py')]
+    write_file(paths[0], SOURCE)
+    write_file(paths[1], '# coding: pyxl\nx = <div>\n')
+    write_file(paths[2], SOURCE)
+    write_file(paths[3], 'x = 1\n')
+    cache = TransformCache(str(tmp_path / 'cache'))
+
+    results = format_many(paths, workers=2, cache=cache)
+    assert [(result.path, result.changed) for result in results] == [
+        (paths[0], True), (paths[1], None), (paths[2], True), (paths[3], False)]
+    assert 'Unclosed Tags' in str(results[1].error)
+    with open(paths[0]) as f:
+        formatted = f.read()
+    assert formatted == SOURCE.replace('\n  return', '\n    return')
+
+    # the formatted files are found in the cache, without formatting them again
+    entries = len(list(cache._entries()))
+    calls = []
+    fake_black.format_str = lambda text, mode: calls.append(text) or text
+    results = format_many(paths[:1] + paths[2:], workers=1, cache=cache)
+    assert [result.changed for result in results] == [False, False, False]
+    assert calls == []
+    assert len(list(cache._entries())) == entries
+    with open(paths[2]) as f:
+        assert f.read() == formatted
+
+def test_main_check(tmp_path, capsys, fake_black, write_file):
+    write_file(tmp_path / 'a.py', SOURCE)
+    assert main(['--check', '-l', '60', str(tmp_path)]) == 1
+    with open(str(tmp_path / 'a.py')) as f:
+        assert f.read() == SOURCE
+    assert 'would reformat' in capsys.readouterr().err
+    assert main([str(tmp_path)]) == 0
+    assert main(['--check', str(tmp_path)]) == 0
+
+def test_main_without_black(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, 'black', None)
+    assert main([str(tmp_path)]) == 2
+    assert 'needs black' in capsys.readouterr().err
@@ -0,0 +1,59 @@
+# coding: pyxl
+from pyxl import html
+from pyxl.element import x_element
+from pyxl.fragment_cache import LRUFragmentCache
+
+class x_card(x_element):
+    fragment_cache = LRUFragmentCache()
+    renders = 0
+
+    def cache_key(self):
+        return self.attr('title')
+
+    def render(self):
+        x_card.renders += 1
+        return <div class="card">{self.attr('title')}</div>
+
+class x_plain(x_element):
+    def render(self):
+        return <span>plain</span>
+
+def test_fragment_cache():
+    x_card.fragment_cache.clear()
+    x_card.renders = 0
+    page = <div>{[<card title="{t}" /> for t in ('a', 'b', 'a', 'a')]}<plain /></div>
+    expected = ('<div><div class="card">a</div><div class="card">b</div>'
+                '<div class="card">a</div><div class="card">a</div><span>plain</span></div>')
+    assert str(page) == expected
+    assert x_card.renders == 2
+    assert x_card.fragment_cache.stats() == {
+        'hits': 2, 'misses': 2, 'entries': 2, 'size': 2 * len('<div class="card">a</div>')}
+
+    assert ''.join(page.iter_render()) == expected
+    # the class attribute is part of the key
+    assert str(<card title="a" class="x" />) in ('<div class="x card">a</div>',
+                                                 '<div class="card x">a</div>')
+    assert x_card.renders == 3
+
+def test_lru_eviction():
+    cache = LRUFragmentCache(max_entries=2, max_size=5)
+    cache.set('a', 'xx')
+    cache.set('b', 'xx')
+    assert cache.get('a') == 'xx'
+    cache.set('c', 'xx')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'xx'
+    cache.set('d', 'xxxx')
+    assert len(cache) == 1 and cache.size == 4
+
+def test_unlimited():
+    cache = LRUFragmentCache(max_entries=None)
+    for i in range(2000):
+        cache.set(i, 'x')
+    assert len(cache) == 2000
+
+def test_ttl():
+    cache = LRUFragmentCache(ttl=-1)
+    cache.set('a', 'x')
+    assert cache.get('a') is None
+    assert len(cache) == 0
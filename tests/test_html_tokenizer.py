@@ -0,0 +1,49 @@
+from pyxl.codec.html_tokenizer import HTMLTokenizer
+
+class Recorder(HTMLTokenizer):
+    def __init__(self):
+        super(Recorder, self).__init__()
+        self.events = []
+
+    def handle_data(self, data):
+        self.events.append(('data', data))
+
+    def handle_starttag(self, tag_name, attrs):
+        self.events.append(('start', tag_name, dict(attrs)))
+
+    def handle_startendtag(self, tag_name, attrs):
+        self.events.append(('startend', tag_name, dict(attrs)))
+
+    def handle_endtag(self, tag_name):
+        self.events.append(('end', tag_name))
+
+    def handle_comment(self, data):
+        self.events.append(('comment', data))
+
+    def handle_doctype(self, data):
+        self.events.append(('doctype', data))
+
+    def handle_cdata(self, data):
+        self.events.append(('cdata', data))
+
+HTML = '''<!DOCTYPE html>
+<div CLASS="a b" id='c' title=d>
+  some text &amp; more <br/>
+  <!-- a - comment -->
+  <script><![CDATA[<x>]]></script>
+</div>'''
+
+def test_feed_string_matches_feed():
+    by_char = Recorder()
+    for c in HTML:
+        by_char.feed(c)
+    by_string = Recorder()
+    assert by_string.feed_string(HTML) == len(HTML)
+    assert by_string.events == by_char.events
+    assert ('start', 'div', {'class': ['a b'], 'id': ['c'], 'title': ['d']}) \
+        in by_string.events
+
+def test_feed_string_stop():
+    tokenizer = Recorder()
+    consumed = tokenizer.feed_string('<b>x</b> rest', lambda: ('end', 'b') in tokenizer.events)
+    assert consumed == len('<b>x</b>')
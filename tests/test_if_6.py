@@ -0,0 +1,23 @@
+# coding: pyxl
+from pyxl import html
+
+def test():
+    def render(a, b):
+        return str(<frag>
+                       <if cond="{a}">
+                           <if cond="{b}">x</if>
+                           w
+                       </if>
+                       # comment
+
+                       <else>
+                           # comment
+                           y
+                       </else>
+                       <if cond="{b}">z</if>
+                       {1}
+                   </frag>)
+
+    assert render(True, True) == "xwz1"
+    assert render(True, False) == "w1"
+    assert render(False, True) == "yz1"
@@ -0,0 +1,24 @@
+# coding: pyxl
+from pyxl import html
+
+def test():
+    def render(a, b, items):
+        return <div>
+                   <if cond="{a}">
+                       <b>x</b>
+                       <frag>{items} y</frag>
+                   </if>
+                   <else>
+                       <if cond="{b}">z</if>
+                   </else>
+                   <if cond="{b}">{items[0], *items}</if>
+               </div>
+
+    assert str(render(True, True, [1, 2])) == "<div><b>x</b>12 y112</div>"
+    assert str(render(True, False, [1, 2])) == "<div><b>x</b>12 y</div>"
+    assert str(render(False, True, [1])) == "<div>z11</div>"
+    assert str(render(False, False, [1])) == "<div></div>"
+
+    # the children of <if> and <frag> are spliced into the <div>, without an x_frag
+    assert [type(child) for child in render(True, False, [1, 2]).children()] == [
+        html.x_b, int, int, str]
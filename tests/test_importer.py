@@ -0,0 +1,70 @@
+import os
+import sys
+
+from pyxl.codec import importer
+
+def _import(name):
+    try:
+        __import__(name)
+        return sys.modules[name]
+    finally:
+        for module in list(sys.modules):
+            if module == name or module.startswith(name + '.'):
+                del sys.modules[module]
+
+def test_import_hook(tmp_path, write_file):
+    pkg = tmp_path / 'pyxl_import_hook_pkg'
+    templates = pkg / 'templates'
+    templates.mkdir(parents=True)
+    write_file(str(pkg / '__init__.py'), '')
+    write_file(str(pkg / 'cookie.py'),
+           '# coding: pyxl\nfrom pyxl import html\nvalue = str(<b>{1 + 1}</b>)\n')
+    write_file(str(pkg / 'plain.py'), 'value = 1 < 2\n')
+    write_file(str(templates / '__init__.py'), '')
+    write_file(str(templates / 'nocookie.py'), 'from pyxl import html\nvalue = str(<i>x</i>)\n')
+
+    sys.path.insert(0, str(tmp_path))
+    finder = importer.install(prefixes=[str(templates)])
+    try:
+        cookie = _import('pyxl_import_hook_pkg.cookie')
+        assert cookie.value == '<b>2</b>'
+        assert isinstance(cookie.__loader__, importer.PyxlLoader)
+        assert cookie.__loader__.get_source(cookie.__name__).startswith('# coding: pyxl\n')
+
+        assert _import('pyxl_import_hook_pkg.templates.nocookie').value == '<i>x</i>'
+
+        plain = _import('pyxl_import_hook_pkg.plain')
+        assert not isinstance(plain.__loader__, importer.PyxlLoader)
+
+        # the second import is served from the bytecode cache
+        assert _import('pyxl_import_hook_pkg.cookie').value == '<b>2</b>'
+        loader = importer.PyxlLoader('x', str(pkg / 'cookie.py'))
+        if not sys.dont_write_bytecode:
+            assert os.path.exists(loader.cache_path(str(pkg / 'cookie.py')))
+        assert 'pyxl' in os.path.basename(loader.cache_path(str(pkg / 'cookie.py')))
+    finally:
+        importer.uninstall()
+        sys.path.remove(str(tmp_path))
+    assert finder not in sys.meta_path
+
+def test_plain_modules(tmp_path, monkeypatch, write_file):
+    write_file(str(tmp_path / 'pyxl_import_hook_plain.py'), 'value = 1 < 2\n')
+    reads = []
+    has_pyxl_cookie = importer.has_pyxl_cookie
+    monkeypatch.setattr(importer, 'has_pyxl_cookie',
+                        lambda path: reads.append(path) or has_pyxl_cookie(path))
+
+    sys.path.insert(0, str(tmp_path))
+    finder = importer.install()
+    try:
+        assert sys.meta_path.index(finder) + 1 == sys.meta_path.index(
+            importer.importlib.machinery.PathFinder)
+        # the spec of a plain module comes from this finder as is, without a second search
+        spec = finder.find_spec('pyxl_import_hook_plain')
+        assert not isinstance(spec.loader, importer.PyxlLoader)
+        assert _import('pyxl_import_hook_plain').value is True
+        assert _import('pyxl_import_hook_plain').value is True
+        assert len(reads) == 1
+    finally:
+        importer.uninstall()
+        sys.path.remove(str(tmp_path))
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from pyxl.codec import cache as cache_module
+from pyxl.codec.cache import TransformCache
+from pyxl.codec.parser import ParseError
+from pyxl.codec.transform import (
+    PyxlIncrementalDecoder, PyxlIncrementalDecoderInvertible, PyxlIncrementalEncoder,
+    pyxl_invert_string, pyxl_transform_string,
+)
+
+dir_path = os.path.dirname(os.path.abspath(__file__))
+
+SOURCE = '''# coding: pyxl
+from pyxl import html
+x = """
+y = <b>not pyxl</b>
+"""
+@decorator
+def f(a):
+    return <div>
+{a}
+</div>
+if x:
+    y = (
+z)
+else:
+    y = <p>é</p>
+z = [<i>{n}</i> for n in x]
+'''
+
+def _decode(decoder, data, size):
+    pieces = [decoder.decode(data[i:i + size]) for i in range(0, len(data), size)]
+    return pieces + [decoder.decode(b'', True)]
+
+def test_decode_in_pieces():
+    data = SOURCE.encode('utf-8')
+    for size in (1, 2, 7, 100):
+        pieces = _decode(PyxlIncrementalDecoder(), data, size)
+        assert ''.join(pieces) == pyxl_transform_string(SOURCE)
+        # statements come out before the end of the input
+        assert any(pieces[:-1])
+
+def test_test_files():
+    for file_name in sorted(os.listdir(dir_path)):
+        if not file_name.endswith('.py'):
+            continue
+        with open(os.path.join(dir_path, file_name), 'rb') as f:
+            data = f.read()
+        invertible = pyxl_transform_string(data.decode('utf-8'), invertible=True)
+        assert ''.join(_decode(PyxlIncrementalDecoderInvertible(), data, 13)) == invertible
+
+        encoder = PyxlIncrementalEncoder()
+        pieces = [encoder.encode(invertible[i:i + 13]) for i in range(0, len(invertible), 13)]
+        pieces.append(encoder.encode('', True))
+        assert b''.join(pieces) == pyxl_invert_string(invertible).encode('utf-8'), file_name
+
+def test_state():
+    decoder = PyxlIncrementalDecoder()
+    data = SOURCE.encode('utf-8')
+    output = decoder.decode(data[:200])
+    state = decoder.getstate()
+    decoder.reset()
+    decoder.setstate(state)
+    assert output + decoder.decode(data[200:], True) == pyxl_transform_string(SOURCE)
+
+def test_encoder_state():
+    invertible = pyxl_transform_string(SOURCE, invertible=True)
+    encoder = PyxlIncrementalEncoder()
+    output = encoder.encode(invertible[:200])
+    state = encoder.getstate()
+    assert isinstance(state, int) and state != 0
+    encoder.reset()
+    assert encoder.getstate() == 0
+    encoder.setstate(state)
+    output += encoder.encode(invertible[200:], True)
+    assert output == pyxl_invert_string(invertible).encode('utf-8')
+
+def test_chunks_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, '_default_cache', TransformCache(str(tmp_path)))
+    monkeypatch.setattr(cache_module, '_default_cache_loaded', True)
+    decoder = PyxlIncrementalDecoder()
+    data = SOURCE.encode('utf-8')
+    decoder.decode(data[:200])
+    decoder.decode(data[200:], True)
+    assert not [name for _, _, names in os.walk(str(tmp_path)) for name in names]
+
+def test_error_position():
+    decoder = PyxlIncrementalDecoder()
+    decoder.decode(b'x = 1\ny = 2\nz = <div>\n')
+    with pytest.raises(ParseError) as excinfo:
+        decoder.decode(b'<b></div>\n', True)
+    assert 'line 4' in str(excinfo.value)
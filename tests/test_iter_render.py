@@ -0,0 +1,30 @@
+# coding: pyxl
+from pyxl import html
+from pyxl.element import x_element
+
+class x_row(x_element):
+    def render(self):
+        return <tr><td>{self.attr('id')}</td><td>&amp; {'<x>'}</td></tr>
+
+class x_custom(html.x_div):
+    def _to_list(self, l):
+        l.append('custom')
+
+def test_iter_render():
+    table = (
+        <table>
+            {[<row id="{i}" /> for i in range(100)]}
+            <custom />
+            {html.rawhtml('<br>')}
+            <frag>{None}text</frag>
+        </table>
+    )
+    expected = table.to_string()
+    assert ''.join(table.iter_render()) == expected
+
+    chunks = list(table.iter_render(chunk_size=100))
+    assert ''.join(chunks) == expected
+    assert len(chunks) > 10
+    assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+
+    assert list(<div />.iter_render()) == ['<div></div>']
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from pyxl.codec.parser import ParseError
+from pyxl.codec.transform import (
+    add_profile_hook, pyxl_invert_string, pyxl_transform_string, remove_profile_hook,
+)
+
+SOURCE = '''# coding: pyxl
+from pyxl import html
+def f(x):
+    return <div class="{x}">
+               <if cond="{x}">{x + 1}</if>
+               <else>{[<b>{y}</b> for y in x]}</else>
+           </div>
+'''
+
+def _profile(func, *args, **kwargs):
+    profiles = []
+    add_profile_hook(profiles.append)
+    try:
+        return func(*args, **kwargs), profiles
+    finally:
+        remove_profile_hook(profiles.append)
+
+def test_profile_transform():
+    output, profiles = _profile(pyxl_transform_string, SOURCE, filename='f.py')
+    assert output == pyxl_transform_string(SOURCE)
+    [profile] = profiles
+    assert profile.filename == 'f.py' and profile.mode == 'transform'
+    assert profile.counters['pyxl_blocks'] == 2
+    assert profile.counters['python_regions'] == 5
+    assert profile.counters['rewinds'] > 0 and profile.counters['tokens'] > 0
+    assert set(profile.timers) == {
+        'prescan', 'tokenize', 'retokenize', 'parse', 'transform', 'untokenize'}
+    # the two lines before the def are copied without being tokenized
+    assert profile.counters['skipped_lines'] == 2
+    assert sum(profile.timers.values()) == pytest.approx(profile.total, rel=0.2)
+    assert 'pyxl transform of f.py' in profile.report()
+
+def test_profile_invert():
+    invertible = pyxl_transform_string(SOURCE, invertible=True)
+    output, profiles = _profile(pyxl_invert_string, invertible)
+    assert output == SOURCE
+    [profile] = profiles
+    # the nested <b> appears both in the compiled code and in the fragments of the outer block
+    assert profile.mode == 'invert' and profile.counters['pyxl_blocks'] == 3
+    assert 'fix_indent' in profile.timers
+
+def test_profile_error():
+    _, profiles = _profile(pytest.raises, ParseError, pyxl_transform_string, 'x = <div></p>\n')
+    [profile] = profiles
+    assert profile.error.startswith('ParseError')
+
+def test_profile_environment(tmp_path, monkeypatch):
+    path = str(tmp_path / 'profile.jsonl')
+    monkeypatch.setenv('PYXL_PROFILE', path)
+    pyxl_transform_string(SOURCE, filename='f.py')
+    pyxl_transform_string(SOURCE, filename='g.py')
+    with open(path) as f:
+        reports = [json.loads(line) for line in f]
+    assert [report['filename'] for report in reports] == ['f.py', 'g.py']
+    assert reports[0]['counters']['pyxl_blocks'] == 2
+
+def test_profile_environment_off(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PYXL_PROFILE', '0')
+    pyxl_transform_string(SOURCE)
+    assert os.listdir(str(tmp_path)) == []
+
+def test_profile_write_error(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('PYXL_PROFILE', str(tmp_path / 'missing' / 'profile.jsonl'))
+    with pytest.raises(ParseError):
+        pyxl_transform_string('x = <div></p>\n')
+    assert 'could not write the profile' in capsys.readouterr().err
+
+def test_raising_hook(capsys):
+    def broken(profile):
+        raise ValueError('broken hook')
+    profiles = []
+    add_profile_hook(broken)
+    add_profile_hook(profiles.append)
+    try:
+        assert pyxl_transform_string(SOURCE) == pyxl_transform_string(SOURCE)
+        with pytest.raises(ParseError):
+            pyxl_transform_string('x = <div></p>\n')
+    finally:
+        remove_profile_hook(broken)
+        remove_profile_hook(profiles.append)
+    assert len(profiles) == 3
+    assert capsys.readouterr().err.count('broken hook') == 3
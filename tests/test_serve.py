@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from pyxl.codec.transform import pyxl_invert_string, pyxl_transform_string
+from pyxl.scripts import serve
+
+SOURCE = 'x = <div class="a">{y}</div>\n'
+
+def _request(server, **request):
+    return json.loads(server.handle_line(json.dumps(request)))
+
+def test_methods():
+    server = serve.TransformServer()
+    response = _request(server, id=1, method='transform', text=SOURCE)
+    assert response == {'id': 1, 'result': {'output': pyxl_transform_string(SOURCE)}}
+
+    invertible = _request(server, id=2, method='transform', text=SOURCE,
+                          invertible=True)['result']['output']
+    assert invertible == pyxl_transform_string(SOURCE, invertible=True)
+    response = _request(server, id=3, method='invert', text=invertible)
+    assert response['result']['output'] == pyxl_invert_string(invertible)
+
+    response = _request(server, id=4, method='diagnostics', text=SOURCE)
+    assert response == {'id': 4, 'result': {'diagnostics': []}}
+
+def test_errors():
+    server = serve.TransformServer()
+    response = _request(server, id=1, method='transform', text='x = <div>\n<b></i>\n</div>\n')
+    assert response['error']['line'] == 2 and '</i>' in response['error']['message']
+
+    diagnostics = _request(server, method='diagnostics',
+                           text='x = <div>\n  <b foo="1" />\n</div>\n',
+                           trusted=True)['result']['diagnostics']
+    assert [(d['line'], d['column']) for d in diagnostics] == [(2, 15)]
+    diagnostics = _request(server, method='diagnostics',
+                           text='x = <div>\n<b/></div>\ny = 1 +\n')['result']['diagnostics']
+    assert [(d['line'], d['column']) for d in diagnostics] == [(3, 7)]
+    diagnostics = _request(server, method='diagnostics',
+                           text='x = <div>{1 +}</div>\n')['result']['diagnostics']
+    assert [(d['line'], d['column']) for d in diagnostics] == [(1, None)]
+
+    assert 'invalid JSON' in json.loads(server.handle_line('{'))['error']['message']
+    assert 'unknown method' in _request(server, id=5, method='run')['error']['message']
+    response = _request(server, id=6, method='transform', buffer='a', version=1)
+    assert 'needs the text' in response['error']['message']
+
+def test_malformed_requests(monkeypatch):
+    server = serve.TransformServer()
+    for bad in ({'buffer': ['a']}, {'buffer': 'a', 'version': {'v': 1}},
+                {'buffer': 'a', 'version': True}):
+        response = _request(server, id=1, method='transform', text=SOURCE, **bad)
+        assert 'must be a string' in response['error']['message']
+    assert 'must be a string' in _request(server, method='close', buffer=[1])['error']['message']
+
+    def broken(*args):
+        raise TypeError('broken')
+    monkeypatch.setattr(server, '_diagnostics', broken)
+    response = _request(server, id=2, method='diagnostics', text=SOURCE)
+    assert response['id'] == 2 and 'internal error' in response['error']['message']
+
+def test_version_cache(monkeypatch):
+    server = serve.TransformServer()
+    calls = []
+    transform = serve._transform_string_quietly
+    def counted(*args):
+        calls.append(args[0])
+        return transform(*args)
+    monkeypatch.setattr(serve, '_transform_string_quietly', counted)
+
+    first = _request(server, method='transform', buffer='a.py', version=1, text=SOURCE)
+    assert _request(server, method='transform', buffer='a.py', version=1, text=SOURCE) == first
+    assert _request(server, method='transform', buffer='a.py', version=1) == first
+    assert len(calls) == 1
+
+    # other options, versions and buffers are transformed again
+    _request(server, method='transform', buffer='a.py', version=1, text=SOURCE, invertible=True)
+    _request(server, method='transform', buffer='b.py', version=1, text=SOURCE)
+    _request(server, method='transform', buffer='a.py', version=2, text='x = 1\n')
+    assert len(calls) == 4
+    assert 'error' in _request(server, method='transform', buffer='a.py', version=1)
+
+    _request(server, method='close', buffer='a.py')
+    assert 'error' in _request(server, method='transform', buffer='a.py', version=2)
+    assert 'result' in _request(server, method='transform', buffer='b.py', version=1)
+
+def test_serve_stream():
+    requests = [json.dumps({'id': i, 'method': 'transform', 'text': 'x = %d\n' % i})
+                for i in range(3)]
+    outfile = io.StringIO()
+    serve.serve_stream(serve.TransformServer(), io.StringIO('\n'.join(requests + [''])), outfile)
+    responses = [json.loads(line) for line in outfile.getvalue().splitlines()]
+    assert [r['id'] for r in responses] == [0, 1, 2]
+    assert responses[2]['result']['output'] == 'x = 2\n'
+
+def test_serve_socket(tmp_path):
+    path = str(tmp_path / 'pyxl.sock')
+    thread = threading.Thread(target=serve.serve_socket, args=(serve.TransformServer(), path))
+    thread.daemon = True
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    with client, client.makefile('rw') as f:
+        f.write(json.dumps({'id': 'a', 'method': 'transform', 'text': SOURCE}) + '\n')
+        f.flush()
+        response = json.loads(f.readline())
+    assert response == {'id': 'a', 'result': {'output': pyxl_transform_string(SOURCE)}}
+
+def test_serve_socket_keeps_other_files(tmp_path):
+    path = tmp_path / 'not-a-socket'
+    path.write_text('data')
+    with pytest.raises(ValueError):
+        serve.serve_socket(serve.TransformServer(), str(path))
+    assert path.read_text() == 'data'
@@ -0,0 +1,37 @@
+from pyxl import html
+from pyxl.codec.transform import pyxl_transform_string
+
+def _eval(source, static_html, **env):
+    code = pyxl_transform_string(source, static_html=static_html)
+    return eval(code, dict(env, html=html))
+
+def _check(source, **env):
+    assert str(_eval(source, False, **env)) == str(_eval(source, True, **env))
+
+def test_same_output():
+    _check('<div class="a"><span>hi &amp; "there"</span><br /></div>')
+    _check('<div><p id="x">\n  one <b>two</b>\n</p><!-- c --><ul><li>{n}</li><li>b</li></ul></div>', n=1)
+    _check('<div><if cond="{n}"><b>x</b><i>y</i></if><else>no</else></div>', n=0)
+    _check('<frag><div>&</div><div>{"&"}</div></frag>')
+
+def test_static_subtrees():
+    source = '<div><p class="a">\n<b>x</b>\n</p><p>{n}</p></div>'
+    code = pyxl_transform_string(source, static_html=True)
+    assert code.count('static_rawhtml') == 1
+    assert code.count('\n') == pyxl_transform_string(source).count('\n')
+    assert 'x_div' in code
+
+def test_dynamic_not_static():
+    code = pyxl_transform_string('<div><p class="{n}">x</p><foo><b>x</b></foo></div>', static_html=True)
+    assert 'x_p' in code
+    assert 'x_foo' in code
+    assert "static_rawhtml('<b>x</b>')" in code
+
+def test_root_not_static():
+    div = _eval('<div><span>x</span></div>', True)
+    div.add_class('foo')
+    assert str(div) == '<div class="foo"><span>x</span></div>'
+
+def test_invalid_attr_left_alone():
+    code = pyxl_transform_string('<div><span foo="x">y</span></div>', static_html=True)
+    assert 'static_rawhtml' not in code
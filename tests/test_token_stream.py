@@ -0,0 +1,66 @@
+import io
+
+from pyxl.codec import pytokenize
+from pyxl.codec.tokenizer import RewindableTokenStream, scan_python
+from pyxl.codec.transform import pyxl_transform_string
+
+def test_restart():
+    source = 'x = 1 + y\nz = 2\n'
+    tokens = pytokenize.generate_tokens(io.StringIO(source).readline)
+    assert [next(tokens)[1] for _ in range(4)] == ['x', '=', '1', '+']
+    # restart in the middle of the first line, as if it was a new file starting there
+    assert tokens.throw(pytokenize.Restart(1, 3))[:4] == (pytokenize.INDENT, ' ', (1, 3), (1, 4))
+    assert [token[1] for token in tokens] == [
+        '1', '+', 'y', '\n', '', 'z', '=', '2', '\n', '']
+
+def test_rewind():
+    stream = RewindableTokenStream(io.StringIO('a = "x{y}"\nb\n').readline)
+    assert [next(stream).value for _ in range(3)] == ['a', '=', '"x{y}"']
+    stream.rewind_and_retokenize(('STRING', 'y}"', (1, 7), (1, 10), ''))
+    assert [(token.value, token.start) for token in stream][:3] == [
+        ('y', (1, 7)), ('}', (1, 8)), ('"', (1, 9))]
+
+def test_inline_tags_linear():
+    # each of these tags rewinds the token stream in the middle of the line
+    source = '# coding: pyxl\nx = <div>%s</div>\n' % ('<b>{a}</b>' * 2000)
+    assert pyxl_transform_string(source).count('html.x_b._new({}, (a , ))') == 2000
+
+def test_multiline_token_keeps_lines():
+    source = "x = <div>'''a\n\nb'''</div>\ny = 1\n"
+    assert pyxl_transform_string(source).count('\n') == source.count('\n')
+
+def test_modern_tokens():
+    source = 'if (n := 1_000) -> f"{n}" ... rb"x" .5\n'
+    tokens = pytokenize.generate_tokens(io.StringIO(source).readline)
+    assert [(pytokenize.tok_name[token[0]], token[1]) for token in tokens][:11] == [
+        ('NAME', 'if'), ('OP', '('), ('NAME', 'n'), ('OP', ':='), ('NUMBER', '1_000'),
+        ('OP', ')'), ('OP', '->'), ('STRING', 'f"{n}"'), ('OP', '...'), ('STRING', 'rb"x"'),
+        ('NUMBER', '.5')]
+
+def test_error_tokens():
+    # pyxl relies on characters that aren't python being error tokens, whitespace included
+    tokens = pytokenize.generate_tokens(io.StringIO('a $ ?\n').readline)
+    assert [token[1] for token in tokens if token[0] == pytokenize.ERRORTOKEN] == [
+        ' ', '$', ' ', '?']
+
+def test_walrus_tag():
+    source = '# coding: pyxl\nif (x := <div />):\n    pass\n'
+    assert 'html.x_div._new({}, ())' in pyxl_transform_string(source)
+
+def test_scan_python():
+    source = 'a = "<b>"  # <i>\nb = (1,\n     2)\nif a < b:\n    c = <i />\n'
+    # stops before the if, whose line ends with a ':'
+    assert scan_python(source, 0, True) == source.index('if')
+    assert scan_python(source, source.index('if'), False) == source.index('if')
+    assert scan_python('x = 1\n<div />\n', 0, True) == len('x = 1\n<div />\n')
+    assert scan_python('x = 1\nreturn\n<div />\n', 0, True) == len('x = 1\n')
+    assert scan_python('x = 1 if y else 2\n', 0, True) == len('x = 1 if y else 2\n')
+    assert scan_python('x = """\n<div />\n"""\ny = 1\n', 0, False) == 26
+    assert scan_python('x = "\ny = 1\n', 0, False) == 0
+
+def test_python_copied_as_is():
+    source = '# coding: pyxl\nimport os\t# tab\nx = [1,\n\t2]  \n'
+    assert pyxl_transform_string(source) == source
+
+    source = 'x = 1  \ny = <b>{x}</b>  \nz = 2  \n'
+    assert pyxl_transform_string(source) == 'x = 1  \ny = html.x_b._new({}, (x , ))\nz = 2  \n'
@@ -0,0 +1,59 @@
+import os
+
+from pyxl.codec.cache import TransformCache
+from pyxl.codec.transform import pyxl_transform_string, pyxl_transform_string_cached
+
+SOURCE = 'x = <div class="a">{y}</div>\n'
+
+def test_cache_hit(tmp_path):
+    cache = TransformCache(str(tmp_path))
+    output = pyxl_transform_string_cached(SOURCE, cache=cache)
+    assert output == pyxl_transform_string(SOURCE)
+
+    key = cache.key(SOURCE)
+    assert cache.get(key) == output
+    # A hit doesn't run the transform: make the stored entry distinguishable to prove it.
+    cache.put(key, 'cached')
+    assert pyxl_transform_string_cached(SOURCE, cache=cache) == 'cached'
+
+def test_key_includes_options(tmp_path):
+    cache = TransformCache(str(tmp_path))
+    keys = {
+        cache.key(SOURCE),
+        cache.key(SOURCE, invertible=True),
+        cache.key(SOURCE, str_function='unicode'),
+        cache.key(SOURCE, static_html=True),
+        cache.key(SOURCE + ' '),
+    }
+    assert len(keys) == 5
+
+def test_eviction(tmp_path):
+    cache = TransformCache(str(tmp_path), max_size=1000)
+    keys = [cache.key(str(i)) for i in range(20)]
+    for i, key in enumerate(keys):
+        cache.put(key, 'x' * 100)
+        os.utime(cache._path(key), (i, i))
+
+    assert cache.size <= 1000
+    assert cache.get(keys[-1]) is not None
+    assert cache.get(keys[0]) is None
+    assert not [name for _, _, names in os.walk(str(tmp_path)) for name in names
+                if name.endswith('.tmp')]
+
+def test_overwrite_size(tmp_path):
+    cache = TransformCache(str(tmp_path))
+    key = cache.key(SOURCE)
+    cache.put(key, 'x' * 100)
+    for _ in range(3):
+        cache.put(key, 'y' * 100)
+    assert cache.size == 100
+
+def test_read_only_hit(tmp_path, monkeypatch):
+    cache = TransformCache(str(tmp_path))
+    key = cache.key(SOURCE)
+    cache.put(key, 'cached')
+
+    def utime(*args):
+        raise PermissionError(args)
+    monkeypatch.setattr(os, 'utime', utime)
+    assert cache.get(key) == 'cached'
@@ -0,0 +1,55 @@
+import os
+
+from pyxl.codec.tokenizer import PyxlParseError
+from pyxl.codec.transform import pyxl_transform_string, strip_cookie, transform_many
+from pyxl.scripts.transform import main
+
+GOOD = '# coding: pyxl\nx = <div>{y}</div>\n'
+BAD = '# coding: pyxl\nx = <div>\n'
+
+def test_transform_many(tmp_path, write_file):
+    src = tmp_path / 'src'
+    (src / 'pkg').mkdir(parents=True)
+    write_file(str(src / 'pkg' / 'good.py'), GOOD)
+    write_file(str(src / 'bad.py'), BAD)
+
+    inputs = [str(src / 'pkg' / 'good.py'), 'z = <b />\n', src / 'bad.py', str(tmp_path / 'no.py')]
+    for workers in (1, 2):
+        out = tmp_path / ('out%d' % workers)
+        results = transform_many(inputs, workers, out_dir=str(out), root=str(src))
+        assert [result.path for result in results] == [
+            inputs[0], None, str(inputs[2]), inputs[3]]
+        assert results[0].output == pyxl_transform_string(GOOD)
+        assert results[1].output == pyxl_transform_string('z = <b />\n')
+        assert isinstance(results[2].error, PyxlParseError) and results[2].output is None
+        assert isinstance(results[3].error, ValueError)  # not under root
+        with open(str(out / 'pkg' / 'good.py')) as f:
+            assert f.read() == strip_cookie(results[0].output)
+        assert not os.path.exists(str(out / 'bad.py'))
+
+def test_main_in_place(tmp_path, capsys, write_file):
+    write_file(str(tmp_path / 'good.py'), GOOD)
+    write_file(str(tmp_path / 'plain.py'), 'x = 1\n')
+    write_file(str(tmp_path / 'bad.py'), BAD)
+
+    assert main(['-j', '2', '--in-place', str(tmp_path)]) == 1
+    with open(str(tmp_path / 'good.py')) as f:
+        assert f.read() == strip_cookie(pyxl_transform_string(GOOD))
+    with open(str(tmp_path / 'bad.py')) as f:
+        assert f.read() == BAD
+    err = capsys.readouterr().err
+    assert 'bad.py: Unclosed Tags' in err and '1 transformed, 1 failed' in err
+
+def test_outputs_are_plain_python(tmp_path, write_file):
+    write_file(str(tmp_path / 'good.py'), GOOD)
+    transform_many([str(tmp_path / 'good.py')], out_dir=str(tmp_path / 'out'), root=str(tmp_path))
+    with open(str(tmp_path / 'out' / 'good.py'), 'rb') as f:
+        output = f.read()
+    assert not output.startswith(b'# coding')
+    compile(output, 'good.py', 'exec')
+
+def test_unreadable(tmp_path):
+    results = transform_many([str(tmp_path / 'missing.py'), 'x = <b />'], root=str(tmp_path))
+    for result in results:
+        assert isinstance(result.error, FileNotFoundError)
+    assert 'only taken as source if it contains a newline' in str(results[1].error)
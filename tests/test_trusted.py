@@ -0,0 +1,32 @@
+import pytest
+
+from pyxl.codec.parser import ParseError
+from pyxl.codec.transform import pyxl_transform_string
+
+def _eval(source, trusted=True):
+    namespace = {'t': 'title'}
+    exec(pyxl_transform_string('from pyxl import html\nv = ' + source, trusted=trusted), namespace)
+    return namespace['v']
+
+def test_literal_attributes():
+    source = '<a class="x  y" tabindex="3" title="{t}" data-n="{2}" href="/">x</a>'
+    output = pyxl_transform_string(source, trusted=True)
+    assert "'tabindex': 3," in output
+    assert output.endswith("('title', 'data-n'))")
+
+    trusted = _eval(source)
+    assert trusted.attributes() == _eval(source, trusted=False).attributes()
+    assert str(trusted) == '<a class="x  y" tabindex="3" title="title" data-n="2" href="/">x</a>'
+
+def test_dynamic_attributes_are_validated():
+    with pytest.raises(Exception):
+        _eval('<div tabindex="{\'x\'}" />')
+
+def test_errors():
+    with pytest.raises(ParseError) as excinfo:
+        pyxl_transform_string('x = <div>\n  <b foo="1" />\n</div>\n', trusted=True)
+    assert 'has no attr named "foo" at line 2' in str(excinfo.value)
+
+    with pytest.raises(ParseError) as excinfo:
+        pyxl_transform_string('x = <span tabindex="two" />\n', trusted=True)
+    assert 'incorrect type for "tabindex"' in str(excinfo.value)